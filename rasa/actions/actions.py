@@ -5,19 +5,138 @@
 # https://rasa.com/docs/rasa/custom-actions
 
 
-from typing import Any, Text, Dict, List
+from typing import Any, Optional, Text, Dict, List
+import asyncio
 import json
+import logging
+import time
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
 import requests
-from thefuzz import fuzz
+
+from metrics import REGISTRY, log_sampled
+
+from . import settings
+from .backend import BackendError, backend
+from .cursor import result_store
+from .prefetch import prefetcher
+from .provider import catalog_provider
+from .ranking import RankedResults, rank
+from .search import COLOR_CATEGORY_IDS, search_terms_for
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FILTER_SECONDS = REGISTRY.histogram(
+    "closet_search_filter_seconds", "Time to filter the catalog by item_type and color"
+)
+SEARCH_MATCH_SECONDS = REGISTRY.histogram(
+    "closet_search_match_seconds", "Time to fuzzy match item_name against the filtered posts"
+)
+SEARCH_RANK_SECONDS = REGISTRY.histogram(
+    "closet_search_rank_seconds", "Time to score the matches and pick the best ones"
+)
+SEARCH_RESULTS = REGISTRY.counter("closet_searches", "Searches run by action_find_item", ["result"])
+CURSOR_REBUILDS = REGISTRY.counter(
+    "closet_cursor_rebuilds", "Result cursors rebuilt from the search slots by a worker that didn't have them"
+)
+BOOKING_SECONDS = REGISTRY.histogram(
+    "closet_booking_seconds", "Backend round trips of action_book_item, from cart lookup to total", ["outcome"]
+)
+
+
+def _user_email(tracker: Tracker) -> Optional[Text]:
+    metadata = tracker.latest_message.get("metadata", {})
+    return metadata.get("user_email") or tracker.get_slot("email")
+
+
+async def _cart_id(email: Text) -> Any:
+    return (await backend.get("/api/profile/cart/id", params={"email": email})).get("transactionId")
+
+
+async def _create_cart(email: Text) -> Any:
+    tx_data = await backend.post("/api/profile/cart/create", json={"email": email}, idempotent=True)
+    return tx_data.get("transactionId")
+
+
+async def _add_to_cart(transaction_id: Any, post_id: Any, email: Text) -> Dict[Text, Any]:
+    """Add post_id to the cart, fetching the cart (for the total) meanwhile."""
+    add_payload = {"transactionId": transaction_id, "postId": post_id}
+    _, cart_data = await asyncio.gather(
+        backend.put("/api/profile/cart/addItem", json=add_payload),
+        backend.get("/api/profile/cart", params={"email": email}),
+    )
+    return cart_data
+
+
+def _color_ids(colors: Any) -> Optional[List[int]]:
+    # the color slot holds category ids (as strings) once a search has run,
+    # or the color names the NLU filled it with
+    if not colors:
+        return None
+    if not isinstance(colors, list):
+        colors = [colors]
+    color_ids = []
+    for c in colors:
+        if c in COLOR_CATEGORY_IDS:
+            color_ids.append(COLOR_CATEGORY_IDS[c])
+        elif str(c).isdigit():
+            color_ids.append(int(c))
+    return color_ids or None
+
+
+async def _ranked_search(item_type: Optional[Text], color_ids: Optional[List[int]],
+                         item_name: Optional[Text]) -> RankedResults:
+    """Every post matching item_type, color_ids and item_name, ranked."""
+    # Get all synonyms for the item_type
+    search_terms = search_terms_for(item_type)
+    
+    # Narrow down by item_type and color (search index or SQL); only
+    # these candidates are checked against item_name
+    with SEARCH_FILTER_SECONDS.time():
+        candidate_ids = await catalog_provider.filter(search_terms, color_ids)
+    
+    # Check if item_name matches (substring, or fuzzy above the threshold)
+    name_scores = None
+    if item_name:
+        with SEARCH_MATCH_SECONDS.time():
+            name_scores = await catalog_provider.match_name(item_name, candidate_ids)
+        candidate_ids = [post_id for post_id in candidate_ids if post_id in name_scores]
+    
+    with SEARCH_RANK_SECONDS.time():
+        features = await catalog_provider.features(candidate_ids)
+        return rank(candidate_ids, features, item_type, search_terms, color_ids, name_scores)
+
+
+def _prefetch_next_turn(tracker: Tracker, cursor: Any, next_index: int) -> None:
+    # While the user reads the item just shown, start loading what "next"
+    # (the next page of results, if it isn't loaded) and "book" (the cart id)
+    # will need
+    if cursor.item(next_index) is None and next_index < len(cursor):
+        prefetcher.schedule(
+            tracker.sender_id, "item", (cursor.cursor_id, next_index),
+            lambda: cursor.load(next_index, catalog_provider.posts, settings.SEARCH_TOP_K),
+        )
+    email = _user_email(tracker)
+    if email:
+        prefetcher.schedule(tracker.sender_id, "cart_id", email, lambda: _cart_id(email))
+
+
+def _legacy_item_ids(filtered_items: Text) -> Optional[List[Any]]:
+    # Conversations from before result cursors may still hold a JSON list of
+    # post_ids in the slot
+    try:
+        item_ids = json.loads(filtered_items)
+    except ValueError:
+        return None
+    return item_ids if isinstance(item_ids, list) else None
+
 
 class ActionFindItem(Action):
     def name(self) -> Text:
         return "action_find_item"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
 
@@ -31,7 +150,7 @@ class ActionFindItem(Action):
         color_list = entity_values.get("color")
         item_name = entity_values.get("item_name")
         
-        print(f"DEBUG: Fresh search - entities from message: {entity_values}")
+        log_sampled(logger, logging.DEBUG, "Fresh search - entities from message: %s", entity_values)
         
         # Normalize color_list: ensure it's a list or None
         if color_list is None or (isinstance(color_list, list) and len(color_list) == 0):
@@ -46,110 +165,37 @@ class ActionFindItem(Action):
             return []
 
         try:
-            # Query your backend API - gets posts with images and lister info
-            response = requests.get("http://localhost:8800/api/posts-all", timeout=5)
-            data = response.json()
-            posts = data.get("posts", [])
+            # Posts with images and lister info, from the configured catalog provider
+            total_posts = await catalog_provider.count()
             
-            # Debug: print what we got
-            print(f"DEBUG: item_type={item_type}, color_list={color_list}, item_name={item_name}, total posts={len(posts)}")
+            log_sampled(
+                logger, logging.DEBUG, "item_type=%s, color_list=%s, item_name=%s, total posts=%d",
+                item_type, color_list, item_name, total_posts,
+            )
             
             # If no posts at all, show message
-            if not posts:
+            if not total_posts:
                 dispatcher.utter_message(text="Sorry, there are no items in the database yet. Check back later!")
                 return []
             
-            # Filter posts based on item_type and color
-            items = []
-            
-            # Define related terms for item types (for better matching)
-            item_type_synonyms = {
-                "shoes": ["shoes", "sneakers", "boots", "heels", "sandals", "loafers", "cleats", "footwear", "pumps"],
-                "shirt": ["shirt", "top", "tee", "t-shirt", "blouse", "button up"],
-                "pants": ["pants", "trousers", "slacks", "chinos", "leggings", "jeans"],
-                "jacket": ["jacket", "blazer", "coat", "cardigan", "sweater", "hoodie", "puffer"],
-                "dress": ["dress", "gown", "frock", "sundress"],
-                "skirt": ["skirt", "miniskirt"],
-                "shorts": ["shorts"],
-                "jeans": ["jeans", "denim"],
-            }
-            
-            # Map color names to category IDs from database
-            color_category_ids = {
-                "black": 10,
-                "white": 11,
-                "red": 12,
-                "blue": 13,
-                "green": 14,
-                "pink": 15,
-            }
-            
             # preprocessing colors to category IDs
          
             if color_list:
                 mapped_colors = []
                 for c in color_list:
-                    if c in color_category_ids:
-                        mapped_colors.append(str(color_category_ids[c]))
+                    if c in COLOR_CATEGORY_IDS:
+                        mapped_colors.append(str(COLOR_CATEGORY_IDS[c]))
                 color_list = mapped_colors if mapped_colors else None
-            print(f"DEBUG: Mapped color_list to category IDs: {color_list}")
+            log_sampled(logger, logging.DEBUG, "Mapped color_list to category IDs: %s", color_list)
             
-            # Get all synonyms for the item_type
-            search_terms = [item_type.lower()] if item_type else []
-            if item_type:
-                for key, synonyms in item_type_synonyms.items():
-                    if item_type.lower() in synonyms or item_type.lower() == key:
-                        search_terms = synonyms
-                        break
+            # Rank the matches and load only the best ones; the rest stay
+            # ranked in the cursor until the user pages that far
+            color_ids = [int(c) for c in color_list] if color_list else None
+            ranked = await _ranked_search(item_type, color_ids, item_name)
+            log_sampled(logger, logging.DEBUG, "Found %d matching items", len(ranked))
+            items = await catalog_provider.posts(ranked.take(settings.SEARCH_TOP_K))
             
-            for post in posts:
-                title = post.get("title", "").lower()
-                description = post.get("description", "").lower()
-                post_categories = post.get("categories", [])
-                
-                # Check if any item_type synonym matches title
-                type_match = not item_type or any(term in title for term in search_terms)
-                
-                # Check if color matches using CATEGORY IDs (same as website filtering)
-                color_category_ids_list = list(color_category_ids.values())  # [10, 11, 12, 13, 14, 15]
-                item_has_color_category = any(cat_id in post_categories for cat_id in color_category_ids_list)
-                
-                # Default to True (match all) if no color filter
-                color_match = True
-                if color_list:
-                    color_match = False  # Must match at least one color
-                    for c in color_list:
-                        try:
-                            color_id = int(c)
-                            if color_id in post_categories:
-                                color_match = True
-                                print(f"DEBUG: Color match! Post '{title}' has category {color_id}")
-                                break
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # DEBUG: Log why items don't match
-                    if not color_match:
-                        print(f"DEBUG: No color match for '{title}' - post_categories={post_categories}, looking for {color_list}")
-                
-                # Check if item_name matches (fuzzy or substring based)
-                # Use lower threshold for fuzzy matching, or simple substring match
-                if item_name:
-                    item_name_lower = item_name.lower()
-                    # First try direct substring match
-                    direct_match = item_name_lower in title or item_name_lower in description
-                    # Then try fuzzy match with lower threshold
-                    fuzzy_score_title = fuzz.partial_ratio(item_name_lower, title)
-                    fuzzy_score_desc = fuzz.partial_ratio(item_name_lower, description)
-                    name_match = direct_match or fuzzy_score_title > 60 or fuzzy_score_desc > 60
-                    print(f"DEBUG: Checking '{item_name}' against '{title}' - direct={direct_match}, fuzzy_title={fuzzy_score_title}, fuzzy_desc={fuzzy_score_desc}")
-                else:
-                    name_match = True
-                
-                if type_match and color_match and name_match:
-                    items.append(post)
-            
-            print(f"DEBUG: Found {len(items)} matching items")
+            SEARCH_RESULTS.inc(result="found" if items else "empty")
             
             if items:
                 first_item = items[0]
@@ -158,11 +204,14 @@ class ActionFindItem(Action):
                     text=f"Found: {first_item.get('title', 'Unknown')} - {first_item.get('description', 'No description')} (${first_item.get('price', 'N/A')}). Would you like to book this item?",
                     image=image_url
                 )
-                # Store the filtered items as JSON string and current index
-                import json
+                # Keep the matched items server-side; the slot only holds the cursor id
+                result_store.discard(tracker.get_slot("filtered_items"))
+                prefetcher.cancel(tracker.sender_id, "item")
+                cursor = result_store.create(tracker.sender_id, items, ranked)
+                _prefetch_next_turn(tracker, cursor, 1)
                 return [
                     SlotSet("selected_post_id", first_item.get("post_id")),
-                    SlotSet("filtered_items", json.dumps([p.get("post_id") for p in items])),
+                    SlotSet("filtered_items", cursor.cursor_id),
                     SlotSet("current_item_index", 0),
                     # Set search slots to current values (clearing old ones)
                     SlotSet("item_type", item_type),
@@ -171,7 +220,7 @@ class ActionFindItem(Action):
                 ]
             else:
                 # Show what's available instead
-                sample_titles = [p.get("title", "Unknown") for p in posts[:3]]
+                sample_titles = [p.get("title", "Unknown") for p in await catalog_provider.sample(3)]
                 color_str = ", ".join(str(c) for c in color_list) if color_list else ""
                 dispatcher.utter_message(text=f"Sorry, I couldn't find any{item_type or 'items'} in that color. We have items like: {', '.join(sample_titles)}. Try searching for something else!")
                 # Clear all search slots for fresh start
@@ -191,81 +240,118 @@ class ActionShowNextItem(Action):
     def name(self) -> Text:
         return "action_show_next_item"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
         
-        filtered_items_json = tracker.get_slot("filtered_items")
+        cursor_id = tracker.get_slot("filtered_items")
         current_index = tracker.get_slot("current_item_index") or 0
         
-        if not filtered_items_json:
+        if not cursor_id:
             dispatcher.utter_message(text="No more items to show. Try a new search!")
             return []
         
+        next_index = current_index + 1
+        
         try:
-            item_ids = json.loads(filtered_items_json)
-        except:
-            dispatcher.utter_message(text="No more items to show. Try a new search!")
+            cursor = result_store.get(cursor_id, tracker.sender_id)
+            if cursor is None:
+                item_ids = _legacy_item_ids(cursor_id)
+                if item_ids is not None:
+                    return await self._show_next_from_ids(dispatcher, item_ids, current_index)
+                cursor = await self._rebuild_cursor(tracker, cursor_id, next_index)
+                if cursor is None:
+                    dispatcher.utter_message(text="No more items to show. Try a new search!")
+                    return []
+            
+            # Only the best results are loaded by the search; the next page
+            # may already have been prefetched (or still be loading)
+            await prefetcher.take(tracker.sender_id, "item", (cursor_id, next_index))
+            next_item = await cursor.load(next_index, catalog_provider.posts, settings.SEARCH_TOP_K)
+        except requests.exceptions.RequestException:
+            dispatcher.utter_message(text="Sorry, I'm having trouble connecting to the server.")
             return []
         
+        if next_item is None:
+            result_store.discard(cursor_id)
+            prefetcher.cancel(tracker.sender_id, "item")
+            return self._no_more_items(dispatcher)
+        
+        _prefetch_next_turn(tracker, cursor, next_index + 1)
+        events = self._show_item(dispatcher, next_item, next_index)
+        if cursor.cursor_id != cursor_id:
+            # rebuilt under a new id (the old one is another sender's)
+            events.append(SlotSet("filtered_items", cursor.cursor_id))
+        return events
+
+    async def _rebuild_cursor(self, tracker: Tracker, cursor_id: Text, start: int) -> Any:
+        # The cursor is in another worker's memory (or was lost in a restart
+        # or evicted). Run the search again from the slots it left behind and
+        # continue at start; None if there is nothing to search for
+        item_type = tracker.get_slot("item_type")
+        color_ids = _color_ids(tracker.get_slot("color"))
+        item_name = tracker.get_slot("item_name")
+        if not item_type and not color_ids and not item_name:
+            return None
+        ranked = await _ranked_search(item_type, color_ids, item_name)
+        ranked.take(start)
+        CURSOR_REBUILDS.inc()
+        return result_store.create(tracker.sender_id, [], ranked, cursor_id=cursor_id, offset=start)
+
+    async def _show_next_from_ids(self, dispatcher: CollectingDispatcher, item_ids: List[Any],
+                            current_index: int) -> List[Dict[Text, Any]]:
         next_index = current_index + 1
         
         if next_index >= len(item_ids):
-            dispatcher.utter_message(text="That's all the items I found! Would you like to search for something else?")
-            # Clear ALL search-related slots so next search starts fresh
-            return [
-                SlotSet("selected_post_id", None),
-                SlotSet("filtered_items", None),
-                SlotSet("current_item_index", None),
-                SlotSet("item_type", None),
-                SlotSet("item_name", None),
-                SlotSet("color", None)
-            ]
+            return self._no_more_items(dispatcher)
         
         # Fetch the next item details
         try:
-            response = requests.get("http://localhost:8800/api/posts-all", timeout=5)
-            data = response.json()
-            posts = data.get("posts", [])
-            
-            next_post_id = item_ids[next_index]
-            next_item = None
-            for post in posts:
-                if post.get("post_id") == next_post_id:
-                    next_item = post
-                    break
-            
-            if next_item:
-                image_url = next_item.get('images', [None])[0]
-                dispatcher.utter_message(
-                    text=f"How about this one: {next_item.get('title', 'Unknown')} - {next_item.get('description', 'No description')} (${next_item.get('price', 'N/A')}). Would you like to book this item?",
-                    image=image_url
-                )
-                return [
-                    SlotSet("selected_post_id", next_post_id),
-                    SlotSet("current_item_index", next_index)
-                ]
-            else:
-                dispatcher.utter_message(text="Sorry, I couldn't find that item. Try a new search!")
-                return []
-                
+            return self._show_item(dispatcher, await catalog_provider.get(item_ids[next_index]), next_index)
         except requests.exceptions.RequestException as e:
             dispatcher.utter_message(text="Sorry, I'm having trouble connecting to the server.")
             return []
 
+    def _show_item(self, dispatcher: CollectingDispatcher, next_item: Any,
+                   next_index: int) -> List[Dict[Text, Any]]:
+        if next_item:
+            image_url = next_item.get('images', [None])[0]
+            dispatcher.utter_message(
+                text=f"How about this one: {next_item.get('title', 'Unknown')} - {next_item.get('description', 'No description')} (${next_item.get('price', 'N/A')}). Would you like to book this item?",
+                image=image_url
+            )
+            return [
+                SlotSet("selected_post_id", next_item.get("post_id")),
+                SlotSet("current_item_index", next_index)
+            ]
+        else:
+            dispatcher.utter_message(text="Sorry, I couldn't find that item. Try a new search!")
+            return []
+
+    def _no_more_items(self, dispatcher: CollectingDispatcher) -> List[Dict[Text, Any]]:
+        dispatcher.utter_message(text="That's all the items I found! Would you like to search for something else?")
+        # Clear ALL search-related slots so next search starts fresh
+        return [
+            SlotSet("selected_post_id", None),
+            SlotSet("filtered_items", None),
+            SlotSet("current_item_index", None),
+            SlotSet("item_type", None),
+            SlotSet("item_name", None),
+            SlotSet("color", None)
+        ]
+
 
 class ActionBookItem(Action):
     def name(self) -> Text:
         return "action_book_item"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
 
         sender_id = tracker.sender_id
-        metadata = tracker.latest_message.get("metadata", {})
-        user_email = metadata.get("user_email")
+        user_email = _user_email(tracker)
         # Get the selected post_id from slots
         post_id = tracker.get_slot("selected_post_id")
 
@@ -273,50 +359,59 @@ class ActionBookItem(Action):
             dispatcher.utter_message(text="Sorry, I don't have an item selected to book. Please search for an item first.")
             return []
 
-        if not user_email:
-            user_email = tracker.get_slot("email")
-
         if not user_email:
             dispatcher.utter_message(text="I don't know your account email. Please log in on the website or tell me your email so I can add the item to your cart.")
             return []
 
+        started = time.perf_counter()
         try:
-            tx_resp = requests.get("http://localhost:8800/api/profile/cart/id", params={"email": user_email}, timeout=5)
-            tx_resp.raise_for_status()
-            tx_data = tx_resp.json()
-            transaction_id = tx_data.get("transactionId")
-
-            # if none, create a new pending transaction using server endpoint
+            # The pending cart was usually prefetched while the user looked at
+            # the item. Otherwise /cart/create returns the pending transaction
+            # if there already is one, or creates it
+            transaction_id = await prefetcher.take(sender_id, "cart_id", user_email)
+            prefetched = bool(transaction_id)
             if not transaction_id:
-                create_resp = requests.post("http://localhost:8800/api/profile/cart/create", json={"email": user_email}, timeout=5)
-                create_resp.raise_for_status()
-                transaction_id = create_resp.json().get("transactionId")
+                transaction_id = await _create_cart(user_email)
+
+            cart_data = None
+            if transaction_id:
+                try:
+                    cart_data = await _add_to_cart(transaction_id, post_id, user_email)
+                except BackendError as e:
+                    # the backend only adds to a pending cart; a prefetched one
+                    # may have been checked out (e.g. on the website) since
+                    if not prefetched or e.status != 409:
+                        raise
+                    transaction_id = await _create_cart(user_email)
+                    if transaction_id:
+                        cart_data = await _add_to_cart(transaction_id, post_id, user_email)
 
             if not transaction_id:
+                BOOKING_SECONDS.observe(time.perf_counter() - started, outcome="no_cart")
                 dispatcher.utter_message(text=(
                     "I couldn't create or find an active cart for your account. "
                     "Please try again from the website if the problem continues."
                 ))
                 return []
-
-            # add item to cart (use correct API prefix and PUT method)
-            add_url = "http://localhost:8800/api/profile/cart/addItem"
-            
-          
-            add_payload = {"transactionId": transaction_id, "postId": post_id}
-            add_resp = requests.put(add_url, json=add_payload, timeout=5)
-            add_resp.raise_for_status()
-            
             
             dispatcher.utter_message(text=f"Great! I've added this item to your cart (transaction {transaction_id}). You can view your cart on the website to confirm.")
             
-            cart_resp = requests.get("http://localhost:8800/api/profile/cart", params={"email": user_email}, timeout=5)
-            cart_data = cart_resp.json()
             cart_items = cart_data.get("cart", [])
-            cart_total = sum(item.get("price", 0) for item in cart_items)
+            if not any(item.get("post_id") == post_id for item in cart_items):
+                # the cart was read before the new item landed in it
+                booked_item = await catalog_provider.get(post_id)
+                if booked_item is not None:
+                    cart_items = cart_items + [booked_item]
+                else:
+                    cart_data = await backend.get("/api/profile/cart", params={"email": user_email})
+                    cart_items = cart_data.get("cart", [])
+            cart_total = sum(item.get("price") or 0 for item in cart_items)
+            BOOKING_SECONDS.observe(time.perf_counter() - started, outcome="ok")
             dispatcher.utter_message(text=f"Your cart total is now ${cart_total:.2f}.")
             
             # Clear akl slots after booking for fresh start
+            result_store.discard(tracker.get_slot("filtered_items"))
+            prefetcher.cancel(sender_id, "item")
             return [
                 SlotSet("selected_post_id", None),
                 SlotSet("filtered_items", None),
@@ -326,6 +421,7 @@ class ActionBookItem(Action):
                 SlotSet("item_name", None)
             ]
 
-        except requests.exceptions.RequestException:
+        except (BackendError, requests.exceptions.RequestException):
+            BOOKING_SECONDS.observe(time.perf_counter() - started, outcome="error")
             dispatcher.utter_message(text="Sorry, I'm having trouble connecting to the server. Please try again later.")
             return []
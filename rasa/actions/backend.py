@@ -0,0 +1,113 @@
+# Shared async HTTP client for the Node/Express backend.
+#
+# Every action call used to go through a blocking requests.get/post that
+# opened a fresh connection and held the action server's event loop until
+# the whole chain finished. The async actions instead share one aiohttp
+# session per event loop, with a bounded keep-alive connection pool,
+# configurable timeouts and retries for calls that are safe to repeat.
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Text
+
+import aiohttp
+
+from metrics import REGISTRY
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_REQUEST_SECONDS = REGISTRY.histogram(
+    "closet_backend_request_seconds", "Node backend request time per attempt", ["method", "path", "status"]
+)
+
+
+class BackendError(Exception):
+    """A backend call failed (connection error, timeout or error status)."""
+
+    def __init__(self, message: Text, status: Optional[int] = None):
+        super().__init__(message)
+        # the HTTP status, when the backend answered with an error
+        self.status = status
+
+
+class BackendClient:
+    def __init__(self, base_url: Text, timeout: float, retries: int, retry_backoff: float, pool_size: int):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled session for the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    async def request(self, method: Text, path: Text, *, params: Optional[Dict[Text, Any]] = None,
+                      json: Any = None, idempotent: Optional[bool] = None) -> Any:
+        """Send a request and return the decoded JSON body.
+
+        GET requests are retried on connection errors, timeouts and 5xx
+        responses; other methods only when idempotent=True.
+        """
+        if idempotent is None:
+            idempotent = method == "GET"
+        attempts = 1 + (self.retries if idempotent else 0)
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                async with self.session().request(method, url, params=params, json=json) as response:
+                    status = response.status
+                    body = await response.json(content_type=None) if status < 400 else None
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                BACKEND_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method, path=path, status="error")
+                error: Exception = e
+            else:
+                BACKEND_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method, path=path, status=status)
+                if status < 400:
+                    return body
+                error = BackendError(f"{method} {path} returned {status}", status)
+                if status < 500:
+                    raise error
+
+            if attempt + 1 >= attempts:
+                raise BackendError(f"{method} {path} failed: {error!r}") from error
+            logger.debug("Retrying %s %s after %r", method, path, error)
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+
+    async def get(self, path: Text, **kwargs: Any) -> Any:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: Text, **kwargs: Any) -> Any:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: Text, **kwargs: Any) -> Any:
+        return await self.request("PUT", path, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Shared by every action in this process
+backend = BackendClient(
+    settings.API_BASE_URL,
+    timeout=settings.API_TIMEOUT,
+    retries=settings.API_RETRIES,
+    retry_backoff=settings.API_RETRY_BACKOFF,
+    pool_size=settings.API_POOL_SIZE,
+)
@@ -0,0 +1,346 @@
+# Shared, auto-refreshing cache of the Closet Circle catalog.
+#
+# The actions used to call /api/posts-all on every turn. That route fans out
+# into per-post image/category/user queries on the Node side, so the action
+# server now keeps one in-process snapshot of the catalog keyed by post_id:
+#
+#   - a fresh snapshot (younger than the TTL) is served straight from memory
+#   - an expired snapshot is still served, and a background thread refreshes
+#     it, so a turn never waits on an expired entry
+#   - if the backend is down, the last good snapshot keeps being served
+#
+# Only the very first load (no snapshot yet) has to wait for the backend, and
+# concurrent first requests share that one download.
+#
+# With a fetch_changes function (the /api/posts-changes route) refreshes are
+# incremental: only the posts changed since the last seen change id are
+# downloaded and applied, so a refresh costs as much as the churn, not the
+# catalog size. Every reconcile_interval seconds a full download replaces
+# the snapshot anyway, to catch anything the change log missed (e.g. a
+# lister renaming themselves).
+#
+# Posts can be stored as compact records (see records.py) instead of the
+# dicts the backend returns, to keep large catalogs small in every worker.
+#
+# Listeners (e.g. the search index) are told which posts changed on each
+# refresh so they can update themselves incrementally.
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Text, Tuple
+
+import requests
+
+from metrics import REGISTRY
+
+from . import settings
+from .records import PostRecord
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FETCH_SECONDS = REGISTRY.histogram(
+    "closet_catalog_fetch_seconds", "Time to fetch the catalog (or its changes) from the backend", ["kind", "outcome"]
+)
+CATALOG_CHANGES = REGISTRY.counter(
+    "closet_catalog_changes", "Posts added, updated or removed by catalog refreshes", ["kind"]
+)
+
+# listener(order, upserted, removed): order is every post_id in catalog order,
+# or None when the remaining posts kept their order and new ones were added
+# at the end; upserted are the new or changed posts, removed the ids that
+# disappeared
+CatalogListener = Callable[[Optional[List[Any]], Iterable[Dict[Text, Any]], Iterable[Any]], None]
+
+# fetch_changes(since) -> (latest change id, upserted posts, removed post_ids);
+# with since=None only the latest change id is needed
+ChangesFetcher = Callable[[Optional[int]], Tuple[int, List[Dict[Text, Any]], List[Any]]]
+
+# Reused across fetches so the refresh keeps its connection to the backend alive
+_session = requests.Session()
+
+
+def fetch_posts_http() -> List[Dict[Text, Any]]:
+    """Download the full catalog from the backend's /api/posts-all route."""
+    response = _session.get(f"{settings.API_BASE_URL}/api/posts-all", timeout=settings.API_TIMEOUT)
+    response.raise_for_status()
+    return response.json().get("posts", [])
+
+
+def fetch_changes_http(since: Optional[int]) -> Tuple[int, List[Dict[Text, Any]], List[Any]]:
+    """Download the posts changed after change id `since` from /api/posts-changes."""
+    params = {} if since is None else {"since": since}
+    response = _session.get(
+        f"{settings.API_BASE_URL}/api/posts-changes", params=params, timeout=settings.API_TIMEOUT
+    )
+    response.raise_for_status()
+    body = response.json()
+    return body["latest"], body.get("posts", []), body.get("removed", [])
+
+
+class CatalogCache:
+    """In-process snapshot of all posts, keyed by post_id."""
+
+    def __init__(self, fetch: Callable[[], List[Dict[Text, Any]]], ttl: float,
+                 fetch_changes: Optional[ChangesFetcher] = None, reconcile_interval: float = 600,
+                 record: Optional[Callable[[Dict[Text, Any]], Any]] = None):
+        self._fetch = fetch
+        # converts each fetched post before it is stored, e.g. PostRecord.from_post
+        self._record = record
+        self._fetch_changes = fetch_changes
+        self.ttl = ttl
+        self.reconcile_interval = reconcile_interval
+        # last change id applied, None until a full fetch has recorded one
+        self._watermark: Optional[int] = None
+        self._reconciled_at: Optional[float] = None
+        self._posts: "OrderedDict[Any, Dict[Text, Any]]" = OrderedDict()
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # serializes applying snapshots so listeners see changes in order
+        self._apply_lock = threading.Lock()
+        self._refreshing = False
+        # set once the first load (which everyone waits for) has finished
+        self._first_load: Optional[threading.Event] = None
+        self._listeners: List[CatalogListener] = []
+
+        # counters, see stats()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.delta_refreshes = 0
+        self.refresh_failures = 0
+        # posts a full reconcile found different from the delta-synced snapshot
+        self.drift = 0
+
+    def posts(self) -> List[Dict[Text, Any]]:
+        """Return every post, in the order the backend returned them.
+
+        Raises requests.RequestException only if there is no snapshot at all
+        and the backend can't be reached.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._posts.values())
+
+    def snapshot(self) -> Mapping[Any, Dict[Text, Any]]:
+        """Return the current post_id -> post mapping, in catalog order.
+
+        The mapping is replaced (never mutated) on refresh, so callers can
+        hold on to it for the rest of the turn without copying. Treat it as
+        read-only.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return self._posts
+
+    def get(self, post_id: Any) -> Optional[Dict[Text, Any]]:
+        """Return a single post by id, or None if it isn't in the catalog."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._posts.get(post_id)
+
+    async def asnapshot(self) -> Mapping[Any, Dict[Text, Any]]:
+        """snapshot() for async actions. Only the first load waits on the
+        backend, and it does so in a worker thread instead of the event loop."""
+        if self._fetched_at is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.snapshot)
+        return self.snapshot()
+
+    async def aget(self, post_id: Any) -> Optional[Dict[Text, Any]]:
+        return (await self.asnapshot()).get(post_id)
+
+    def refresh(self) -> bool:
+        """Bring the snapshot up to date: apply the changes since the last
+        refresh if possible, otherwise fetch the whole catalog. Returns False
+        on failure, in which case the previous snapshot is kept."""
+        if (self._watermark is not None
+                and time.monotonic() - self._reconciled_at < self.reconcile_interval
+                and self._refresh_delta()):
+            return True
+        return self._refresh_full()
+
+    def _refresh_full(self) -> bool:
+        started = time.monotonic()
+        try:
+            # read the change id first: changes made while the catalog is
+            # downloading are applied (again) by the next delta
+            watermark = self._latest_change()
+            posts = self._fetch()
+        except (requests.RequestException, ValueError) as e:
+            CATALOG_FETCH_SECONDS.observe(time.monotonic() - started, kind="full", outcome="error")
+            with self._lock:
+                self.refresh_failures += 1
+            logger.warning("Catalog refresh failed, keeping last good snapshot: %s", e)
+            return False
+
+        CATALOG_FETCH_SECONDS.observe(time.monotonic() - started, kind="full", outcome="ok")
+        if self._record is not None:
+            posts = [self._record(post) for post in posts]
+        snapshot = OrderedDict((post.get("post_id"), post) for post in posts)
+        with self._apply_lock:
+            previous = self._posts
+            upserted = [post for post_id, post in snapshot.items() if previous.get(post_id) != post]
+            removed = [post_id for post_id in previous if post_id not in snapshot]
+            with self._lock:
+                if self._watermark is not None:
+                    self.drift += len(upserted) + len(removed)
+                self._posts = snapshot
+                self._fetched_at = self._reconciled_at = time.monotonic()
+                self._watermark = watermark
+                self.refreshes += 1
+            self._notify(list(snapshot), upserted, removed)
+        CATALOG_CHANGES.inc(len(upserted) + len(removed), kind="full")
+        logger.debug("Catalog refreshed: %d posts in %.3fs", len(snapshot), time.monotonic() - started)
+        return True
+
+    def _refresh_delta(self) -> bool:
+        # False means the changes couldn't be fetched; the caller then falls
+        # back to a full refresh
+        started = time.monotonic()
+        try:
+            latest, changed, gone = self._fetch_changes(self._watermark)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            CATALOG_FETCH_SECONDS.observe(time.monotonic() - started, kind="delta", outcome="error")
+            logger.warning("Catalog delta sync failed, fetching the whole catalog: %s", e)
+            return False
+
+        CATALOG_FETCH_SECONDS.observe(time.monotonic() - started, kind="delta", outcome="ok")
+        if self._record is not None:
+            changed = [self._record(post) for post in changed]
+        with self._apply_lock:
+            previous = self._posts
+            upserted = [post for post in changed if previous.get(post.get("post_id")) != post]
+            removed = [post_id for post_id in gone if post_id in previous]
+            snapshot = previous
+            if upserted or removed:
+                # copy-on-write: readers may still hold the previous mapping
+                snapshot = OrderedDict(previous)
+                for post_id in removed:
+                    del snapshot[post_id]
+                for post in upserted:
+                    snapshot[post.get("post_id")] = post
+            with self._lock:
+                self._posts = snapshot
+                self._fetched_at = time.monotonic()
+                self._watermark = latest
+                self.refreshes += 1
+                self.delta_refreshes += 1
+            self._notify(None, upserted, removed)
+        CATALOG_CHANGES.inc(len(upserted) + len(removed), kind="delta")
+        logger.debug(
+            "Catalog synced to change %s: %d upserted, %d removed in %.3fs",
+            latest, len(upserted), len(removed), time.monotonic() - started,
+        )
+        return True
+
+    def _latest_change(self) -> Optional[int]:
+        if self._fetch_changes is None:
+            return None
+        try:
+            return self._fetch_changes(None)[0]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            # e.g. a backend without /api/posts-changes: full refreshes only
+            logger.debug("Catalog change log unavailable: %s", e)
+            return None
+
+    def add_listener(self, listener: CatalogListener) -> None:
+        """Register a listener; it is immediately given the current snapshot."""
+        with self._apply_lock:
+            self._listeners.append(listener)
+            if self._posts:
+                listener(list(self._posts), list(self._posts.values()), [])
+
+    def _notify(self, order: Optional[List[Any]], upserted: List[Dict[Text, Any]], removed: List[Any]) -> None:
+        # caller holds self._apply_lock
+        if not upserted and not removed:
+            return
+        for listener in self._listeners:
+            try:
+                listener(order, upserted, removed)
+            except Exception:
+                logger.exception("Catalog listener %r failed", listener)
+
+    def invalidate(self) -> None:
+        """Mark the current snapshot as expired; the next read refreshes it."""
+        with self._lock:
+            if self._fetched_at is not None:
+                self._fetched_at = float("-inf")
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            served = self.hits + self.stale_hits + self.misses
+            return {
+                "posts": len(self._posts),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "delta_refreshes": self.delta_refreshes,
+                "refresh_failures": self.refresh_failures,
+                "drift": self.drift,
+                "watermark": self._watermark,
+                # every read that didn't wait on the backend is a saved /api/posts-all call
+                "hit_rate": (self.hits + self.stale_hits) / served if served else 0.0,
+                "age_seconds": time.monotonic() - self._fetched_at if self._fetched_at else None,
+            }
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if self._fetched_at is not None:
+                if time.monotonic() - self._fetched_at < self.ttl:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    self._refresh_in_background()
+                return
+            self.misses += 1
+            # Nothing cached yet, we have to wait for the backend. Only the
+            # first caller fetches; concurrent misses wait for its result
+            # instead of each downloading the whole catalog
+            first_load = self._first_load
+            leader = first_load is None
+            if leader:
+                first_load = self._first_load = threading.Event()
+
+        if leader:
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._first_load = None
+                first_load.set()
+        else:
+            first_load.wait()
+        with self._lock:
+            loaded = self._fetched_at is not None
+        if not loaded:
+            raise requests.exceptions.ConnectionError("Catalog is unavailable and nothing is cached yet")
+
+    def _refresh_in_background(self) -> None:
+        # caller holds self._lock
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=_run, name="catalog-refresh", daemon=True).start()
+
+
+# Shared by every action in this process
+catalog = CatalogCache(
+    fetch_posts_http,
+    ttl=settings.CATALOG_TTL_SECONDS,
+    fetch_changes=fetch_changes_http if settings.CATALOG_DELTA_SYNC else None,
+    reconcile_interval=settings.CATALOG_RECONCILE_SECONDS,
+    record=PostRecord.from_post if settings.CATALOG_COMPACT else None,
+)
+REGISTRY.register_stats("closet_catalog", catalog.stats)
@@ -0,0 +1,264 @@
+# Catalog provider that reads closet_circle_database.db directly.
+#
+# The HTTP provider downloads the whole catalog from /api/posts-all (which
+# the Node side builds with per-post image/category/user queries) just so
+# the action server can filter it in Python. This provider instead runs the
+# item_type/color filter as SQL and only materializes the posts that matched,
+# in the same shape /api/posts-all returns them:
+#
+#   - the color filter is a JOIN on Post_Category (by category_id index)
+#   - the item_type filter is a substring check on the title in SQL
+#   - matched posts are built with one JOIN over Post, User and Post_Image
+#
+# Connections are opened read-only (mode=ro, query_only) and pooled. Every
+# query runs in autocommit mode, so a reader never holds a snapshot open
+# between turns and the Node server's writes and WAL checkpoints are never
+# blocked by the action server.
+
+import asyncio
+import logging
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Text
+
+import requests
+
+from metrics import REGISTRY
+
+from .fuzzy import FuzzyMatcher
+from .records import category_bits
+
+logger = logging.getLogger(__name__)
+
+CATALOG_QUERY_SECONDS = REGISTRY.histogram(
+    "closet_catalog_query_seconds", "Time to run a catalog query against the SQLite database", ["query"]
+)
+
+
+class CatalogUnavailable(requests.exceptions.ConnectionError):
+    """The catalog database couldn't be opened or queried."""
+
+
+# post_ids are passed as one JSON array parameter, so there is no limit on
+# how many a query can take
+_MATERIALIZE = """
+    SELECT p.*, u.first_name AS _first_name, u.last_name AS _last_name, i.image_url AS _image_url,
+           (SELECT group_concat(c.category_id) FROM Post_Category c WHERE c.post_id = p.post_id) AS _categories
+    FROM json_each(?) AS ids
+    JOIN Post p ON p.post_id = ids.value
+    LEFT JOIN User u ON u.email = p.owner_id
+    LEFT JOIN Post_Image i ON i.post_id = p.post_id
+    ORDER BY ids.key, i.image_id
+"""
+
+
+class SQLiteCatalog:
+    """Read-only catalog provider over the backend's SQLite database."""
+
+    def __init__(self, path: Text, pool_size: int, timeout: float,
+                 fuzzy_mode: Text = "indexed"):
+        self.path = path
+        self.timeout = timeout
+        self._uri = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.queries = 0
+        self.errors = 0
+        # there is no trigram index in the database, so every candidate is
+        # scored (exactly the reference matches)
+        self.matcher = FuzzyMatcher(self, mode=fuzzy_mode, trigram_prefilter=False)
+
+    async def count(self) -> int:
+        return await self._run(self.count_posts)
+
+    async def filter(self, search_terms: List[Text], color_ids: Optional[List[int]]) -> List[Any]:
+        return await self._run(self.filter_ids, search_terms, color_ids)
+
+    async def match_name(self, item_name: Text, post_ids: Iterable[Any]) -> Dict[Any, int]:
+        return await self._run(self.matcher.match, item_name, list(post_ids))
+
+    async def features(self, post_ids: Iterable[Any]) -> Dict[Any, Any]:
+        return await self._run(self.title_features, list(post_ids))
+
+    async def posts(self, post_ids: Iterable[Any]) -> List[Dict[Text, Any]]:
+        return await self._run(self.materialize, list(post_ids))
+
+    async def get(self, post_id: Any) -> Optional[Dict[Text, Any]]:
+        posts = await self.posts([post_id])
+        return posts[0] if posts else None
+
+    async def sample(self, n: int) -> List[Dict[Text, Any]]:
+        ids = await self._run(self._query_ids, "sample", "SELECT post_id FROM Post ORDER BY post_id LIMIT ?", [n])
+        return await self.posts(ids)
+
+    def count_posts(self) -> int:
+        with self._query("count") as conn:
+            return conn.execute("SELECT count(*) FROM Post").fetchone()[0]
+
+    def filter_ids(self, search_terms: List[Text], color_ids: Optional[List[int]]) -> List[Any]:
+        """post_ids whose title contains any of search_terms (if given) and that
+        are in any of color_ids (if given), in catalog order."""
+        sql = "SELECT DISTINCT p.post_id FROM Post p"
+        params: List[Any] = []
+        if color_ids:
+            sql += (
+                " JOIN Post_Category pc ON pc.post_id = p.post_id"
+                f" AND pc.category_id IN ({', '.join('?' * len(color_ids))})"
+            )
+            params += color_ids
+        if search_terms:
+            sql += " WHERE " + " OR ".join("instr(lower(p.title), ?) > 0" for _ in search_terms)
+            params += [term.lower() for term in search_terms]
+        sql += " ORDER BY p.post_id"
+        return self._query_ids("filter", sql, params)
+
+    def title_features(self, post_ids: List[Any]) -> Dict[Any, Any]:
+        """Lowercased title and category bitset for each post_id, for ranking."""
+        with self._query("features") as conn:
+            rows = conn.execute(
+                """SELECT p.post_id, p.title, group_concat(c.category_id)
+                   FROM Post p LEFT JOIN Post_Category c ON c.post_id = p.post_id
+                   WHERE p.post_id IN (SELECT value FROM json_each(?))
+                   GROUP BY p.post_id""",
+                [_json_ids(post_ids)],
+            ).fetchall()
+        return {
+            row[0]: ((row[1] or "").lower(), category_bits(int(c) for c in row[2].split(",")) if row[2] else 0)
+            for row in rows
+        }
+
+    def materialize(self, post_ids: List[Any]) -> List[Dict[Text, Any]]:
+        """The posts for post_ids, in that order, shaped like /api/posts-all
+        (images, categories and lister included). Unknown ids are skipped."""
+        if not post_ids:
+            return []
+        posts: Dict[Any, Dict[Text, Any]] = {}
+        with self._query("materialize") as conn:
+            for row in conn.execute(_MATERIALIZE, [_json_ids(post_ids)]):
+                post = posts.get(row["post_id"])
+                if post is None:
+                    post = posts[row["post_id"]] = _post_from_row(row)
+                if row["_image_url"] is not None:
+                    post["images"].append(row["_image_url"])
+        return list(posts.values())
+
+    # FuzzyMatcher reads item_name texts through these, like it does from the
+    # SearchIndex
+
+    def containing(self, text: Text, post_ids: Optional[Iterable[Any]] = None) -> Set[Any]:
+        """post_ids whose title or description contains text (lowercase)."""
+        sql = "SELECT post_id FROM Post WHERE (instr(lower(title), ?) > 0 OR instr(lower(description), ?) > 0)"
+        params: List[Any] = [text, text]
+        if post_ids is not None:
+            sql += " AND post_id IN (SELECT value FROM json_each(?))"
+            params.append(_json_ids(post_ids))
+        return set(self._query_ids("containing", sql, params))
+
+    def sharing_trigrams(self, text: Text, post_ids: Iterable[Any]) -> Set[Any]:
+        return set(post_ids)
+
+    def texts(self, post_ids: Iterable[Any]) -> Dict[Any, Any]:
+        """Lowercased (title, description) for each post_id in the catalog."""
+        with self._query("texts") as conn:
+            rows = conn.execute(
+                "SELECT post_id, title, description FROM Post WHERE post_id IN (SELECT value FROM json_each(?))",
+                [_json_ids(post_ids)],
+            ).fetchall()
+        return {row[0]: ((row[1] or "").lower(), (row[2] or "").lower()) for row in rows}
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "pooled_connections": self._pool.qsize(),
+                "queries": self.queries,
+                "errors": self.errors,
+            }
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    async def _run(self, fn, *args):
+        # sqlite3 blocks, so queries run in a worker thread
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _query_ids(self, name: Text, sql: Text, params: List[Any]) -> List[Any]:
+        with self._query(name) as conn:
+            return [row[0] for row in conn.execute(sql, params)]
+
+    @contextmanager
+    def _query(self, name: Text) -> Iterator[sqlite3.Connection]:
+        conn = self._checkout()
+        started = time.monotonic()
+        try:
+            yield conn
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+                self.connections -= 1
+            logger.warning("Catalog query %s failed: %s", name, e)
+            conn.close()
+            conn = None
+            raise CatalogUnavailable(f"Catalog query {name} failed: {e}") from e
+        finally:
+            CATALOG_QUERY_SECONDS.observe(time.monotonic() - started, query=name)
+            if conn is not None:
+                self._checkin(conn)
+        with self._lock:
+            self.queries += 1
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = sqlite3.connect(
+                self._uri, uri=True, timeout=self.timeout, isolation_level=None, check_same_thread=False,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only = ON")
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+            raise CatalogUnavailable(f"Can't open catalog database {self.path}: {e}") from e
+        with self._lock:
+            self.connections += 1
+        return conn
+
+    def _checkin(self, conn: sqlite3.Connection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._lock:
+                self.connections -= 1
+
+
+def _json_ids(post_ids: Iterable[Any]) -> Text:
+    return "[" + ",".join(str(int(post_id)) for post_id in post_ids) + "]"
+
+
+def _post_from_row(row: sqlite3.Row) -> Dict[Text, Any]:
+    post = {key: row[key] for key in row.keys() if not key.startswith("_")}
+    post["images"] = []
+    categories = row["_categories"]
+    post["categories"] = sorted(int(c) for c in categories.split(",")) if categories else []
+    if row["_first_name"] is not None:
+        post["lister"] = {
+            "display": f"{row['_first_name']} {(row['_last_name'] or '')[:1]}.",
+            "username": post["owner_id"],
+            "avatarUrl": None,
+        }
+    else:
+        post["lister"] = {"display": "Unknown", "username": "unknown-user", "avatarUrl": None}
+    return post
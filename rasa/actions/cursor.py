@@ -0,0 +1,141 @@
+# Server-side cursors over search results.
+#
+# ActionFindItem used to store every matching post_id as a JSON list in the
+# filtered_items slot, and ActionShowNextItem re-downloaded the catalog to
+# look up the next one. Now a search keeps its matched post records here and
+# only puts a short cursor id in the slot, so showing the next item is a
+# dict lookup and the tracker stays small.
+#
+# Results are ranked (see ranking.py): a cursor holds the posts loaded so far,
+# best first, and the ranked post_ids that haven't been loaded yet. Pages are
+# loaded one at a time, so a "next" and a prefetch of the same page share the
+# load and pages always end up in rank order.
+#
+# The store is bounded: the least recently used cursors are evicted once
+# RESULT_STORE_SIZE is reached, and cursors expire after RESULT_TTL_SECONDS.
+#
+# The store lives in one process's memory, so a "next" can reach a worker
+# (or a restarted server) that doesn't have the cursor. The search is
+# deterministic, so ActionShowNextItem then runs it again from the search
+# slots and recreates the cursor under the same id (a new one if another
+# sender's cursor has it), starting at the item the conversation had reached
+# (offset).
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Text
+
+from metrics import REGISTRY
+
+from . import settings
+from .ranking import RankedResults
+
+
+class ResultCursor:
+    def __init__(self, cursor_id: Text, sender_id: Text, posts: List[Dict[Text, Any]],
+                 remaining: Optional[RankedResults] = None, offset: int = 0):
+        self.cursor_id = cursor_id
+        self.sender_id = sender_id
+        # posts[0] is the result at index offset
+        self.offset = offset
+        self.posts = posts
+        self.remaining = remaining
+        # post_ids of a page whose load failed, loaded first next time
+        self._retry: List[Any] = []
+        self._loading: Optional[asyncio.Future] = None
+        self.touched_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return (self.offset + len(self.posts) + len(self._retry)
+                + (len(self.remaining) if self.remaining is not None else 0))
+
+    def item(self, index: int) -> Optional[Dict[Text, Any]]:
+        """The post at index, or None if it isn't loaded (yet)."""
+        if 0 <= index - self.offset < len(self.posts):
+            return self.posts[index - self.offset]
+        return None
+
+    async def load(self, index: int, fetch_posts: Callable[[List[Any]], Awaitable[List[Dict[Text, Any]]]],
+                   page_size: int) -> Optional[Dict[Text, Any]]:
+        """The post at index, loading pages of page_size ranked results with
+        fetch_posts(post_ids) until it is loaded. None past the end (or
+        before the offset)."""
+        while self.offset <= index < len(self) and self.item(index) is None:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self._load_page(fetch_posts, page_size))
+                # a failed load may have no waiter left (a cancelled prefetch)
+                self._loading.add_done_callback(lambda f: f.cancelled() or f.exception())
+            # cancelling a waiter doesn't abandon a page half loaded
+            await asyncio.shield(self._loading)
+        return self.item(index)
+
+    async def _load_page(self, fetch_posts: Callable[[List[Any]], Awaitable[List[Dict[Text, Any]]]],
+                         page_size: int) -> None:
+        post_ids, self._retry = self._retry, []
+        if not post_ids and self.remaining is not None:
+            post_ids = self.remaining.take(page_size)
+        try:
+            self.posts.extend(await fetch_posts(post_ids))
+        except BaseException:
+            self._retry = post_ids
+            raise
+        finally:
+            self._loading = None
+
+
+class ResultStore:
+    def __init__(self, max_cursors: int, ttl: float):
+        self.max_cursors = max_cursors
+        self.ttl = ttl
+        self._cursors: "OrderedDict[Text, ResultCursor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, sender_id: Text, posts: List[Dict[Text, Any]],
+               remaining: Optional[RankedResults] = None, cursor_id: Optional[Text] = None,
+               offset: int = 0) -> ResultCursor:
+        """Store a new cursor (under cursor_id when one is being rebuilt and
+        the id isn't another sender's)."""
+        with self._lock:
+            existing = self._cursors.get(cursor_id) if cursor_id else None
+            if not cursor_id or (existing is not None and existing.sender_id != sender_id):
+                cursor_id = uuid.uuid4().hex[:12]
+            cursor = ResultCursor(cursor_id, sender_id, posts, remaining, offset)
+            self._cursors[cursor.cursor_id] = cursor
+            self._cursors.move_to_end(cursor.cursor_id)
+            while len(self._cursors) > self.max_cursors:
+                self._cursors.popitem(last=False)
+                self.evictions += 1
+        return cursor
+
+    def get(self, cursor_id: Optional[Text], sender_id: Text) -> Optional[ResultCursor]:
+        """Return the cursor if it exists, hasn't expired and belongs to sender_id."""
+        if not cursor_id:
+            return None
+        with self._lock:
+            cursor = self._cursors.get(cursor_id)
+            if cursor is None or cursor.sender_id != sender_id:
+                return None
+            now = time.monotonic()
+            if now - cursor.touched_at > self.ttl:
+                del self._cursors[cursor_id]
+                return None
+            cursor.touched_at = now
+            self._cursors.move_to_end(cursor_id)
+            return cursor
+
+    def discard(self, cursor_id: Optional[Text]) -> None:
+        with self._lock:
+            self._cursors.pop(cursor_id, None)
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            return {"cursors": len(self._cursors), "evictions": self.evictions}
+
+
+# Shared by every action in this process
+result_store = ResultStore(settings.RESULT_STORE_SIZE, settings.RESULT_TTL_SECONDS)
+REGISTRY.register_stats("closet_result_store", result_store.stats)
@@ -0,0 +1,101 @@
+# Fuzzy item_name (brand) matching for ActionFindItem.
+#
+# A post matches item_name when the name is a substring of its title or
+# description, or when fuzz.partial_ratio against either is above
+# FUZZY_THRESHOLD. Two modes produce those matches:
+#
+#   - "indexed" (default): direct substring hits come straight from the
+#     search index and the remaining candidates are scored in bulk by
+#     rapidfuzz (the scoring loop runs in C++). It returns exactly the
+#     reference matches (tests/test_fuzzy.py checks this).
+#   - "reference": the original per-post thefuzz loop, kept for checking the
+#     indexed mode against.
+#
+# FUZZY_TRIGRAM_PREFILTER=1 additionally narrows the candidates to posts
+# sharing a character trigram with the name before scoring (if nothing
+# survives, every candidate is scored so typos like "nkie" still match).
+# That is faster but lossy: partial_ratio > 60 also accepts texts that share
+# no trigram with a short name ("nike" vs "hoodie" scores 67), so it is off
+# by default.
+
+import logging
+from typing import Any, Dict, Iterable, Text
+
+from rapidfuzz import fuzz as rf_fuzz
+from rapidfuzz import process
+from thefuzz import fuzz
+
+from . import settings
+from .search import SearchIndex, search_index
+
+logger = logging.getLogger(__name__)
+
+FUZZY_THRESHOLD = 60
+
+# thefuzz rounds rapidfuzz's float score to an int before the "> 60" check,
+# so anything below 60.5 can never pass
+_SCORE_CUTOFF = FUZZY_THRESHOLD + 0.5
+
+
+class FuzzyMatcher:
+    def __init__(self, index: SearchIndex, mode: Text = "indexed", trigram_prefilter: bool = False):
+        if mode not in ("indexed", "reference"):
+            raise ValueError(f"Unknown fuzzy match mode: {mode}")
+        self.index = index
+        self.mode = mode
+        self.trigram_prefilter = trigram_prefilter
+
+    def match(self, item_name: Text, post_ids: Iterable[Any]) -> Dict[Any, int]:
+        """Return {post_id: score} for every post in post_ids that matches
+        item_name. The score is the best partial_ratio over title and
+        description (100 for a direct substring match)."""
+        item_name = item_name.lower()
+        post_ids = list(post_ids)
+        if self.mode == "reference":
+            return self._match_reference(item_name, post_ids)
+        return self._match_indexed(item_name, post_ids)
+
+    def _match_indexed(self, item_name: Text, post_ids: list) -> Dict[Any, int]:
+        scores = {post_id: 100 for post_id in self.index.containing(item_name, post_ids)}
+
+        candidates = set(post_ids) - scores.keys()
+        if self.trigram_prefilter:
+            narrowed = self.index.sharing_trigrams(item_name, candidates)
+            if narrowed or scores:
+                candidates = narrowed
+        texts = self.index.texts(candidates)
+
+        for field in (0, 1):
+            choices = {post_id: text[field] for post_id, text in texts.items()}
+            for _, score, post_id in process.extract(
+                item_name, choices, scorer=rf_fuzz.partial_ratio,
+                limit=None, score_cutoff=_SCORE_CUTOFF,
+            ):
+                score = int(round(score))
+                if score > FUZZY_THRESHOLD and score > scores.get(post_id, 0):
+                    scores[post_id] = score
+        return scores
+
+    def _match_reference(self, item_name: Text, post_ids: list) -> Dict[Any, int]:
+        scores = {}
+        for post_id, (title, description) in self.index.texts(post_ids).items():
+            # First try direct substring match
+            direct_match = item_name in title or item_name in description
+            # Then try fuzzy match with lower threshold
+            fuzzy_score_title = fuzz.partial_ratio(item_name, title)
+            fuzzy_score_desc = fuzz.partial_ratio(item_name, description)
+            logger.debug(
+                "Checking '%s' against '%s' - direct=%s, fuzzy_title=%s, fuzzy_desc=%s",
+                item_name, title, direct_match, fuzzy_score_title, fuzzy_score_desc,
+            )
+            if direct_match or fuzzy_score_title > FUZZY_THRESHOLD or fuzzy_score_desc > FUZZY_THRESHOLD:
+                scores[post_id] = 100 if direct_match else max(fuzzy_score_title, fuzzy_score_desc)
+        return scores
+
+
+# Shared by every action in this process
+fuzzy_matcher = FuzzyMatcher(
+    search_index,
+    mode=settings.FUZZY_MATCH_MODE,
+    trigram_prefilter=settings.FUZZY_TRIGRAM_PREFILTER,
+)
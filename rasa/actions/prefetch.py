@@ -0,0 +1,158 @@
+# Speculative prefetch for the likely next turn.
+#
+# After an item is shown the user most likely says "next" or "book", and
+# both used to start with a backend round trip. While the user is reading,
+# the actions now start that work in the background:
+#
+#   - "item": loading the next page of ranked results, when the next item
+#     isn't loaded yet (its details and image URL come with it)
+#   - "cart_id": the user's pending cart from /api/profile/cart/id. It may
+#     have been checked out since (in another tab or on the website), so
+#     /cart/addItem rejects it with a 409 then and ActionBookItem falls back
+#     to /cart/create
+#
+# Each sender has at most one prefetch per kind. Scheduling a different key
+# (the conversation moved on) cancels the previous one, results expire after
+# PREFETCH_TTL_SECONDS, and at most PREFETCH_MAX_INFLIGHT prefetches run at
+# once; beyond that new ones are dropped, since they are only speculative.
+#
+# A prefetch that is taken and useful counts as a hit, one that finishes or
+# is cancelled without being used as wasted.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Text, Tuple
+
+from metrics import REGISTRY
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+PREFETCHES = REGISTRY.counter(
+    "closet_prefetches", "Speculative prefetches by outcome (started, hit, wasted, dropped, failed)", ["kind", "outcome"]
+)
+
+
+class _Prefetch:
+    __slots__ = ("key", "task", "started_at")
+
+    def __init__(self, key: Any, task: "asyncio.Task", started_at: float):
+        self.key = key
+        self.task = task
+        self.started_at = started_at
+
+
+class Prefetcher:
+    def __init__(self, max_inflight: int, ttl: float, max_entries: int, enabled: bool = True):
+        self.max_inflight = max_inflight
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[Text, Text], _Prefetch]" = OrderedDict()
+        self.inflight = 0
+        # counters, see stats()
+        self.hits = 0
+        self.wasted = 0
+        self.dropped = 0
+
+    def schedule(self, sender_id: Text, kind: Text, key: Any, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """Start fetch() in the background as sender_id's `kind` prefetch for
+        key, unless the same one is already there. Call from the event loop."""
+        if not self.enabled:
+            return
+        self._expire()
+        entry = self._entries.get((sender_id, kind))
+        if entry is not None:
+            if entry.key == key:
+                return
+            self._discard(sender_id, kind)
+        if self.inflight >= self.max_inflight:
+            self.dropped += 1
+            PREFETCHES.inc(kind=kind, outcome="dropped")
+            return
+
+        self.inflight += 1
+        PREFETCHES.inc(kind=kind, outcome="started")
+        task = asyncio.get_running_loop().create_task(self._run(kind, fetch))
+        # not a finally in _run: a task cancelled before it starts never runs it
+        task.add_done_callback(self._finished)
+        self._entries[(sender_id, kind)] = _Prefetch(key, task, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._discard(*next(iter(self._entries)))
+
+    async def take(self, sender_id: Text, kind: Text, key: Any) -> Any:
+        """The result of sender_id's `kind` prefetch for key (waiting for it if
+        it is still running), or None if there is none."""
+        entry = self._entries.get((sender_id, kind))
+        if entry is None:
+            return None
+        if entry.key != key or time.monotonic() - entry.started_at > self.ttl:
+            # the prediction was wrong or is too old to trust
+            self._discard(sender_id, kind)
+            return None
+        del self._entries[(sender_id, kind)]
+        result = await entry.task
+        if result is None:
+            self.wasted += 1
+            PREFETCHES.inc(kind=kind, outcome="wasted")
+        else:
+            self.hits += 1
+            PREFETCHES.inc(kind=kind, outcome="hit")
+        return result
+
+    def cancel(self, sender_id: Text, kind: Optional[Text] = None) -> None:
+        """Drop sender_id's prefetches (of one kind, or all of them)."""
+        for entry_sender, entry_kind in list(self._entries):
+            if entry_sender == sender_id and kind in (None, entry_kind):
+                self._discard(entry_sender, entry_kind)
+
+    def stats(self) -> Dict[Text, Any]:
+        used = self.hits + self.wasted
+        return {
+            "inflight": self.inflight,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "dropped": self.dropped,
+            "hit_rate": self.hits / used if used else 0.0,
+        }
+
+    async def _run(self, kind: Text, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await fetch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            PREFETCHES.inc(kind=kind, outcome="failed")
+            logger.debug("Prefetch of %s failed: %s", kind, e)
+            return None
+
+    def _finished(self, task: "asyncio.Task") -> None:
+        self.inflight -= 1
+
+    def _discard(self, sender_id: Text, kind: Text) -> None:
+        entry = self._entries.pop((sender_id, kind))
+        entry.task.cancel()
+        self.wasted += 1
+        PREFETCHES.inc(kind=kind, outcome="wasted")
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            (sender_id, kind), entry = next(iter(self._entries.items()))
+            if now - entry.started_at <= self.ttl:
+                return
+            self._discard(sender_id, kind)
+
+
+# Shared by every action in this process
+prefetcher = Prefetcher(
+    max_inflight=settings.PREFETCH_MAX_INFLIGHT,
+    ttl=settings.PREFETCH_TTL_SECONDS,
+    max_entries=settings.RESULT_STORE_SIZE,
+    enabled=settings.PREFETCH_ENABLED,
+)
+REGISTRY.register_stats("closet_prefetch", prefetcher.stats)
@@ -0,0 +1,76 @@
+# The catalog as seen by the actions, behind one interface:
+#
+#   count()                          number of posts
+#   filter(search_terms, color_ids)  post_ids matching item_type/color, in catalog order
+#   match_name(item_name, post_ids)  {post_id: score} for posts matching item_name
+#   features(post_ids)               {post_id: (lowercase title, category bitset)}, for ranking
+#   posts(post_ids) / get(post_id)   post records shaped like /api/posts-all
+#   sample(n)                        the first n posts
+#
+# CATALOG_PROVIDER picks the implementation: "http" (default) keeps the
+# whole /api/posts-all snapshot in memory and searches it with the
+# SearchIndex, "sqlite" queries closet_circle_database.db directly and only
+# loads the posts that matched (see catalog_sqlite.py).
+
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Text
+
+from metrics import REGISTRY
+
+from . import settings
+from .catalog import CatalogCache, catalog
+from .catalog_sqlite import SQLiteCatalog
+from .fuzzy import FuzzyMatcher, fuzzy_matcher
+from .search import SearchIndex, search_index
+
+
+class HttpCatalogProvider:
+    """The cached /api/posts-all snapshot, searched in memory."""
+
+    def __init__(self, cache: CatalogCache, index: SearchIndex, matcher: FuzzyMatcher):
+        self.cache = cache
+        self.index = index
+        self.matcher = matcher
+
+    async def count(self) -> int:
+        return len(await self.cache.asnapshot())
+
+    async def filter(self, search_terms: List[Text], color_ids: Optional[List[int]]) -> List[Any]:
+        # the index is filled from the snapshot, so make sure there is one
+        await self.cache.asnapshot()
+        return self.index.filter(search_terms, color_ids)
+
+    async def match_name(self, item_name: Text, post_ids: Iterable[Any]) -> Dict[Any, int]:
+        return self.matcher.match(item_name, post_ids)
+
+    async def features(self, post_ids: Iterable[Any]) -> Dict[Any, Any]:
+        return self.index.features(post_ids)
+
+    async def posts(self, post_ids: Iterable[Any]) -> List[Dict[Text, Any]]:
+        snapshot = await self.cache.asnapshot()
+        return [snapshot[post_id] for post_id in post_ids if post_id in snapshot]
+
+    async def get(self, post_id: Any) -> Optional[Dict[Text, Any]]:
+        return await self.cache.aget(post_id)
+
+    async def sample(self, n: int) -> List[Dict[Text, Any]]:
+        return list(islice((await self.cache.asnapshot()).values(), n))
+
+
+def _make_provider():
+    if settings.CATALOG_PROVIDER == "sqlite":
+        provider = SQLiteCatalog(
+            settings.CATALOG_DB_PATH,
+            pool_size=settings.CATALOG_DB_POOL_SIZE,
+            timeout=settings.API_TIMEOUT,
+            fuzzy_mode=settings.FUZZY_MATCH_MODE,
+        )
+        REGISTRY.register_stats("closet_catalog_sqlite", provider.stats)
+        return provider
+    if settings.CATALOG_PROVIDER != "http":
+        raise ValueError(f"Unknown catalog provider: {settings.CATALOG_PROVIDER}")
+    return HttpCatalogProvider(catalog, search_index, fuzzy_matcher)
+
+
+# Shared by every action in this process
+catalog_provider = _make_provider()
@@ -0,0 +1,74 @@
+# Ranking of ActionFindItem results.
+#
+# Matches used to be shown in catalog order, and every one of them was
+# loaded and stored for paging. Now each candidate gets a score from
+#
+#   - how well item_name matched (the fuzzy score, 100 for a substring)
+#   - how strongly the title matches item_type: the word the user said beats
+#     a synonym, a whole word beats a substring
+#   - how many of the requested colors the post has
+#
+# and the candidates go into a heap. Only the best SEARCH_TOP_K are loaded
+# for the first answer; further pages are popped from the heap (and loaded)
+# as the user asks for "next". Ties keep catalog order.
+
+import heapq
+from typing import Any, Dict, Iterable, List, Optional, Text, Tuple
+
+from .records import category_bits
+
+NAME_WEIGHT = 0.5
+TYPE_WEIGHT = 0.3
+COLOR_WEIGHT = 0.2
+
+
+def type_strength(title: Text, item_type: Optional[Text], search_terms: List[Text]) -> float:
+    """How strongly a (lowercase) title matches the requested item_type."""
+    if not search_terms:
+        return 0.0
+    words = title.split()
+    requested = item_type.lower() if item_type else None
+    if requested and requested in title:
+        return 1.0 if requested in words else 0.8
+    strength = 0.0
+    for term in search_terms:
+        if term in title:
+            if term in words:
+                return 0.6
+            strength = 0.4
+    return strength
+
+
+class RankedResults:
+    """Scored post_ids, handed out best first."""
+
+    def __init__(self, scored: Iterable[Tuple[float, int, Any]]):
+        # (-score, catalog position, post_id): heapq pops the smallest
+        self._heap = [(-score, position, post_id) for score, position, post_id in scored]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def take(self, n: int) -> List[Any]:
+        """Remove and return the n best remaining post_ids."""
+        return [heapq.heappop(self._heap)[2] for _ in range(min(n, len(self._heap)))]
+
+
+def rank(candidate_ids: List[Any], features: Dict[Any, Tuple[Text, int]], item_type: Optional[Text],
+         search_terms: List[Text], color_ids: Optional[List[int]],
+         name_scores: Optional[Dict[Any, int]]) -> RankedResults:
+    """Score candidate_ids (in catalog order) using their lowercase title and
+    category bitset from features, and the item_name scores if any."""
+    wanted_colors = category_bits(color_ids or [])
+    n_colors = len(color_ids or [])
+    scored = []
+    for position, post_id in enumerate(candidate_ids):
+        title, categories = features.get(post_id, ("", 0))
+        score = TYPE_WEIGHT * type_strength(title, item_type, search_terms)
+        if n_colors:
+            score += COLOR_WEIGHT * bin(categories & wanted_colors).count("1") / n_colors
+        if name_scores:
+            score += NAME_WEIGHT * name_scores.get(post_id, 0) / 100
+        scored.append((score, position, post_id))
+    return RankedResults(scored)
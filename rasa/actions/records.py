@@ -0,0 +1,144 @@
+# Compact in-process representation of catalog posts.
+#
+# /api/posts-all returns one dict per post, and every post carries its own
+# copies of strings that repeat across the catalog (condition, size, owner,
+# lister name), plus a lister dict and an images list. Every action server
+# worker holds the whole catalog, so on large catalogs this adds up. A
+# PostRecord keeps instead
+#
+#   - the fields searches and listings read (post_id, title, price, ...) in
+#     __slots__, with the categories as one int bitset
+#   - repeated strings interned, so each distinct value is stored once
+#   - one shared lister tuple per owner
+#   - the description as UTF-8 bytes, decoded only when it is read (the
+#     search index reads it for item_name matching instead of keeping its
+#     own copy)
+#   - images packed into a single JSON blob, decoded only when a post is
+#     actually shown
+#
+# Records support the read-only dict access the actions use (get(), [] and
+# to_post() for the full /api/posts-all shape), so they can stand in for the
+# post dicts.
+
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Text, Tuple
+
+_HOT_FIELDS = (
+    "post_id", "closet_id", "owner_id", "title", "likes", "date_posted", "item_condition",
+    "size", "price", "bflag", "sflag", "rental_end_date",
+)
+_INTERNED_FIELDS = frozenset(("owner_id", "date_posted", "item_condition", "size"))
+_DETAIL_FIELDS = ("images",)
+_LISTER_KEYS = ("display", "username", "avatarUrl")
+_KNOWN_FIELDS = frozenset(_HOT_FIELDS + _DETAIL_FIELDS + ("description", "categories", "lister"))
+
+# one tuple per distinct lister, shared by all of their posts
+_listers: Dict[Tuple, Tuple] = {}
+
+_encode_details = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def category_bits(categories: Iterable[int]) -> int:
+    """A set of category ids as an int with bit category_id set for each."""
+    bits = 0
+    for category_id in categories:
+        bits |= 1 << int(category_id)
+    return bits
+
+
+def categories_of(bits: int) -> List[int]:
+    """The category ids in a category_bits() bitset, ascending."""
+    return [category_id for category_id in range(bits.bit_length()) if bits >> category_id & 1]
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class PostRecord:
+    """One catalog post, stored compactly. Treat it as read-only."""
+
+    __slots__ = _HOT_FIELDS + ("category_bits", "_lister", "_description", "_details", "_extra")
+
+    @classmethod
+    def from_post(cls, post: Dict[Text, Any]) -> "PostRecord":
+        record = cls.__new__(cls)
+        for field in _HOT_FIELDS:
+            value = post.get(field)
+            setattr(record, field, _intern(value) if field in _INTERNED_FIELDS else value)
+        record.category_bits = category_bits(post.get("categories") or [])
+        lister = post.get("lister")
+        if isinstance(lister, dict):
+            lister = tuple(_intern(lister.get(key)) for key in _LISTER_KEYS)
+            lister = _listers.setdefault(lister, lister)
+        record._lister = lister
+        description = post.get("description")
+        record._description = description.encode() if isinstance(description, str) else description
+        details = {field: post[field] for field in _DETAIL_FIELDS if field in post}
+        record._details = _encode_details(details).encode()
+        # columns this module doesn't know about yet are kept as they are
+        record._extra = {key: value for key, value in post.items() if key not in _KNOWN_FIELDS} or None
+        return record
+
+    @property
+    def categories(self) -> List[int]:
+        return categories_of(self.category_bits)
+
+    @property
+    def description(self) -> Any:
+        if isinstance(self._description, bytes):
+            return self._description.decode()
+        return self._description
+
+    def details(self) -> Dict[Text, Any]:
+        """Description and images, decoded from the packed data."""
+        details = json.loads(self._details)
+        details["description"] = self.description
+        return details
+
+    def get(self, key: Text, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key: Text) -> Any:
+        if key in _HOT_FIELDS:
+            return getattr(self, key)
+        if key == "description":
+            return self.description
+        if key == "categories":
+            return self.categories
+        if key == "lister":
+            if self._lister is None:
+                raise KeyError(key)
+            return dict(zip(_LISTER_KEYS, self._lister))
+        if key in _DETAIL_FIELDS:
+            return self.details()[key]
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def to_post(self) -> Dict[Text, Any]:
+        """The post as a plain dict, shaped like /api/posts-all."""
+        post = {field: getattr(self, field) for field in _HOT_FIELDS}
+        post.update(self.details())
+        post.update(self._extra or {})
+        post["categories"] = self.categories
+        if self._lister is not None:
+            post["lister"] = dict(zip(_LISTER_KEYS, self._lister))
+        return post
+
+    def _values(self) -> Tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PostRecord):
+            return NotImplemented
+        return self._values() == other._values()
+
+    __hash__ = None
+
+    def __repr__(self) -> Text:
+        return f"PostRecord(post_id={self.post_id!r}, title={self.title!r})"
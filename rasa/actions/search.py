@@ -0,0 +1,232 @@
+# Inverted index over the catalog for ActionFindItem.
+#
+# Instead of scanning every post on every search, the index keeps
+#
+#   - category_id -> post_ids            (color filter)
+#   - title trigram -> post_ids          (item_type synonym filter)
+#   - item_type term -> post_ids         (memoized for the known synonyms)
+#
+# so a query becomes a few set intersections and only the surviving
+# candidates are checked and put back in catalog order. The index is kept up
+# to date incrementally through CatalogCache listeners.
+#
+# Descriptions are only needed for item_name matching, so the index doesn't
+# copy them: it keeps a reference to each post and reads the description
+# (packed in PostRecords) when a candidate is checked. The title/description
+# trigram postings behind the fuzzy trigram prefilter are several times the
+# size of the catalog itself, so they are only built when that prefilter is
+# on (text_grams=True).
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Text
+
+from . import settings
+from .catalog import catalog
+from .records import PostRecord, categories_of, category_bits
+
+# Related terms for item types (for better matching)
+ITEM_TYPE_SYNONYMS = {
+    "shoes": ["shoes", "sneakers", "boots", "heels", "sandals", "loafers", "cleats", "footwear", "pumps"],
+    "shirt": ["shirt", "top", "tee", "t-shirt", "blouse", "button up"],
+    "pants": ["pants", "trousers", "slacks", "chinos", "leggings", "jeans"],
+    "jacket": ["jacket", "blazer", "coat", "cardigan", "sweater", "hoodie", "puffer"],
+    "dress": ["dress", "gown", "frock", "sundress"],
+    "skirt": ["skirt", "miniskirt"],
+    "shorts": ["shorts"],
+    "jeans": ["jeans", "denim"],
+}
+
+# item_type terms whose postings the index memoizes; other terms come from
+# the NLU and are looked up without being cached
+_MEMOIZED_TERMS = frozenset(term for synonyms in ITEM_TYPE_SYNONYMS.values() for term in synonyms)
+
+# Color names to category IDs from the database
+COLOR_CATEGORY_IDS = {
+    "black": 10,
+    "white": 11,
+    "red": 12,
+    "blue": 13,
+    "green": 14,
+    "pink": 15,
+}
+
+
+def search_terms_for(item_type: Optional[Text]) -> List[Text]:
+    """All synonyms for an item_type (or just the item_type itself)."""
+    if not item_type:
+        return []
+    item_type = item_type.lower()
+    for key, synonyms in ITEM_TYPE_SYNONYMS.items():
+        if item_type in synonyms or item_type == key:
+            return synonyms
+    return [item_type]
+
+
+def trigrams(text: Text) -> Set[Text]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, text_grams: bool = False):
+        self._lock = threading.Lock()
+        self._position: Dict[Any, int] = {}
+        self._next_position = 0
+        self._titles: Dict[Any, Text] = {}
+        # post_id -> the post itself, for its description
+        self._posts: Dict[Any, Dict[Text, Any]] = {}
+        # post_id -> category bitset (see records.category_bits)
+        self._categories: Dict[Any, int] = {}
+        self._by_category: Dict[int, Set[Any]] = {}
+        self._title_grams: Dict[Text, Set[Any]] = {}
+        self._text_grams: Optional[Dict[Text, Set[Any]]] = {} if text_grams else None
+        self._term_cache: Dict[Text, Set[Any]] = {}
+
+    def apply(self, order: Optional[List[Any]], upserted: Iterable[Dict[Text, Any]], removed: Iterable[Any]) -> None:
+        """CatalogCache listener: index changed posts and drop removed ones."""
+        with self._lock:
+            for post_id in removed:
+                self._remove(post_id)
+                self._position.pop(post_id, None)
+            for post in upserted:
+                post_id = post.get("post_id")
+                self._remove(post_id)
+                self._add(post_id, post)
+                if order is None and post_id not in self._position:
+                    # new posts go after every existing one; gaps left by
+                    # removed posts don't matter for sorting
+                    self._position[post_id] = self._next_position
+                    self._next_position += 1
+            if order is not None:
+                self._position = {post_id: i for i, post_id in enumerate(order)}
+                self._next_position = len(order)
+
+    def filter(self, search_terms: List[Text], color_ids: Optional[List[int]]) -> List[Any]:
+        """post_ids whose title contains any of search_terms (if given) and that
+        are in any of color_ids (if given), in catalog order."""
+        with self._lock:
+            candidates: Optional[Set[Any]] = None
+            if color_ids:
+                candidates = set()
+                for color_id in color_ids:
+                    candidates |= self._by_category.get(color_id, set())
+            if search_terms:
+                typed: Set[Any] = set()
+                for term in search_terms:
+                    typed |= self._posts_with_term(term)
+                candidates = typed if candidates is None else candidates & typed
+            if candidates is None:
+                candidates = set(self._position)
+            return sorted(candidates, key=lambda post_id: self._position.get(post_id, len(self._position)))
+
+    def containing(self, text: Text, post_ids: Optional[Iterable[Any]] = None) -> Set[Any]:
+        """post_ids whose title or description contains text (lowercase)."""
+        with self._lock:
+            if post_ids is None:
+                post_ids = list(self._titles)
+            return {
+                post_id for post_id in post_ids
+                if post_id in self._titles
+                and (text in self._titles[post_id] or text in self._description(post_id))
+            }
+
+    def sharing_trigrams(self, text: Text, post_ids: Iterable[Any]) -> Set[Any]:
+        """The subset of post_ids whose title or description shares at least
+        one trigram with text (all of post_ids if text is too short, or the
+        index was built without text_grams)."""
+        post_ids = set(post_ids)
+        grams = trigrams(text)
+        if not grams or self._text_grams is None:
+            return post_ids
+        with self._lock:
+            hits: Set[Any] = set()
+            for g in grams:
+                hits |= self._text_grams.get(g, set())
+        return post_ids & hits
+
+    def texts(self, post_ids: Iterable[Any]) -> Dict[Any, Any]:
+        """Lowercased (title, description) for each indexed post_id."""
+        with self._lock:
+            return {
+                post_id: (self._titles[post_id], self._description(post_id))
+                for post_id in post_ids if post_id in self._titles
+            }
+
+    def features(self, post_ids: Iterable[Any]) -> Dict[Any, Any]:
+        """Lowercased title and category bitset for each indexed post_id."""
+        with self._lock:
+            return {
+                post_id: (self._titles[post_id], self._categories[post_id])
+                for post_id in post_ids if post_id in self._titles
+            }
+
+    def _posts_with_term(self, term: Text) -> Set[Any]:
+        # caller holds self._lock
+        posting = self._term_cache.get(term)
+        if posting is None:
+            candidates = self._lookup(self._title_grams, term, self._titles)
+            posting = {post_id for post_id in candidates if term in self._titles[post_id]}
+            if term in _MEMOIZED_TERMS:
+                self._term_cache[term] = posting
+        return posting
+
+    def _description(self, post_id: Any) -> Text:
+        # caller holds self._lock
+        post = self._posts[post_id]
+        description = post.description if isinstance(post, PostRecord) else post.get("description")
+        return (description or "").lower()
+
+    @staticmethod
+    def _lookup(grams_index: Dict[Text, Set[Any]], text: Text, everything: Dict[Any, Text]) -> Set[Any]:
+        # Posts that contain every trigram of text; these still need an
+        # exact substring check. Short strings have no trigrams to go on.
+        grams = trigrams(text)
+        if not grams:
+            return set(everything)
+        postings = sorted((grams_index.get(g, set()) for g in grams), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def _add(self, post_id: Any, post: Dict[Text, Any]) -> None:
+        title = (post.get("title") or "").lower()
+        categories = post.get("categories") or []
+        self._titles[post_id] = title
+        self._posts[post_id] = post
+        self._categories[post_id] = category_bits(categories)
+        for category_id in categories:
+            self._by_category.setdefault(category_id, set()).add(post_id)
+        for g in trigrams(title):
+            self._title_grams.setdefault(g, set()).add(post_id)
+        if self._text_grams is not None:
+            description = (post.get("description") or "").lower()
+            for g in trigrams(title) | trigrams(description):
+                self._text_grams.setdefault(g, set()).add(post_id)
+        for term, posting in self._term_cache.items():
+            if term in title:
+                posting.add(post_id)
+
+    def _remove(self, post_id: Any) -> None:
+        if post_id not in self._titles:
+            return
+        title = self._titles.pop(post_id)
+        post = self._posts.pop(post_id)
+        for category_id in categories_of(self._categories.pop(post_id)):
+            self._by_category[category_id].discard(post_id)
+        for g in trigrams(title):
+            self._title_grams[g].discard(post_id)
+        if self._text_grams is not None:
+            description = (post.get("description") or "").lower()
+            for g in trigrams(title) | trigrams(description):
+                self._text_grams[g].discard(post_id)
+        for posting in self._term_cache.values():
+            posting.discard(post_id)
+
+
+# Shared by every action in this process, kept in sync as the catalog refreshes
+search_index = SearchIndex(
+    text_grams=settings.FUZZY_MATCH_MODE == "indexed" and settings.FUZZY_TRIGRAM_PREFILTER
+)
+catalog.add_listener(search_index.apply)
@@ -0,0 +1,93 @@
+# Runtime settings for the action server.
+#
+# Everything here can be overridden with environment variables so the
+# action server can be pointed at a different backend (or tuned) without
+# editing code, e.g. CATALOG_TTL_SECONDS=60 rasa run actions
+
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Base URL of the Node/Express backend
+API_BASE_URL = os.environ.get("CLOSET_CIRCLE_API_URL", "http://localhost:8800").rstrip("/")
+
+# Timeout (seconds) for requests to the backend
+API_TIMEOUT = _env_float("CLOSET_CIRCLE_API_TIMEOUT", 5)
+
+# Retries for backend calls that are safe to repeat, with exponential
+# backoff starting at API_RETRY_BACKOFF seconds
+API_RETRIES = _env_int("CLOSET_CIRCLE_API_RETRIES", 2)
+API_RETRY_BACKOFF = _env_float("CLOSET_CIRCLE_API_RETRY_BACKOFF", 0.1)
+
+# Maximum number of pooled keep-alive connections to the backend
+API_POOL_SIZE = _env_int("CLOSET_CIRCLE_API_POOL_SIZE", 100)
+
+# How long a catalog snapshot is considered fresh before it is refreshed
+# in the background
+CATALOG_TTL_SECONDS = _env_float("CATALOG_TTL_SECONDS", 30)
+
+# Refresh the catalog from /api/posts-changes (only what changed since the
+# last refresh) instead of downloading it whole, with a full download every
+# CATALOG_RECONCILE_SECONDS to catch drift
+CATALOG_DELTA_SYNC = _env_bool("CATALOG_DELTA_SYNC", True)
+CATALOG_RECONCILE_SECONDS = _env_float("CATALOG_RECONCILE_SECONDS", 600)
+
+# Keep the cached catalog as compact post records (interned strings, packed
+# descriptions) instead of the dicts /api/posts-all returns
+CATALOG_COMPACT = _env_bool("CATALOG_COMPACT", True)
+
+# Where the actions read the catalog from: "http" (/api/posts-all, cached
+# in memory) or "sqlite" (the backend's database file, queried read-only)
+CATALOG_PROVIDER = os.environ.get("CATALOG_PROVIDER", "http")
+CATALOG_DB_PATH = os.environ.get(
+    "CATALOG_DB_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "server", "databases", "closet_circle_database.db"),
+)
+
+# Maximum number of pooled read-only connections to CATALOG_DB_PATH
+CATALOG_DB_POOL_SIZE = _env_int("CATALOG_DB_POOL_SIZE", 8)
+
+# How item_name is fuzzy matched: "indexed" (trigram prefilter + bulk
+# scoring) or "reference" (the original per-post loop)
+FUZZY_MATCH_MODE = os.environ.get("FUZZY_MATCH_MODE", "indexed")
+
+# Only fuzzy-score posts that share a character trigram with item_name.
+# Faster, but it misses some matches the reference loop finds, and the
+# search index needs extra trigram postings for it
+FUZZY_TRIGRAM_PREFILTER = _env_bool("FUZZY_TRIGRAM_PREFILTER", False)
+
+# Search results loaded per page: the best SEARCH_TOP_K matches are loaded
+# for the first answer, the next ones only when the user pages that far
+SEARCH_TOP_K = _env_int("SEARCH_TOP_K", 10)
+
+# Speculative prefetch of the likely next turn ("next" or "book") while the
+# user reads the current item: at most PREFETCH_MAX_INFLIGHT at once, and
+# results older than PREFETCH_TTL_SECONDS are not used (a cart id can go
+# stale when the user checks out on the website)
+PREFETCH_ENABLED = _env_bool("PREFETCH_ENABLED", True)
+PREFETCH_MAX_INFLIGHT = _env_int("PREFETCH_MAX_INFLIGHT", 32)
+PREFETCH_TTL_SECONDS = _env_float("PREFETCH_TTL_SECONDS", 30)
+
+# Search results kept server-side for paging with "next"
+RESULT_STORE_SIZE = _env_int("RESULT_STORE_SIZE", 1000)
+RESULT_TTL_SECONDS = _env_float("RESULT_TTL_SECONDS", 3600)
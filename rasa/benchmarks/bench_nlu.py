@@ -0,0 +1,346 @@
+# OllamaNLU throughput and accuracy over the annotated examples in data/nlu.yml.
+#
+# Replays every example (plus optional synthetic searches) through
+# OllamaNLU.process against a StubOllama and reports messages/sec, latency
+# percentiles per process() call, fast-path and cache hit rates, and intent
+# and entity accuracy against the annotations.
+#
+# By default the stub answers like an "oracle" model (the annotation,
+# normalized the way the prompt asks for), so the numbers measure the
+# component itself: batching, streaming, caching, the fast path and
+# validation. --responses replays answers recorded from a real model, which
+# --upstream/--record produce:
+#
+#   cd rasa
+#   python benchmarks/bench_nlu.py --upstream http://localhost:11434 --record benchmarks/llama3_responses.json
+#   python benchmarks/bench_nlu.py --responses benchmarks/llama3_responses.json
+#
+# For CI, --save writes the results as JSON and --baseline compares a run
+# against saved results; the script exits non-zero when latency or accuracy
+# regressed by more than the allowed margin, or when an absolute limit
+# (--max-p95-ms, --min-intent-accuracy, ...) is not met:
+#
+#   python benchmarks/bench_nlu.py --synthetic 500 --rounds 2 --save nlu_baseline.json     # on main
+#   python benchmarks/bench_nlu.py --synthetic 500 --rounds 2 --baseline nlu_baseline.json  # on the change
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_ollama import StubOllama  # noqa: E402
+
+RASA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ANNOTATION = re.compile(r"\[([^\]]+)\]\((\w+)\)")
+
+# (entity, value); a value of None matches any value of that entity
+ExpectedEntity = Tuple[Text, Optional[Text]]
+
+
+class Example:
+    def __init__(self, text: Text, intent: Text, entities: List[Dict[Text, Any]]):
+        self.text = text
+        self.intent = intent
+        # entities as annotated: entity, value, start, end
+        self.entities = entities
+
+
+def parse_example(line: Text, intent: Text) -> Example:
+    """Turn "find me a [red](color) [shirt](item_type)" into plain text and entity spans."""
+    text, entities, last = "", [], 0
+    for match in _ANNOTATION.finditer(line):
+        text += line[last:match.start()]
+        value, entity = match.group(1), match.group(2)
+        entities.append({"entity": entity, "value": value, "start": len(text), "end": len(text) + len(value)})
+        text += value
+        last = match.end()
+    return Example(text + line[last:], intent, entities)
+
+
+def load_examples(path: Text) -> List[Example]:
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    examples = []
+    for block in data.get("nlu", []):
+        if "intent" not in block:
+            continue
+        for line in block.get("examples", "").splitlines():
+            line = line.strip()
+            if line.startswith("- "):
+                examples.append(parse_example(line[2:].strip(), block["intent"]))
+    return examples
+
+
+def synthetic_examples(count: int, seed: int = 0) -> List[Example]:
+    """Search messages built from the shared tables, for extra load."""
+    from components.nlu_tables import COLOR_CATEGORY_IDS, ITEM_TYPE_NORMALIZATION
+
+    rng = random.Random(seed)
+    colors = list(COLOR_CATEGORY_IDS)
+    item_types = [word for name, words in ITEM_TYPE_NORMALIZATION.items() for word in [name] + words]
+    brands = ["Nike", "Zara", "Levi's", "Patagonia", "Uniqlo", "H&M", "Gucci", "Carhartt"]
+    templates = [
+        "show me a [{color}](color) [{item_type}](item_type)",
+        "do you have any [{color}](color) [{item_type}](item_type)",
+        "I'm looking for [{brand} {item_type}](item_name)",
+        "find me a [{color}](color) [{brand}](item_name) [{item_type}](item_type) please",
+        "any [{color}](color) or [{color2}](color) [{item_type}](item_type)?",
+    ]
+    examples = []
+    for _ in range(count):
+        line = rng.choice(templates).format(
+            color=rng.choice(colors), color2=rng.choice(colors),
+            item_type=rng.choice(item_types), brand=rng.choice(brands),
+        )
+        examples.append(parse_example(line, "find_item"))
+    return examples
+
+
+def normalizers():
+    from components.fast_path import _build_item_types
+    from components.nlu_tables import COLOR_CATEGORY_IDS
+
+    item_types = {" ".join(words): normalized for words, normalized in _build_item_types().items()}
+    return COLOR_CATEGORY_IDS, item_types
+
+
+def expected_entities(example: Example, color_ids: Dict[Text, Text],
+                      item_types: Dict[Text, Text]) -> List[ExpectedEntity]:
+    """The entities OllamaNLU should return, normalized the way the prompt asks for."""
+    expected = []
+    for e in example.entities:
+        value = e["value"].lower()
+        if e["entity"] == "color":
+            # colors outside the table map to "the closest" one, which we can't check
+            expected.append(("color", color_ids.get(value)))
+        elif e["entity"] == "item_type":
+            # item types outside the table are not extracted
+            if value in item_types:
+                expected.append(("item_type", item_types[value]))
+        else:
+            expected.append((e["entity"], value))
+    return expected
+
+
+def oracle_response(example: Example, color_ids: Dict[Text, Text], item_types: Dict[Text, Text]) -> Text:
+    """What a perfect model would answer for `example`, in the prompt's JSON format."""
+    entities, colors = [], [e for e in example.entities if e["entity"] == "color"]
+    if colors:
+        entities.append({
+            "entity": "color",
+            "value": [color_ids.get(e["value"].lower(), e["value"].lower()) for e in colors],
+            "start": colors[0]["start"], "end": colors[-1]["end"],
+        })
+    for e in example.entities:
+        if e["entity"] == "item_type" and e["value"].lower() in item_types:
+            entities.append({**e, "value": item_types[e["value"].lower()]})
+        elif e["entity"] == "item_name":
+            entities.append(e)
+    return json.dumps({"intent": example.intent, "entities": entities})
+
+
+def predicted_entities(entities: List[Dict[Text, Any]]) -> List[Tuple[Text, Text]]:
+    predicted = []
+    for e in entities:
+        values = e["value"] if isinstance(e["value"], list) else [e["value"]]
+        predicted.extend((e["entity"], str(value).lower()) for value in values)
+    return predicted
+
+
+def score_entities(expected: List[ExpectedEntity], predicted: List[Tuple[Text, Text]]) -> Tuple[int, int, int]:
+    """(true positives, expected count, predicted count)"""
+    remaining = list(predicted)
+    hits = 0
+    for entity, value in expected:
+        for candidate in remaining:
+            if candidate[0] == entity and (value is None or candidate[1] == value):
+                remaining.remove(candidate)
+                hits += 1
+                break
+    return hits, len(expected), len(predicted)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(examples: List[Example], nlu: Any, batch_size: int, rounds: int) -> Dict[Text, Any]:
+    from rasa.shared.nlu.training_data.message import Message
+
+    color_ids, item_types = normalizers()
+    latencies: List[float] = []
+    intents_right = 0
+    entity_hits = entity_expected = entity_predicted = 0
+    mistakes: Dict[Text, int] = {}
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for i in range(0, len(examples), batch_size):
+            batch = examples[i:i + batch_size]
+            messages = [Message(data={"text": example.text}) for example in batch]
+            call_started = time.perf_counter()
+            nlu.process(messages)
+            latencies.append(time.perf_counter() - call_started)
+
+            for example, message in zip(batch, messages):
+                intent = message.get("intent")["name"]
+                if intent == example.intent:
+                    intents_right += 1
+                else:
+                    key = f"{example.intent} -> {intent}"
+                    mistakes[key] = mistakes.get(key, 0) + 1
+                hits, n_expected, n_predicted = score_entities(
+                    expected_entities(example, color_ids, item_types),
+                    predicted_entities(message.get("entities") or []),
+                )
+                entity_hits += hits
+                entity_expected += n_expected
+                entity_predicted += n_predicted
+    elapsed = time.perf_counter() - started
+
+    total = len(examples) * rounds
+    stats = nlu.stats()
+    precision = entity_hits / entity_predicted if entity_predicted else 1.0
+    recall = entity_hits / entity_expected if entity_expected else 1.0
+    return {
+        "messages": total,
+        "seconds": elapsed,
+        "messages_per_sec": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "fast_path_rate": stats["fast_path_rate"],
+        "cache_hit_rate": stats["cache"].get("hit_rate", 0.0),
+        "llm_calls": stats["llm"]["calls"],
+        "intent_accuracy": intents_right / total,
+        "entity_precision": precision,
+        "entity_recall": recall,
+        "entity_f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "intent_mistakes": dict(sorted(mistakes.items(), key=lambda item: -item[1])),
+    }
+
+
+def check(results: Dict[Text, Any], args: argparse.Namespace) -> List[Text]:
+    """Human-readable list of the regressions and unmet limits, empty if all good."""
+    failures = []
+    limits = [
+        ("p95_ms", args.max_p95_ms, "max"),
+        ("messages_per_sec", args.min_throughput, "min"),
+        ("intent_accuracy", args.min_intent_accuracy, "min"),
+        ("entity_f1", args.min_entity_f1, "min"),
+    ]
+    for key, limit, kind in limits:
+        if limit is None:
+            continue
+        if (kind == "max" and results[key] > limit) or (kind == "min" and results[key] < limit):
+            failures.append(f"{key}={results[key]:.3f} is over the limit of {limit}" if kind == "max"
+                            else f"{key}={results[key]:.3f} is under the limit of {limit}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("p95_ms", "p99_ms"):
+            allowed = baseline[key] * (1 + args.max_latency_regression)
+            if results[key] > allowed:
+                failures.append(f"{key}={results[key]:.1f} regressed from {baseline[key]:.1f} (allowed {allowed:.1f})")
+        allowed = baseline["messages_per_sec"] * (1 - args.max_latency_regression)
+        if results["messages_per_sec"] < allowed:
+            failures.append(f"messages_per_sec={results['messages_per_sec']:.1f} regressed from "
+                            f"{baseline['messages_per_sec']:.1f} (allowed {allowed:.1f})")
+        for key in ("intent_accuracy", "entity_f1"):
+            allowed = baseline[key] - args.max_accuracy_drop
+            if results[key] < allowed:
+                failures.append(f"{key}={results[key]:.3f} regressed from {baseline[key]:.3f} (allowed {allowed:.3f})")
+    return failures
+
+
+def parse_overrides(pairs: List[Text]) -> Dict[Text, Any]:
+    """--config key=value pairs for the component, values parsed as YAML scalars."""
+    overrides = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        overrides[key] = yaml.safe_load(value)
+    return overrides
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark OllamaNLU speed and accuracy on the NLU examples")
+    parser.add_argument("--nlu", default=os.path.join(RASA_DIR, "data", "nlu.yml"), help="annotated examples")
+    parser.add_argument("--synthetic", type=int, default=0, help="extra generated search messages")
+    parser.add_argument("--rounds", type=int, default=1, help="passes over the messages (later ones hit the cache)")
+    parser.add_argument("--batch-size", type=int, default=1, help="messages per process() call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE", help="OllamaNLU config overrides")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub prompt evaluation latency per call")
+    parser.add_argument("--token-ms", type=float, default=2, help="stub latency per generated token")
+    parser.add_argument("--responses", help="JSON file of recorded responses (message text -> model response)")
+    parser.add_argument("--upstream", help="real Ollama to ask for messages without a recorded response")
+    parser.add_argument("--record", help="write the responses fetched from --upstream to this file")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--max-latency-regression", type=float, default=0.2,
+                        help="allowed fractional latency/throughput regression against the baseline")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01,
+                        help="allowed absolute accuracy drop against the baseline")
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--min-throughput", type=float, help="messages/sec")
+    parser.add_argument("--min-intent-accuracy", type=float)
+    parser.add_argument("--min-entity-f1", type=float)
+    args = parser.parse_args()
+
+    from components.OllamaNLU import OllamaNLU
+
+    examples = load_examples(args.nlu) + synthetic_examples(args.synthetic, args.seed)
+    random.Random(args.seed).shuffle(examples)
+
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    elif args.upstream:
+        responses = {}
+    else:
+        color_ids, item_types = normalizers()
+        responses = {example.text: oracle_response(example, color_ids, item_types) for example in examples}
+    stub = StubOllama(responses, latency_ms=args.latency_ms, token_ms=args.token_ms, upstream=args.upstream).start()
+
+    config = {"url": stub.url, "health_check_interval": None, **parse_overrides(args.config)}
+    nlu = OllamaNLU(config)
+    results = run(examples, nlu, args.batch_size, args.rounds)
+    nlu.close()
+    stub.stop()
+
+    print(f"{results['messages']} messages in {results['seconds']:.2f}s ({results['messages_per_sec']:.1f}/s), "
+          f"batch size {args.batch_size}")
+    print(f"  latency per call: p50={results['p50_ms']:.1f}ms p95={results['p95_ms']:.1f}ms p99={results['p99_ms']:.1f}ms")
+    print(f"  fast path {results['fast_path_rate']:.1%}, cache hits {results['cache_hit_rate']:.1%}, "
+          f"{results['llm_calls']} LLM calls")
+    print(f"  intent accuracy {results['intent_accuracy']:.1%}, entity precision {results['entity_precision']:.1%} "
+          f"recall {results['entity_recall']:.1%} f1 {results['entity_f1']:.1%}")
+    for mistake, count in list(results["intent_mistakes"].items())[:5]:
+        print(f"    {count:>4} x {mistake}")
+
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            json.dump({**responses, **stub.recorded}, f, indent=2, sort_keys=True)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check(results, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Booking latency: the old sync requests chain vs the async ActionBookItem.
+#
+# Both paths run against a local StubBackend with injected per-request
+# latency, with --users concurrent shoppers booking --bookings items each.
+# The sync path gets a thread per user, which is kinder to it than the real
+# action server (where a sync run() blocks the event loop for everyone).
+#
+#   cd rasa && python benchmarks/booking_latency.py --users 20 --latency-ms 20
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_backend import StubBackend  # noqa: E402
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(label: Text, latencies: List[float], elapsed: float) -> None:
+    print(
+        f"{label:>6}: {len(latencies)} bookings in {elapsed:.2f}s "
+        f"({len(latencies) / elapsed:.1f}/s)  "
+        f"p50={percentile(latencies, 50) * 1000:.1f}ms  "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms  "
+        f"mean={statistics.mean(latencies) * 1000:.1f}ms"
+    )
+
+
+def sync_booking(base_url: Text, email: Text, post_id: int) -> None:
+    """The booking chain as ActionBookItem used to run it."""
+    import requests
+
+    tx_resp = requests.get(f"{base_url}/api/profile/cart/id", params={"email": email}, timeout=5)
+    tx_resp.raise_for_status()
+    transaction_id = tx_resp.json().get("transactionId")
+    if not transaction_id:
+        create_resp = requests.post(f"{base_url}/api/profile/cart/create", json={"email": email}, timeout=5)
+        create_resp.raise_for_status()
+        transaction_id = create_resp.json().get("transactionId")
+    add_resp = requests.put(
+        f"{base_url}/api/profile/cart/addItem",
+        json={"transactionId": transaction_id, "postId": post_id}, timeout=5,
+    )
+    add_resp.raise_for_status()
+    cart_items = requests.get(f"{base_url}/api/profile/cart", params={"email": email}, timeout=5).json().get("cart", [])
+    sum(item.get("price", 0) for item in cart_items)
+
+
+def run_sync(base_url: Text, users: int, bookings: int) -> None:
+    def shopper(user: int) -> List[float]:
+        latencies = []
+        for n in range(bookings):
+            started = time.perf_counter()
+            sync_booking(base_url, f"sync{user}@example.com", 1 + (user * bookings + n) % 50)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        latencies = [lat for result in pool.map(shopper, range(users)) for lat in result]
+    report("sync", latencies, time.perf_counter() - started)
+
+
+async def run_async(users: int, bookings: int) -> None:
+    from rasa_sdk import Tracker
+    from rasa_sdk.executor import CollectingDispatcher
+
+    from actions.actions import ActionBookItem
+    from actions.backend import backend
+
+    action = ActionBookItem()
+
+    async def shopper(user: int) -> List[float]:
+        latencies = []
+        for n in range(bookings):
+            tracker = Tracker(
+                f"async{user}", {"selected_post_id": 1 + (user * bookings + n) % 50},
+                {"text": "book it", "metadata": {"user_email": f"async{user}@example.com"}},
+                [], False, None, None, "",
+            )
+            dispatcher = CollectingDispatcher()
+            started = time.perf_counter()
+            await action.run(dispatcher, tracker, {})
+            latencies.append(time.perf_counter() - started)
+            if "trouble" in dispatcher.messages[0]["text"]:
+                raise RuntimeError(dispatcher.messages[0]["text"])
+        return latencies
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(shopper(user) for user in range(users)))
+    report("async", [lat for result in results for lat in result], time.perf_counter() - started)
+    await backend.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare sync and async booking latency against a stub backend")
+    parser.add_argument("--users", type=int, default=20, help="concurrent shoppers")
+    parser.add_argument("--bookings", type=int, default=10, help="bookings per shopper")
+    parser.add_argument("--latency-ms", type=float, default=20, help="injected backend latency per request")
+    args = parser.parse_args()
+
+    stub = StubBackend(catalog_size=50, latency_ms=args.latency_ms).start()
+    # the actions read their settings on import
+    os.environ["CLOSET_CIRCLE_API_URL"] = stub.url
+
+    print(f"{args.users} users x {args.bookings} bookings, {args.latency_ms:.0f}ms backend latency")
+    run_sync(stub.url, args.users, args.bookings)
+    asyncio.run(run_async(args.users, args.bookings))
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Memory and filter speed of the cached catalog: the /api/posts-all dicts
+# versus compact PostRecords (actions/records.py).
+#
+# Builds a synthetic catalog (stub_backend.make_catalog), round-trips it
+# through JSON like the action server does when it downloads it, and
+# measures with tracemalloc what the snapshot and the search index built over
+# it take, per post and per 100k posts, and their total (what every worker
+# holds). Then times SearchIndex.filter over both for a mix of
+# item_type/color queries, and what it costs to show a post (decode a record
+# back into the /api/posts-all shape).
+#
+# --text-grams builds the index the way FUZZY_TRIGRAM_PREFILTER=1 does, with
+# the extra title/description trigram postings.
+#
+#   cd rasa
+#   python benchmarks/catalog_memory.py --posts 100000
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Text, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_backend import ITEM_TYPES, make_catalog  # noqa: E402
+
+from actions.records import PostRecord  # noqa: E402
+from actions.search import COLOR_CATEGORY_IDS, SearchIndex, search_terms_for  # noqa: E402
+
+
+def measure(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """Build something and return it with the bytes it still holds."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def queries(n: int, seed: int) -> List[Tuple[List[Text], Any]]:
+    rng = random.Random(seed)
+    colors = list(COLOR_CATEGORY_IDS.values())
+    result = []
+    for _ in range(n):
+        item_type = rng.choice(ITEM_TYPES + [None])
+        color_ids = rng.sample(colors, rng.randint(1, 2)) if rng.random() < 0.5 else None
+        if item_type is None and color_ids is None:
+            color_ids = [rng.choice(colors)]
+        result.append((search_terms_for(item_type), color_ids))
+    return result
+
+
+def time_filters(index: SearchIndex, workload: List[Tuple[List[Text], Any]]) -> float:
+    started = time.perf_counter()
+    for search_terms, color_ids in workload:
+        index.filter(search_terms, color_ids)
+    return (time.perf_counter() - started) / len(workload)
+
+
+def run(posts: int, n_queries: int, seed: int, text_grams: bool = False) -> Dict[Text, Dict[Text, float]]:
+    payload = json.dumps({"posts": make_catalog(posts, seed)})
+    workload = queries(n_queries, seed)
+    results = {}
+    for name, convert in (("dicts", None), ("records", PostRecord.from_post)):
+        def build_snapshot():
+            fetched = json.loads(payload)["posts"]
+            if convert is not None:
+                fetched = [convert(post) for post in fetched]
+            return OrderedDict((post.get("post_id"), post) for post in fetched)
+
+        started = time.perf_counter()
+        snapshot, snapshot_bytes = measure(build_snapshot)
+        load_seconds = time.perf_counter() - started
+
+        def build_index():
+            index = SearchIndex(text_grams=text_grams)
+            index.apply(list(snapshot), list(snapshot.values()), [])
+            return index
+
+        index, index_bytes = measure(build_index)
+        time_filters(index, workload[:10])  # warm the term cache, like a running server
+        filter_seconds = time_filters(index, workload)
+
+        shown = list(snapshot.values())[: min(1000, posts)]
+        started = time.perf_counter()
+        for post in shown:
+            post.to_post() if convert is not None else dict(post)
+        show_seconds = (time.perf_counter() - started) / len(shown)
+
+        results[name] = {
+            "snapshot_bytes_per_post": snapshot_bytes / posts,
+            "snapshot_mb_per_100k": snapshot_bytes / posts * 100000 / 2 ** 20,
+            "index_mb_per_100k": index_bytes / posts * 100000 / 2 ** 20,
+            "total_mb_per_100k": (snapshot_bytes + index_bytes) / posts * 100000 / 2 ** 20,
+            "load_seconds": load_seconds,
+            "filter_ms": filter_seconds * 1000,
+            "show_us": show_seconds * 1e6,
+        }
+        del snapshot, index
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare catalog memory and filter speed of dicts vs PostRecords")
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--text-grams", action="store_true", help="index like FUZZY_TRIGRAM_PREFILTER=1")
+    args = parser.parse_args()
+
+    results = run(args.posts, args.queries, args.seed, args.text_grams)
+    print(f"{args.posts} posts, {args.queries} filter queries{', index with text trigrams' if args.text_grams else ''}")
+    for name, row in results.items():
+        print(
+            f"{name:>8}: snapshot {row['snapshot_bytes_per_post']:.0f} B/post "
+            f"({row['snapshot_mb_per_100k']:.1f} MB per 100k)  index {row['index_mb_per_100k']:.1f} MB per 100k  "
+            f"total {row['total_mb_per_100k']:.1f} MB per 100k  "
+            f"load {row['load_seconds']:.2f}s  filter {row['filter_ms']:.2f}ms/query  show {row['show_us']:.1f}us/post"
+        )
+    saved = 1 - results["records"]["snapshot_bytes_per_post"] / results["dicts"]["snapshot_bytes_per_post"]
+    saved_total = 1 - results["records"]["total_mb_per_100k"] / results["dicts"]["total_mb_per_100k"]
+    print(f"records use {saved:.0%} less snapshot memory, {saved_total:.0%} less in total (snapshot + index)")
+
+
+if __name__ == "__main__":
+    main()
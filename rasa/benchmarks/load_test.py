@@ -0,0 +1,282 @@
+# Load test of the action server's find -> next -> book conversation flow.
+#
+# Starts a real action server (`python -m rasa_sdk --actions actions`) per
+# worker count, pointed at a StubBackend with the given catalog size and
+# injected latency, and drives --users concurrent shoppers against its
+# /webhook the way Rasa would: each session searches for an item, pages
+# through a few results and books one, carrying the slots returned by each
+# action into the next turn. Reports throughput, latency percentiles per
+# turn and per action, and backend calls per turn, for every
+# (catalog size, workers) combination, so the rows form scaling curves.
+#
+# A turn only counts as a success if the bot answered what it should: after
+# a search that found something, every "next" must show another item or say
+# the results are exhausted, and booking must add the item to the cart.
+# Anything else (a lost cursor, "couldn't find that item", a backend error)
+# counts as an error, so broken sessions don't pass as fast ones.
+#
+#   cd rasa
+#   python benchmarks/load_test.py --catalog-sizes 10 1000 100000 --workers 1 2 4 --users 50 --latency-ms 10
+#
+# --no-keep-alive opens a new connection per turn, so the turns of one
+# conversation land on different workers.
+
+import argparse
+import asyncio
+import csv
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_backend import BRANDS, ITEM_TYPES, StubBackend  # noqa: E402
+
+RASA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLORS = ["black", "white", "red", "blue", "green", "pink"]
+
+# what a successful answer of each action starts with
+FOUND = ("Found:", "Sorry, I couldn't find any")
+NEXT = ("How about this one:", "That's all the items I found!")
+BOOKED = ("Great! I've added this item to your cart",)
+
+SLOTS = ["color", "item_type", "item_name", "selected_post_id", "filtered_items", "current_item_index", "user_email"]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ActionServer:
+    """An action server subprocess with ACTION_SERVER_SANIC_WORKERS workers."""
+
+    def __init__(self, workers: int, backend_url: Text, log_path: Optional[Text] = None):
+        self.port = free_port()
+        self.workers = workers
+        self.backend_url = backend_url
+        self.log_path = log_path
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> Text:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, timeout: float = 60.0) -> "ActionServer":
+        env = {
+            **os.environ,
+            "ACTION_SERVER_SANIC_WORKERS": str(self.workers),
+            "CLOSET_CIRCLE_API_URL": self.backend_url,
+        }
+        log = open(self.log_path, "a") if self.log_path else subprocess.DEVNULL
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "rasa_sdk", "--actions", "actions", "--port", str(self.port)],
+            cwd=RASA_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if self._process.poll() is not None:
+                    raise RuntimeError(f"action server exited with {self._process.returncode}")
+                try:
+                    async with session.get(f"{self.url}/health") as r:
+                        if r.status == 200:
+                            return self
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.stop()
+        raise RuntimeError("action server did not become healthy in time")
+
+    def stop(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+
+class Shopper:
+    """One conversation: slots persist across turns like in a Rasa tracker."""
+
+    def __init__(self, sender_id: Text, session: aiohttp.ClientSession, url: Text, rng: random.Random):
+        self.sender_id = sender_id
+        self.session = session
+        self.url = url
+        self.rng = rng
+        self.slots: Dict[Text, Any] = {slot: None for slot in SLOTS}
+        self.email = f"{sender_id}@example.com"
+
+    async def turn(self, action: Text, text: Text, entities: List[Dict[Text, Any]],
+                   results: Dict[Text, List[float]], errors: Dict[Text, int],
+                   expect: Tuple[Text, ...]) -> List[Dict[Text, Any]]:
+        payload = {
+            "next_action": action,
+            "sender_id": self.sender_id,
+            "tracker": {
+                "sender_id": self.sender_id,
+                "slots": self.slots,
+                "latest_message": {"text": text, "entities": entities, "metadata": {"user_email": self.email}},
+                "events": [],
+                "paused": False,
+                "followup_action": None,
+                "active_loop": {},
+                "latest_action_name": None,
+            },
+            "domain": {},
+        }
+        started = time.perf_counter()
+        try:
+            async with self.session.post(f"{self.url}/webhook", json=payload) as r:
+                body = await r.json(content_type=None)
+                status = r.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            errors[action] += 1
+            return []
+        results[action].append(time.perf_counter() - started)
+        if status != 200:
+            errors[action] += 1
+            return []
+        responses = body.get("responses", [])
+        if not responses or not (responses[0].get("text") or "").startswith(expect):
+            errors[action] += 1
+        for event in body.get("events", []):
+            if event.get("event") == "slot":
+                self.slots[event["name"]] = event["value"]
+        return responses
+
+    async def session_flow(self, max_next: int, results: Dict[Text, List[float]], errors: Dict[Text, int]) -> None:
+        entities = [{"entity": "item_type", "value": self.rng.choice(ITEM_TYPES)}]
+        if self.rng.random() < 0.5:
+            entities.append({"entity": "color", "value": [self.rng.choice(COLORS)]})
+        if self.rng.random() < 0.3:
+            entities.append({"entity": "item_name", "value": self.rng.choice(BRANDS)})
+        await self.turn("action_find_item", "find something", entities, results, errors, FOUND)
+
+        for _ in range(self.rng.randint(0, max_next)):
+            if not self.slots["filtered_items"]:
+                break
+            await self.turn("action_show_next_item", "next", [], results, errors, NEXT)
+
+        if self.slots["selected_post_id"]:
+            await self.turn("action_book_item", "book it", [], results, errors, BOOKED)
+
+
+async def drive(url: Text, users: int, sessions: int, max_next: int, seed: int,
+                prefix: Text = "user", keep_alive: bool = True) -> Tuple[Dict[Text, List[float]], Dict[Text, int], float]:
+    results: Dict[Text, List[float]] = defaultdict(list)
+    errors: Dict[Text, int] = defaultdict(int)
+    # without keep-alive every turn opens a new connection, so the turns of
+    # one conversation spread over the workers like behind a load balancer
+    connector = aiohttp.TCPConnector(limit=users, force_close=not keep_alive)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async def user(n: int) -> None:
+            shopper = Shopper(f"{prefix}{n}", session, url, random.Random(seed * 100003 + n))
+            for _ in range(sessions):
+                await shopper.session_flow(max_next, results, errors)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(users)))
+        elapsed = time.perf_counter() - started
+    return results, errors, elapsed
+
+
+async def run_point(catalog_size: int, workers: int, args: argparse.Namespace) -> Dict[Text, Any]:
+    stub = StubBackend(catalog_size=catalog_size, latency_ms=args.latency_ms).start()
+    server = await ActionServer(workers, stub.url, args.server_log).start()
+    try:
+        # every worker loads its own catalog snapshot on its first search
+        await drive(server.url, max(2 * workers, 4), 1, args.max_next, args.seed + 1, prefix="warmup")
+        calls_before = sum(stub.calls.values())
+        results, errors, elapsed = await drive(
+            server.url, args.users, args.sessions, args.max_next, args.seed, keep_alive=not args.no_keep_alive
+        )
+        backend_calls = sum(stub.calls.values()) - calls_before
+    finally:
+        server.stop()
+        stub.stop()
+
+    latencies = [latency for samples in results.values() for latency in samples]
+    turns = len(latencies) + sum(errors.values())
+    row = {
+        "catalog_size": catalog_size,
+        "workers": workers,
+        "users": args.users,
+        "turns": turns,
+        "turns_per_sec": turns / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": sum(errors.values()),
+        "backend_calls_per_turn": backend_calls / turns if turns else 0.0,
+    }
+    for action, samples in sorted(results.items()):
+        row[f"{action}_p95_ms"] = percentile(samples, 95) * 1000
+    return row
+
+
+def print_row(row: Dict[Text, Any]) -> None:
+    per_action = "  ".join(
+        f"{key[len('action_'):-len('_p95_ms')]}={value:.1f}" for key, value in row.items()
+        if key.startswith("action_")
+    )
+    print(
+        f"{row['catalog_size']:>7} posts  {row['workers']:>2} workers  "
+        f"{row['turns_per_sec']:>7.1f} turns/s  "
+        f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms p99={row['p99_ms']:.1f}ms  "
+        f"errors={row['errors']}  backend calls/turn={row['backend_calls_per_turn']:.2f}  "
+        f"p95 by action (ms): {per_action}"
+    )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    rows = []
+    print(f"{args.users} users x {args.sessions} sessions, {args.latency_ms:.0f}ms backend latency")
+    for catalog_size in args.catalog_sizes:
+        for workers in args.workers:
+            row = await run_point(catalog_size, workers, args)
+            print_row(row)
+            rows.append(row)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(dict.fromkeys(key for row in rows for key in row)))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the action server's find -> next -> book flow")
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="ACTION_SERVER_SANIC_WORKERS values")
+    parser.add_argument("--users", type=int, default=50, help="concurrent shoppers")
+    parser.add_argument("--sessions", type=int, default=5, help="find -> next -> book sessions per shopper")
+    parser.add_argument("--max-next", type=int, default=3, help="most 'next' turns per session")
+    parser.add_argument("--latency-ms", type=float, default=10, help="injected backend latency per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-keep-alive", action="store_true", help="open a new connection for every turn")
+    parser.add_argument("--csv", help="also write the rows to this CSV file")
+    parser.add_argument("--server-log", help="append the action server output to this file")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
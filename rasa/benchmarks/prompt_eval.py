@@ -0,0 +1,82 @@
+# Prompt evaluation cost: the original inline prompt vs the compiled prompt.
+#
+# Sends the same messages through OllamaNLU against a live Ollama once per
+# setup (cache and fast path off, streaming off so Ollama reports its
+# prompt_eval counters) and prints how many prompt tokens the model had to
+# evaluate per call, how long that took, and the end-to-end latency.
+#
+#   cd rasa && python benchmarks/prompt_eval.py --url http://localhost:11434 --model llama3
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGES = [
+    "I want a red dress",
+    "do you have any blue or green shoes",
+    "show me a Zara jacket",
+    "looking for black denim",
+    "any Levi's jeans in white",
+    "can I get a pink top from H&M",
+    "book this item for me",
+    "hello there",
+    "I'm after a navy blazer",
+    "something floral for a wedding",
+]
+
+SETUPS = {
+    "before": {"compiled_prompt": False, "structured_output": False, "keep_alive": None},
+    "after": {"compiled_prompt": True, "structured_output": True, "keep_alive": "30m"},
+}
+
+
+def run(label: Text, config: Dict[Text, Any], rounds: int) -> None:
+    from rasa.shared.nlu.training_data.message import Message
+
+    from components.OllamaNLU import OllamaNLU
+
+    nlu = OllamaNLU({**config, "cache_size": 0, "fast_path": False, "stream": False, "batch_concurrency": 1})
+    # first call loads the model and fills its prompt cache
+    nlu.process([Message(data={"text": MESSAGES[0]})])
+
+    latencies: List[float] = []
+    fallbacks = 0
+    calls_before = nlu.llm_calls
+    tokens_before, seconds_before = nlu.prompt_eval_tokens, nlu.prompt_eval_seconds
+    for _ in range(rounds):
+        for text in MESSAGES:
+            message = Message(data={"text": text})
+            started = time.perf_counter()
+            nlu.process([message])
+            latencies.append(time.perf_counter() - started)
+            fallbacks += message.get("intent")["name"] == "nlu_fallback"
+
+    calls = nlu.llm_calls - calls_before
+    print(
+        f"{label:>6}: {calls} calls  "
+        f"prompt_eval={(nlu.prompt_eval_tokens - tokens_before) / calls:.0f} tokens "
+        f"/ {(nlu.prompt_eval_seconds - seconds_before) / calls * 1000:.0f}ms per call  "
+        f"latency p50={statistics.median(latencies) * 1000:.0f}ms mean={statistics.mean(latencies) * 1000:.0f}ms  "
+        f"fallbacks={fallbacks}"
+    )
+    nlu.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare prompt eval tokens and latency of the inline and compiled prompts")
+    parser.add_argument("--url", default="http://localhost:11434", help="Ollama server")
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the sample messages")
+    args = parser.parse_args()
+
+    for label, config in SETUPS.items():
+        run(label, {**config, "url": args.url, "model": args.model}, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
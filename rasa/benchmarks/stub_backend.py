@@ -0,0 +1,175 @@
+# Local stand-in for the Node/Express backend, for benchmarks.
+#
+# Serves the routes the action server uses (/api/posts-all,
+# /api/posts-changes and the /api/profile/cart/* routes) from memory, with an
+# optional injected latency per request, and counts calls per route. Posts
+# changed through upsert_post/remove_post are logged like the Post_Change
+# table (prune_changes() drops the log like the Node server's pruning), so
+# delta syncs can be exercised. It runs on its own event loop in a
+# background thread so both sync and async clients can hit it.
+
+import asyncio
+import random
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Text
+
+from aiohttp import web
+
+ITEM_TYPES = ["dress", "gown", "shirt", "tee", "blouse", "pants", "jeans", "jacket", "coat",
+              "hoodie", "skirt", "shorts", "sneakers", "boots", "heels", "sandals"]
+BRANDS = ["Nike", "Adidas", "Zara", "Levi's", "Gucci", "Prada", "H&M", "Uniqlo", "Patagonia", "Vans"]
+ADJECTIVES = ["Vintage", "Classic", "Cozy", "Summer", "Oversized", "Slim", "Floral", "Denim", "Leather"]
+
+
+def make_catalog(size: int, seed: int = 0) -> List[Dict[Text, Any]]:
+    """Posts shaped like the /api/posts-all response."""
+    rng = random.Random(seed)
+    posts = []
+    for post_id in range(1, size + 1):
+        brand = rng.choice(BRANDS)
+        item_type = rng.choice(ITEM_TYPES)
+        posts.append({
+            "post_id": post_id,
+            "closet_id": rng.randint(1, 20),
+            "owner_id": f"user{rng.randint(1, 500)}@example.com",
+            "title": f"{rng.choice(ADJECTIVES)} {brand} {item_type.title()}",
+            "likes": rng.randint(0, 50),
+            "description": f"Gently used {item_type} from {brand}. " + " ".join(
+                rng.choice(ADJECTIVES).lower() for _ in range(rng.randint(3, 15))
+            ),
+            "date_posted": "2025-01-01 00:00:00",
+            "item_condition": rng.choice(["New", "Like New", "Good", "Fair"]),
+            "size": rng.choice(["XS", "S", "M", "L", "XL"]),
+            "price": round(rng.uniform(5, 120), 2),
+            "bflag": 0,
+            "sflag": 0,
+            "rental_end_date": None,
+            "images": [f"https://example.com/images/{post_id}.jpg"],
+            "categories": rng.sample(range(1, 16), rng.randint(1, 4)),
+            "lister": {"display": "Test U.", "username": "test-user", "avatarUrl": None},
+        })
+    return posts
+
+
+class StubBackend:
+    def __init__(self, catalog_size: int = 100, latency_ms: float = 0.0, port: int = 0):
+        self.posts = make_catalog(catalog_size)
+        self._by_id = {post["post_id"]: post for post in self.posts}
+        # Post_Change: change_id - 1 -> post_id
+        self.changes: List[int] = []
+        # change ids up to this one have been pruned, like old Post_Change rows
+        self.pruned = 0
+        self.latency = latency_ms / 1000.0
+        self.port = port
+        self.calls: Counter = Counter()
+        # email -> pending transaction id, and every transaction id handed out
+        self._transactions: Dict[Text, int] = {}
+        self._transaction_ids = 0
+        self._listings: Dict[int, List[int]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> Text:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "StubBackend":
+        threading.Thread(target=self._serve, name="stub-backend", daemon=True).start()
+        self._started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application(middlewares=[self._count_and_delay])
+        app.router.add_get("/api/posts-all", self._posts_all)
+        app.router.add_get("/api/posts-changes", self._posts_changes)
+        app.router.add_get("/api/profile/cart/id", self._cart_id)
+        app.router.add_post("/api/profile/cart/create", self._cart_create)
+        app.router.add_put("/api/profile/cart/addItem", self._cart_add_item)
+        app.router.add_get("/api/profile/cart", self._cart)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    @web.middleware
+    async def _count_and_delay(self, request: web.Request, handler):
+        self.calls[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def upsert_post(self, post: Dict[Text, Any]) -> None:
+        if post["post_id"] in self._by_id:
+            self.posts[self.posts.index(self._by_id[post["post_id"]])] = post
+        else:
+            self.posts.append(post)
+        self._by_id[post["post_id"]] = post
+        self.changes.append(post["post_id"])
+
+    def remove_post(self, post_id: int) -> None:
+        self.posts.remove(self._by_id.pop(post_id))
+        self.changes.append(post_id)
+
+    def checkout(self, email: Text) -> None:
+        """Purchase email's pending cart, like /api/profile/checkout."""
+        self._transactions.pop(email, None)
+
+    def prune_changes(self) -> None:
+        """Forget the change log so far; clients behind it get a 410."""
+        self.pruned = len(self.changes)
+
+    async def _posts_all(self, request: web.Request) -> web.Response:
+        return web.json_response({"posts": self.posts})
+
+    async def _posts_changes(self, request: web.Request) -> web.Response:
+        latest = len(self.changes)
+        if "since" not in request.query:
+            return web.json_response({"latest": latest, "posts": [], "removed": []})
+        since = int(request.query["since"])
+        if since < self.pruned or since > latest:
+            return web.json_response({"error": "changes no longer available", "latest": latest}, status=410)
+        changed = sorted(set(self.changes[since:latest]))
+        return web.json_response({
+            "latest": latest,
+            "posts": [self._by_id[post_id] for post_id in changed if post_id in self._by_id],
+            "removed": [post_id for post_id in changed if post_id not in self._by_id],
+        })
+
+    async def _cart_id(self, request: web.Request) -> web.Response:
+        transaction_id = self._transactions.get(request.query.get("email"))
+        return web.json_response({"transactionId": transaction_id})
+
+    async def _cart_create(self, request: web.Request) -> web.Response:
+        email = (await request.json()).get("email")
+        if email not in self._transactions:
+            self._transaction_ids += 1
+            self._transactions[email] = self._transaction_ids
+        return web.json_response({"transactionId": self._transactions[email]})
+
+    async def _cart_add_item(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body["transactionId"] not in self._transactions.values():
+            return web.json_response({"error": "Transaction is not a pending cart"}, status=409)
+        self._listings.setdefault(body["transactionId"], []).append(body["postId"])
+        return web.json_response({"success": True, "message": "Item added to cart"})
+
+    async def _cart(self, request: web.Request) -> web.Response:
+        transaction_id = self._transactions.get(request.query.get("email"))
+        cart = [
+            {"post_id": post_id, "title": self._by_id[post_id]["title"], "price": self._by_id[post_id]["price"]}
+            for post_id in self._listings.get(transaction_id, []) if post_id in self._by_id
+        ]
+        return web.json_response({"transId": transaction_id, "cart": cart})
+
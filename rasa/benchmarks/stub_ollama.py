@@ -0,0 +1,135 @@
+# Local stand-in for Ollama's /api/generate, for NLU benchmarks.
+#
+# Answers each prompt with a canned response for the user message in it,
+# looked up by message text: either answers built from annotated examples
+# (an "oracle" model) or responses recorded from a real Ollama. With an
+# `upstream` url, messages it has no answer for are forwarded there and the
+# answers are recorded, so a run against a live model can be replayed later
+# without one. Both plain and streaming (NDJSON) responses are supported,
+# with injected latency for prompt evaluation and per token.
+
+import asyncio
+import html
+import json
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Text
+
+import aiohttp
+from aiohttp import web
+
+UNKNOWN_RESPONSE = json.dumps({"intent": "nlu_fallback", "entities": []})
+
+_USER_MESSAGE = re.compile(r'User message: "(.*)"', re.DOTALL)
+_PACKED_MESSAGE = re.compile(r'^\s*\d+\. "(.*)"\s*$', re.MULTILINE)
+
+
+def user_messages(prompt: Text) -> List[Text]:
+    """The user message(s) an OllamaNLU prompt asks about, unescaped."""
+    if "User messages:" in prompt:
+        return [html.unescape(text) for text in _PACKED_MESSAGE.findall(prompt.split("User messages:", 1)[1])]
+    match = _USER_MESSAGE.search(prompt)
+    return [html.unescape(match.group(1))] if match else []
+
+
+class StubOllama:
+    def __init__(self, responses: Optional[Dict[Text, Text]] = None, latency_ms: float = 0.0,
+                 token_ms: float = 0.0, upstream: Optional[Text] = None, port: int = 0):
+        # message text -> raw model response (a JSON string)
+        self.responses: Dict[Text, Text] = dict(responses or {})
+        self.latency = latency_ms / 1000.0
+        self.token_latency = token_ms / 1000.0
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.port = port
+        self.calls: Counter = Counter()
+        self.recorded: Dict[Text, Text] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> Text:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "StubOllama":
+        threading.Thread(target=self._serve, name="stub-ollama", daemon=True).start()
+        self._started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/api/generate", self._generate)
+        app.router.add_get("/api/tags", self._tags)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        self.calls["tags"] += 1
+        return web.json_response({"models": []})
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.calls["generate"] += 1
+        texts = user_messages(body.get("prompt", ""))
+        if len(texts) > 1:
+            # packed prompts are only answered from known responses
+            answers = [json.loads(await self._answer(body, text, forward=False)) for text in texts]
+            response = json.dumps(answers)
+        else:
+            response = await self._answer(body, texts[0] if texts else "")
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        final = {"model": body.get("model"), "done": True, "prompt_eval_count": len(body.get("prompt", "")) // 4}
+        if not body.get("stream", True):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency * len(_tokens(response)))
+            return web.json_response({**final, "response": response})
+
+        stream = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await stream.prepare(request)
+        try:
+            for token in _tokens(response):
+                if self.token_latency:
+                    await asyncio.sleep(self.token_latency)
+                await stream.write((json.dumps({"response": token, "done": False}) + "\n").encode())
+            await stream.write((json.dumps({**final, "response": ""}) + "\n").encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            # the client stopped reading once it had the JSON
+            self.calls["stopped_early"] += 1
+            raise
+        return stream
+
+    async def _answer(self, body: Dict, text: Text, forward: bool = True) -> Text:
+        if text in self.responses:
+            self.calls["known"] += 1
+            return self.responses[text]
+        if self.upstream is None or not forward:
+            self.calls["unknown"] += 1
+            return UNKNOWN_RESPONSE
+        self.calls["upstream"] += 1
+        upstream_body = {**body, "stream": False}
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.upstream}/api/generate", json=upstream_body) as r:
+                response = (await r.json()).get("response", "{}")
+        self.responses[text] = self.recorded[text] = response
+        return response
+
+
+def _tokens(response: Text) -> List[Text]:
+    # roughly token-sized pieces
+    return [piece for piece in re.split(r"(\s+|[{}\[\],:])", response) if piece]
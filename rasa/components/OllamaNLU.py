@@ -1,58 +1,71 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
+from jsonschema.validators import validator_for
 import html
-from typing import Any, Dict, Text, List
+import copy
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Callable, Dict, Text, List, Optional, Tuple
 from rasa.engine.graph import GraphComponent, ExecutionContext
 from rasa.engine.storage.resource import Resource
 from rasa.engine.storage.storage import ModelStorage
 from rasa.shared.nlu.training_data.message import Message
 from rasa.engine.recipes.default_recipe import DefaultV1Recipe
 
-@DefaultV1Recipe.register("components.OllamaNLU", is_trainable=False)
-class OllamaNLU(GraphComponent):
-    """ RASA NLU component that uses Ollama API for intent classification and entity extraction. """
+from metrics import REGISTRY, log_sampled, start_metrics_server
+from .fast_path import FastPathClassifier
+from .json_stream import JSONValueScanner
+from .ollama_pool import CallCancelled, OllamaError, OllamaPool
+from .nlu_tables import COLOR_CATEGORY_IDS, INTENT_DESCRIPTIONS, ITEM_TYPE_NORMALIZATION
+from .parse_cache import ParseCache
 
-    @classmethod
-    def create(
-        cls,
-        config: Dict[Text, Any],
-        model_storage: ModelStorage,
-        resource: Resource,
-        execution_context: ExecutionContext,
-    ) -> "OllamaNLU":
-        return cls(config)
+logger = logging.getLogger(__name__)
 
-    def __init__(self, config: Dict[Text, Any]):
-        self.config = config
-        self.valid_intents = ["find_item", "greet", "goodbye", "affirm", "deny", "book_item", "provide_item_type", "provide_color", "bot_challenge"]
-        self.valid_entities = ["color", "item_type", "item_name"]
+NLU_MESSAGES = REGISTRY.counter(
+    "ollama_nlu_messages", "Messages parsed by OllamaNLU, by how they were answered", ["path"]
+)
+NLU_LLM_CALL_SECONDS = REGISTRY.histogram(
+    "ollama_nlu_llm_call_seconds", "Time from sending a prompt to Ollama to a validated parse", ["model"]
+)
+NLU_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "ollama_nlu_first_token_seconds", "Time from sending a prompt to the first streamed token", ["model"]
+)
+NLU_PARSE_SECONDS = REGISTRY.histogram(
+    "ollama_nlu_parse_seconds", "JSON decoding and schema validation of an LLM response"
+)
 
-    def process(self, messages: List[Message]) -> List[Message]:
-        for message in messages:
-            user_text = html.escape(message.text.strip())
+# one metrics endpoint per process, however many times the component is created
+_metrics_server = None
+
+
+def _close_pool(pool: OllamaPool, session: requests.Session) -> None:
+    # not a method: weakref.finalize must not keep the component alive
+    pool.close()
+    session.close()
 
-            prompt = f"""
+
+def _bullets(lines) -> Text:
+    return "\n".join(f"            - {line}" for line in lines)
+
+
+# Built from the shared tables; {user_text} is filled in per message
+PROMPT_TEMPLATE = """
             You are a helpful booking assistant for Closet Circle, a fun and sustainable alternative to fast fashion, where users can borrow clothes instead of buying them. 
             Your task is to ONLY extract the intents and entities from the user's message. 
             
             INTENTS (choose one):
-            - find_item: user wants to search/find/look for clothing
-            - greet: user says hello/hi
-            - goodbye: user says bye/goodbye
-            - affirm: user says yes/ok/sure
-            - deny: user says no/nope
-            - book_item: user wants to book/reserve an item
+""" + _bullets(f"{name}: {description}" for name, description in INTENT_DESCRIPTIONS.items()) + """
             
             ENTITIES to extract: item_name, item_type, color
             
             IMPORTANT - Map color to these NUMERIC category IDs: 
-            - "black" -> "10"
-            - "white" -> "11"
-            - "red" -> "12"
-            - "blue" -> "13"
-            - "green" -> "14"
-            - "pink" -> "15"
+""" + _bullets(f'"{name}" -> "{category_id}"' for name, category_id in COLOR_CATEGORY_IDS.items()) + """
             
             YOU MUST extract color as a NUMBER string based on the above mapping. 
             
@@ -66,14 +79,7 @@ class OllamaNLU(GraphComponent):
             - No colors mentioned -> color entity value should be []
                         
             IMPORTANT - Normalize item_type to ONLY these values:
-            - "dress" (includes: gown, frock, sundress)
-            - "shirt" (includes: top, tee, t-shirt, tshirt, blouse, button-up)
-            - "pants" (includes: trousers, slacks, chinos, leggings)
-            - "jacket" (includes: blazer, coat, cardigan, sweater, hoodie, outerwear)
-            - "skirt" (includes: miniskirt, maxi skirt)
-            - "jeans" (includes: denim, denim pants)
-            - "shorts" (includes: short pants)
-            - "shoes" (includes: sneakers, boots, heels, sandals, footwear)
+""" + _bullets(f'"{name}" (includes: {", ".join(words)})' for name, words in ITEM_TYPE_NORMALIZATION.items()) + """
             
             If the user provides an item_type not in this list, do NOT extract it as an entity. 
             If the user provides a singular item type (e.g., dress), map plural forms (e.g., dresses) to the singular normalized value.
@@ -96,69 +102,495 @@ class OllamaNLU(GraphComponent):
             User message: "{user_text}"
             """
 
-            # calling Ollama API
-            try: 
-                print(f"[OllamaNLU] Processing message: {user_text}")
-                r = requests.post(
-                    "http://localhost:11434/api/generate",
-                        json={"model": "llama3", "prompt": prompt, "stream": False}
-                    ).json()
-                llm_output = r.get("response", "{}")
-                print(f"[OllamaNLU] Raw response: {llm_output[:200] if llm_output else 'empty'}")
-                if isinstance(llm_output, str):
-                    llm_output = json.loads(llm_output)
-                print(f"[OllamaNLU] Parsed output: {llm_output}")
-
-                # schema validation
-                # - color: array of strings (numbers like "10" or names like "red" - converted in actions)
-                # - item_type, item_name: strings
-                schema = {
-                    "type": "object",
-                    "properties": {
-                        "intent": {"type": "string"},
-                        "entities": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "entity": {"type": "string"},
-                                    "value": {
-                                        "oneOf": [
-                                            {"type": "string"},
-                                            {"type": "array", "items": {"type": "string"}}
-                                        ]
-                                    },
-                                    "start": {"type": "number"},
-                                    "end": {"type": "number"},
-                                },
-                                "required": ["entity", "value", "start", "end"],
-                            },
-                        },
+_INSTRUCTIONS, _USER_LINE = PROMPT_TEMPLATE.split("            User message:")
+_PACKED_INSTRUCTIONS = """            You will get several numbered user messages. Extract the intent and entities of EACH message
+            separately, with start/end relative to that message.
+            Respond ONLY with a JSON array holding one object in the format above per message, in the same order.
+"""
+
+# Same instructions, for several messages answered with one JSON array
+PACKED_PROMPT_TEMPLATE = _INSTRUCTIONS + _PACKED_INSTRUCTIONS + """
+            User messages:
+{messages}
+            """
+
+# compiled_prompt mode: the instructions go in Ollama's `system` field once
+# per component and only the short user part changes between calls, so the
+# prompt prefix is identical and the model's KV cache for it can be reused
+SYSTEM_PROMPT = _INSTRUCTIONS.format()
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + _PACKED_INSTRUCTIONS
+USER_PROMPT_TEMPLATE = "User message:" + _USER_LINE.rstrip()
+PACKED_USER_PROMPT_TEMPLATE = "User messages:\n{messages}"
+
+# What a valid LLM parse looks like
+# - color: array of strings (numbers like "10" or names like "red" - converted in actions)
+# - item_type, item_name: strings
+PARSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string"},
+        "entities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "entity": {"type": "string"},
+                    "value": {
+                        "oneOf": [
+                            {"type": "string"},
+                            {"type": "array", "items": {"type": "string"}}
+                        ]
                     },
-                    "required": ["intent", "entities"],
-                }
-                validate(instance=llm_output, schema=schema)
-                intent_name = llm_output.get("intent", "nlu_fallback")
+                    "start": {"type": "number"},
+                    "end": {"type": "number"},
+                },
+                "required": ["entity", "value", "start", "end"],
+            },
+        },
+    },
+    "required": ["intent", "entities"],
+}
+PACKED_PARSE_SCHEMA = {"type": "array", "items": PARSE_SCHEMA}
+
+# checked and compiled once instead of on every validate() call
+_validator_class = validator_for(PARSE_SCHEMA)
+_validator_class.check_schema(PARSE_SCHEMA)
+PARSE_VALIDATOR = _validator_class(PARSE_SCHEMA)
+
+
+@DefaultV1Recipe.register("components.OllamaNLU", is_trainable=False)
+class OllamaNLU(GraphComponent):
+    """ RASA NLU component that uses Ollama API for intent classification and entity extraction. """
+
+    @staticmethod
+    def get_default_config() -> Dict[Text, Any]:
+        return {
+            # Ollama server and model used for parsing; `urls` lists several
+            # replicas to balance over instead of the single `url`
+            "url": "http://localhost:11434",
+            "urls": None,
+            "model": "llama3",
+            # endpoint pool: a replica's circuit opens after failure_threshold
+            # failed calls in a row and is retried after reset_timeout seconds;
+            # replicas are polled every health_check_interval seconds (None
+            # disables; a single url is never polled), calls slower than hedge_after seconds are also sent to
+            # a second replica, and calls go to fallback_model once a replica
+            # has overload_threshold requests outstanding
+            "failure_threshold": 3,
+            "reset_timeout": 30,
+            "health_check_interval": 10,
+            "hedge_after": 2.0,
+            "fallback_model": None,
+            "overload_threshold": None,
+            # parse cache: max entries, seconds an entry stays valid (None for
+            # no expiry) and an optional SQLite file so entries survive restarts
+            "cache_size": 1000,
+            "cache_ttl": 24 * 60 * 60,
+            "cache_path": None,
+            # answer messages fully covered by the intent/color/item_type
+            # tables without calling the LLM
+            "fast_path": True,
+            "fast_path_max_tokens": 8,
+            # seconds one Ollama response may take: the socket read timeout, and
+            # in streaming mode also the deadline for the whole stream
+            "timeout": 60,
+            # how many Ollama requests process() keeps in flight at once, and
+            # how many messages to pack into a single prompt (1 = no packing)
+            "batch_concurrency": 4,
+            "batch_pack_size": 1,
+            # stream tokens and stop generation as soon as the JSON is complete
+            "stream": True,
+            # send the fixed instructions as Ollama's system prompt and only the
+            # user message as the prompt, constrain the output to the parse
+            # schema, and keep the model (and its prompt cache) loaded
+            "compiled_prompt": True,
+            "structured_output": True,
+            "keep_alive": "30m",
+            # serve Prometheus metrics on this port (None disables)
+            "metrics_port": None,
+        }
+
+    @classmethod
+    def create(
+        cls,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        execution_context: ExecutionContext,
+    ) -> "OllamaNLU":
+        return cls(config)
+
+    def __init__(self, config: Dict[Text, Any]):
+        self.config = {**self.get_default_config(), **config}
+        self.model = self.config["model"]
+        self.cache: Optional[ParseCache] = None
+        if self.config["cache_size"]:
+            self.cache = ParseCache(self.config["cache_size"], self.config["cache_ttl"], self.config["cache_path"])
+        self.fast_path: Optional[FastPathClassifier] = None
+        if self.config["fast_path"]:
+            self.fast_path = FastPathClassifier(self.config["fast_path_max_tokens"])
+        self.messages_seen = 0
+        self.fast_path_hits = 0
+        self.timeout = self.config["timeout"]
+        self.concurrency = max(1, int(self.config["batch_concurrency"]))
+        self.pack_size = max(1, int(self.config["batch_pack_size"]))
+        # pooled keep-alive connections to Ollama, one per concurrent request
+        # (twice that when hedging can race two attempts per message)
+        urls = self.config["urls"] or [self.config["url"]]
+        pool_maxsize = 2 * self.concurrency
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=len(urls), pool_maxsize=pool_maxsize))
+        self.session.mount("https://", HTTPAdapter(pool_connections=len(urls), pool_maxsize=pool_maxsize))
+        self.pool = OllamaPool(
+            urls,
+            self.model,
+            fallback_model=self.config["fallback_model"],
+            overload_threshold=self.config["overload_threshold"],
+            hedge_after=self.config["hedge_after"],
+            failure_threshold=self.config["failure_threshold"],
+            reset_timeout=self.config["reset_timeout"],
+            health_check_interval=self.config["health_check_interval"],
+            session=self.session,
+            max_workers=pool_maxsize,
+        )
+        # Rasa creates a new component for training and every model (re)load
+        # without closing the old one; stop its health thread, hedging
+        # executor and connections once it is dropped
+        self._finalizer = weakref.finalize(self, _close_pool, self.pool, self.session)
+        self.stream = self.config["stream"]
+        # per-call time to first token / to a validated parse
+        self._timing_lock = threading.Lock()
+        self.llm_calls = 0
+        self.early_stops = 0
+        self.parse_seconds = 0.0
+        self.first_token_calls = 0
+        self.first_token_seconds = 0.0
+        self.prompt_eval_calls = 0
+        self.prompt_eval_tokens = 0
+        self.prompt_eval_seconds = 0.0
+        # the prompts are fixed per component; only the user part is formatted per call
+        self.structured_output = self.config["structured_output"]
+        self.keep_alive = self.config["keep_alive"]
+        if self.config["compiled_prompt"]:
+            self.system_prompt, self.prompt_template = SYSTEM_PROMPT, USER_PROMPT_TEMPLATE
+            self.packed_system_prompt, self.packed_prompt_template = PACKED_SYSTEM_PROMPT, PACKED_USER_PROMPT_TEMPLATE
+        else:
+            self.system_prompt, self.prompt_template = None, PROMPT_TEMPLATE
+            self.packed_system_prompt, self.packed_prompt_template = None, PACKED_PROMPT_TEMPLATE
+        # cached parses are only reused for the same prompt setup
+        self.prompt_fingerprint = "\0".join(
+            [self.system_prompt or "", self.prompt_template, "format" if self.structured_output else ""]
+        )
+        REGISTRY.register_stats("ollama_nlu_stats", self.stats)
+        global _metrics_server
+        if self.config["metrics_port"] and _metrics_server is None:
+            _metrics_server = start_metrics_server(int(self.config["metrics_port"]))
+        self.valid_intents = ["find_item", "greet", "goodbye", "affirm", "deny", "book_item", "provide_item_type", "provide_color", "bot_challenge"]
+        self.valid_entities = ["color", "item_type", "item_name"]
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        # messages that still need the LLM: (message, escaped text, cache key)
+        pending = []
+        for message in messages:
+            self.messages_seen += 1
+            if self.fast_path is not None:
+                parse = self.fast_path.parse(message.text)
+                if parse is not None:
+                    self.fast_path_hits += 1
+                    NLU_MESSAGES.inc(path="fast_path")
+                    log_sampled(
+                        logger, logging.DEBUG, "Fast path: %s -> %s (%d/%d messages skipped the LLM)",
+                        message.text, parse["intent"], self.fast_path_hits, self.messages_seen,
+                    )
+                    self._set_parse(message, parse)
+                    continue
 
-                if intent_name not in self.valid_intents:
-                    intent_name = "nlu_fallback"
-                message.set("intent", {"name": intent_name, "confidence": 0.9})
+            user_text = html.escape(message.text.strip())
 
-                entities = llm_output.get("entities", [])
-                validated_entities = []
+            # repeated messages ("hi", "yes", "next", ...) are served from the cache
+            cache_key = None
+            if self.cache is not None:
+                cache_key = ParseCache.key(user_text, self.model, self.prompt_fingerprint)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    NLU_MESSAGES.inc(path="cache")
+                    log_sampled(logger, logging.DEBUG, "Cache hit: %s", user_text)
+                    self._set_parse(message, cached)
+                    continue
 
-                for e in entities:
-                    if e.get("entity") in self.valid_entities:
-                        e["start"] = int(e.get("start", 0))
-                        e["end"] = int(e.get("end", len(e.get("value",""))))
-                        validated_entities.append(e)
+            pending.append((message, user_text, cache_key))
 
-                message.set("entities", validated_entities)
+        jobs = []
+        for i in range(0, len(pending), self.pack_size):
+            chunk = pending[i:i + self.pack_size]
+            if len(chunk) > 1:
+                jobs.append((chunk, self._parse_packed, [user_text for _, user_text, _ in chunk]))
+            else:
+                jobs.append((chunk, self._parse_one, chunk[0][1]))
 
-            except (json.JSONDecodeError, ValidationError, requests.RequestException) as e:
-                # fallback message is sent if error
-                message.set("intent", {"name": "nlu_fallback", "confidence": 0.0})
-                message.set("entities", [])
-                print(f"OllamaNLU error: {e}")
+        for chunk, result in self._run_bounded(jobs):
+            if isinstance(result, Exception) and len(chunk) > 1:
+                # a packed prompt that didn't come back right, retry one by one
+                logger.warning("Packed parse failed, retrying individually: %s", result)
+                for item in chunk:
+                    retried = self._call(self._parse_one, item[1])
+                    self._apply_result(item, retried if isinstance(retried, Exception) else (retried[0][0], *retried[1:]))
+                continue
+            if isinstance(result, Exception):
+                self._apply_result(chunk[0], result)
+                continue
+            parses, latency, model = result
+            for item, parse in zip(chunk, parses):
+                self._apply_result(item, (parse, latency / len(chunk), model))
 
         return messages
+
+    def _run_bounded(self, jobs):
+        """Run (chunk, fn, arg) jobs with at most `batch_concurrency` LLM calls
+        in flight, yielding (chunk, result) as they complete. Jobs are only
+        submitted as earlier ones finish, so a large batch never queues up
+        more than that many requests against Ollama."""
+        if self.concurrency <= 1 or len(jobs) <= 1:
+            for chunk, fn, arg in jobs:
+                yield chunk, self._call(fn, arg)
+            return
+
+        jobs = iter(jobs)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for chunk, fn, arg in islice(jobs, self.concurrency):
+                in_flight[executor.submit(self._call, fn, arg)] = chunk
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+                    for chunk, fn, arg in islice(jobs, 1):
+                        in_flight[executor.submit(self._call, fn, arg)] = chunk
+
+    @staticmethod
+    def _call(fn, arg):
+        """Run fn(arg), returning ([parses], seconds, model that answered) or
+        the exception raised."""
+        started = time.monotonic()
+        try:
+            parses, model = fn(arg)
+        except (json.JSONDecodeError, ValidationError, requests.RequestException, ValueError) as e:
+            return e
+        return parses, time.monotonic() - started, model
+
+    def _apply_result(self, item, result) -> None:
+        message, user_text, cache_key = item
+        if isinstance(result, Exception):
+            # fallback message is sent if error
+            message.set("intent", {"name": "nlu_fallback", "confidence": 0.0})
+            message.set("entities", [])
+            NLU_MESSAGES.inc(path="fallback")
+            logger.warning("OllamaNLU error: %s", result)
+            return
+
+        parse, latency, model = result
+        NLU_MESSAGES.inc(path="llm")
+        self._set_parse(message, parse)
+
+        # only outputs that passed validation are cached, and only the primary
+        # model's: the key names self.model, so a fallback_model answer would
+        # keep being served after the overload is over
+        if self.cache is not None and model == self.model:
+            self.cache.put(cache_key, parse, latency)
+
+    def _parse_one(self, user_text: Text) -> Tuple[List[Dict[Text, Any]], Text]:
+        # calling Ollama API
+        log_sampled(logger, logging.DEBUG, "Processing message: %s", user_text)
+        return self._generate(
+            self._request(self.prompt_template.format(user_text=user_text), self.system_prompt, PARSE_SCHEMA),
+            self._read_one,
+        )
+
+    def _read_one(self, llm_output: Text) -> List[Dict[Text, Any]]:
+        log_sampled(logger, logging.DEBUG, "Raw response: %s", llm_output[:200] if llm_output else "empty")
+        with NLU_PARSE_SECONDS.time():
+            return [self._validate(json.loads(llm_output))]
+
+    def _parse_packed(self, user_texts: List[Text]) -> Tuple[List[Dict[Text, Any]], Text]:
+        log_sampled(logger, logging.DEBUG, "Processing %d messages in one prompt", len(user_texts))
+        numbered = "\n".join(f'            {i}. "{user_text}"' for i, user_text in enumerate(user_texts, 1))
+        return self._generate(
+            self._request(self.packed_prompt_template.format(messages=numbered), self.packed_system_prompt, PACKED_PARSE_SCHEMA),
+            lambda llm_output: self._read_packed(llm_output, len(user_texts)),
+        )
+
+    def _read_packed(self, llm_output: Text, expected: int) -> List[Dict[Text, Any]]:
+        with NLU_PARSE_SECONDS.time():
+            return self._validate_packed(llm_output, expected)
+
+    def _validate_packed(self, llm_output: Text, expected: int) -> List[Dict[Text, Any]]:
+        llm_output = json.loads(llm_output or "null")
+        if isinstance(llm_output, dict):
+            # some models wrap the list, e.g. {"results": [...]}
+            llm_output = next((v for v in llm_output.values() if isinstance(v, list)), None)
+        if not isinstance(llm_output, list) or len(llm_output) != expected:
+            raise ValueError(f"expected a list of {expected} parses, got {str(llm_output)[:200]}")
+        return [self._validate(output) for output in llm_output]
+
+    def _request(self, prompt: Text, system: Optional[Text], schema: Dict[Text, Any]) -> Dict[Text, Any]:
+        """Body for /api/generate, minus the `stream` flag."""
+        body = {"model": self.model, "prompt": prompt}
+        if self.keep_alive is not None:
+            body["keep_alive"] = self.keep_alive
+        if system is not None:
+            body["system"] = system
+        if self.structured_output:
+            # constrains decoding to the schema, so the output always parses
+            body["format"] = schema
+        return body
+
+    def _generate(
+        self, body: Dict[Text, Any], read: Callable[[Text], List[Dict[Text, Any]]]
+    ) -> Tuple[List[Dict[Text, Any]], Text]:
+        """Send `body` to an endpoint picked by the pool and return
+        `read(response_text)` and the model that answered."""
+        return self.pool.call(lambda url, model, cancelled: self._generate_at(url, {**body, "model": model}, read, cancelled))
+
+    def _generate_at(
+        self, url: Text, body: Dict[Text, Any], read: Callable[[Text], List[Dict[Text, Any]]], cancelled: threading.Event
+    ) -> List[Dict[Text, Any]]:
+        """One attempt at `url`.
+
+        In streaming mode the tokens are scanned as they arrive and `read` is
+        tried as soon as the first top-level JSON value closes; if it passes,
+        the connection is closed, which makes Ollama stop generating instead of
+        finishing whatever the model adds after the JSON. The same happens once
+        the stream has run for `timeout` seconds, since requests only applies
+        the timeout to each read.
+        """
+        started = time.monotonic()
+        if not self.stream:
+            r = self.session.post(f"{url}/api/generate", json={**body, "stream": False}, timeout=self.timeout)
+            r.raise_for_status()
+            r = r.json()
+            parses = read(r.get("response", "{}"))
+            self._record_timing(body["model"], None, time.monotonic() - started, early=False, final=r)
+            return parses
+
+        scanner = JSONValueScanner()
+        tokens = []
+        first_token = None
+        with self.session.post(
+            f"{url}/api/generate",
+            json={**body, "stream": True},
+            timeout=self.timeout,
+            stream=True,
+        ) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if cancelled.is_set():
+                    # another replica answered first (hedged call)
+                    raise CallCancelled()
+                if time.monotonic() - started > self.timeout:
+                    # leaving the with block closes the response
+                    raise requests.Timeout(f"{url} still generating after {self.timeout}s")
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(f"Ollama error: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token and first_token is None:
+                    first_token = time.monotonic() - started
+                tokens.append(token)
+                if scanner.feed(token):
+                    try:
+                        parses = read(scanner.value())
+                    except (json.JSONDecodeError, ValidationError, ValueError):
+                        # not what we asked for, let the model finish and try the whole text
+                        scanner.reset()
+                    else:
+                        done = chunk.get("done", False)
+                        self._record_timing(body["model"], first_token, time.monotonic() - started, early=not done, final=chunk if done else None)
+                        return parses
+                if chunk.get("done"):
+                    break
+
+        parses = read("".join(tokens) or "{}")
+        self._record_timing(body["model"], first_token, time.monotonic() - started, early=False, final=chunk if tokens else None)
+        return parses
+
+    def _record_timing(
+        self, model: Text, first_token: Optional[float], parsed: float, early: bool,
+        final: Optional[Dict[Text, Any]] = None,
+    ) -> None:
+        # called from the batch worker threads; `final` is Ollama's last
+        # response chunk, which carries the prompt eval counters (a call
+        # stopped early never receives it)
+        prompt_tokens = final.get("prompt_eval_count") if final else None
+        with self._timing_lock:
+            self.llm_calls += 1
+            self.parse_seconds += parsed
+            if first_token is not None:
+                self.first_token_calls += 1
+                self.first_token_seconds += first_token
+            if early:
+                self.early_stops += 1
+            if prompt_tokens is not None:
+                self.prompt_eval_calls += 1
+                self.prompt_eval_tokens += prompt_tokens
+                self.prompt_eval_seconds += final.get("prompt_eval_duration", 0) / 1e9
+        NLU_LLM_CALL_SECONDS.observe(parsed, model=model)
+        if first_token is not None:
+            NLU_FIRST_TOKEN_SECONDS.observe(first_token, model=model)
+        log_sampled(
+            logger, logging.DEBUG, "LLM call: first token %s, parsed after %.0fms%s, %s prompt tokens evaluated",
+            f"{first_token * 1000:.0f}ms" if first_token is not None else "n/a", parsed * 1000,
+            " (stopped early)" if early else "", prompt_tokens if prompt_tokens is not None else "n/a",
+        )
+
+    def _validate(self, llm_output: Any) -> Dict[Text, Any]:
+        # schema validation
+        PARSE_VALIDATOR.validate(llm_output)
+        intent_name = llm_output.get("intent", "nlu_fallback")
+
+        if intent_name not in self.valid_intents:
+            intent_name = "nlu_fallback"
+
+        entities = llm_output.get("entities", [])
+        validated_entities = []
+
+        for e in entities:
+            if e.get("entity") in self.valid_entities:
+                e["start"] = int(e.get("start", 0))
+                e["end"] = int(e.get("end", len(e.get("value",""))))
+                validated_entities.append(e)
+
+        return {"intent": intent_name, "entities": validated_entities}
+
+    def close(self) -> None:
+        """Stop the endpoint pool now rather than when the component is dropped."""
+        self._finalizer()
+
+    def stats(self) -> Dict[Text, Any]:
+        """How many messages skipped the LLM via the fast path, average LLM
+        time to first token and to a validated parse, the hit rate and LLM time
+        saved by the parse cache, and the state of each Ollama endpoint."""
+        with self._timing_lock:
+            llm = {
+                "calls": self.llm_calls,
+                "early_stops": self.early_stops,
+                "avg_first_token_seconds": self.first_token_seconds / self.first_token_calls if self.first_token_calls else 0.0,
+                "avg_parse_seconds": self.parse_seconds / self.llm_calls if self.llm_calls else 0.0,
+                "avg_prompt_eval_tokens": self.prompt_eval_tokens / self.prompt_eval_calls if self.prompt_eval_calls else 0.0,
+                "avg_prompt_eval_seconds": self.prompt_eval_seconds / self.prompt_eval_calls if self.prompt_eval_calls else 0.0,
+            }
+        return {
+            "messages": self.messages_seen,
+            "fast_path_hits": self.fast_path_hits,
+            "fast_path_rate": self.fast_path_hits / self.messages_seen if self.messages_seen else 0.0,
+            "llm": llm,
+            "cache": self.cache.stats() if self.cache is not None else {},
+            "pool": self.pool.stats(),
+        }
+
+    @staticmethod
+    def _set_parse(message: Message, parse: Dict[Text, Any]) -> None:
+        message.set("intent", {"name": parse["intent"], "confidence": 0.9})
+        # copied so later components can't modify the cached entities
+        message.set("entities", copy.deepcopy(parse["entities"]))
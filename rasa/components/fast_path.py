@@ -0,0 +1,132 @@
+import re
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+from .nlu_tables import COLOR_CATEGORY_IDS, ITEM_TYPE_NORMALIZATION
+
+# Whole-message phrases (lowercase, punctuation stripped) for the easy intents
+INTENT_PHRASES = {
+    "greet": {
+        "hey", "hello", "hi", "hello there", "good morning", "good evening", "moin",
+        "hey there", "hey dude", "goodmorning", "goodevening", "good afternoon",
+    },
+    "goodbye": {
+        "cu", "good by", "cee you later", "good night", "bye", "goodbye", "have a nice day",
+        "see you around", "bye bye", "see you later",
+    },
+    "affirm": {
+        "yes", "y", "indeed", "of course", "that sounds good", "correct", "yeah", "yep",
+        "sure", "ok", "okay",
+    },
+    "deny": {
+        "no", "n", "never", "i don't think so", "don't like that", "no way", "not really", "nope",
+    },
+    "book_item": {
+        "book this item for me", "i would like to reserve this item", "please book this item",
+        "can you book this item", "i want to book this", "reserve this for me", "can i book this item",
+        "i'll take this one", "yes, book it", "yes book it", "proceed with booking", "confirm my booking",
+    },
+    "bot_challenge": {
+        "are you a bot", "are you a human", "am i talking to a bot", "am i talking to a human",
+    },
+}
+
+# Words that may surround item types and colors in a search without changing
+# its meaning ("show me a red dress", "do you have any blue or green shoes")
+SEARCH_FILLER = {
+    "a", "about", "actually", "an", "and", "any", "are", "borrow", "can", "color", "colored",
+    "could", "do", "find", "for", "get", "got", "have", "i", "i'd", "i'm", "im", "in", "instead",
+    "is", "like", "look", "looking", "maybe", "me", "need", "of", "or", "pair", "please", "rather",
+    "search", "see", "show", "some", "something", "the", "there", "to", "want", "what", "would", "you",
+}
+
+# Item type words whose trailing "s" can be dropped ("shoe", "sneaker")
+_SINGULARS = {"shoes", "sneakers", "boots", "heels", "sandals"}
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:['’\-][a-z0-9]+)*", re.IGNORECASE)
+
+
+def _plurals(word: Text) -> List[Text]:
+    if word in _SINGULARS:
+        return [word, word[:-1]]
+    if word.endswith(("s", "x", "sh", "ch")):
+        return [word, word + "es"]
+    return [word, word + "s"]
+
+
+def _build_item_types() -> Dict[Tuple[Text, ...], Text]:
+    phrases = {}
+    for normalized, words in ITEM_TYPE_NORMALIZATION.items():
+        for word in [normalized] + words:
+            *head, last = word.split()
+            for form in _plurals(last):
+                phrases[tuple(head + [form])] = normalized
+    return phrases
+
+
+def normalize_phrase(text: Text) -> Text:
+    text = text.lower().replace("’", "'")
+    return " ".join(text.strip(" \t\n.,!?").split())
+
+
+class FastPathClassifier:
+    """ Rule-based pre-pass for OllamaNLU.
+
+    Answers messages that are fully covered by the shared tables (small talk
+    like "hi" / "yes" / "bye", and searches made only of colors, item types
+    and filler words like "show me a red dress") without calling the LLM.
+    Anything else, e.g. brand names or colors outside the table, returns None
+    and is escalated to Ollama.
+    """
+
+    def __init__(self, max_tokens: int = 8):
+        self.max_tokens = max_tokens
+        self.item_types = _build_item_types()
+        self.longest_item_type = max(len(phrase) for phrase in self.item_types)
+
+    def parse(self, text: Text) -> Optional[Dict[Text, Any]]:
+        """Return {"intent", "entities"} like a validated LLM parse, or None."""
+        phrase = normalize_phrase(text)
+        for intent, phrases in INTENT_PHRASES.items():
+            if phrase in phrases:
+                return {"intent": intent, "entities": []}
+
+        tokens = [(m.group().lower().replace("’", "'"), m.start(), m.end()) for m in _TOKEN.finditer(text)]
+        if not tokens or len(tokens) > self.max_tokens:
+            return None
+        return self._parse_search(tokens)
+
+    def _parse_search(self, tokens: List[Tuple[Text, int, int]]) -> Optional[Dict[Text, Any]]:
+        colors: List[Tuple[Text, int, int]] = []
+        item_types: List[Tuple[Text, int, int]] = []
+        i = 0
+        while i < len(tokens):
+            # longest item type phrase starting here ("denim pants" before "denim")
+            for size in range(min(self.longest_item_type, len(tokens) - i), 0, -1):
+                words = tuple(token[0] for token in tokens[i:i + size])
+                if words in self.item_types:
+                    item_types.append((self.item_types[words], tokens[i][1], tokens[i + size - 1][2]))
+                    i += size
+                    break
+            else:
+                word, start, end = tokens[i]
+                if word in COLOR_CATEGORY_IDS:
+                    colors.append((COLOR_CATEGORY_IDS[word], start, end))
+                elif word not in SEARCH_FILLER:
+                    # unknown word, could be a brand or an unlisted color
+                    return None
+                i += 1
+
+        if len(item_types) > 1 or (not item_types and not colors):
+            return None
+
+        entities = []
+        if colors:
+            entities.append({
+                "entity": "color",
+                "value": list(dict.fromkeys(color_id for color_id, _, _ in colors)),
+                "start": colors[0][1],
+                "end": colors[-1][2],
+            })
+        for item_type, start, end in item_types:
+            entities.append({"entity": "item_type", "value": item_type, "start": start, "end": end})
+        return {"intent": "find_item", "entities": entities}
@@ -0,0 +1,59 @@
+from typing import Optional, Text
+
+
+class JSONValueScanner:
+    """ Finds where the first top-level JSON object/array in a token stream ends.
+
+    Feed it the text chunks streamed by Ollama; it tracks bracket depth while
+    skipping over string contents and escapes, and `feed` returns True once the
+    top-level value is closed. Anything before the opening brace (e.g. a
+    ```json fence) is ignored. It doesn't validate the JSON, `json.loads` on
+    `value()` does that.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._chunks = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self._complete = False
+
+    def feed(self, text: Text) -> bool:
+        if self._complete:
+            return True
+        start = 0
+        for i, ch in enumerate(text):
+            if not self._started:
+                if ch in "{[":
+                    self._started = True
+                    self._depth = 1
+                    start = i
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._chunks.append(text[start:i + 1])
+                    self._complete = True
+                    return True
+        if self._started:
+            self._chunks.append(text[start:])
+        return False
+
+    def value(self) -> Optional[Text]:
+        """The complete top-level value, or None while it is still open."""
+        return "".join(self._chunks) if self._complete else None
@@ -0,0 +1,34 @@
+# Tables shared by the OllamaNLU prompt and its rule-based fast path, so the
+# two can't drift apart.
+
+# Intents the LLM is asked to choose from, with the description used in the prompt
+INTENT_DESCRIPTIONS = {
+    "find_item": "user wants to search/find/look for clothing",
+    "greet": "user says hello/hi",
+    "goodbye": "user says bye/goodbye",
+    "affirm": "user says yes/ok/sure",
+    "deny": "user says no/nope",
+    "book_item": "user wants to book/reserve an item",
+}
+
+# Color names to the NUMERIC category IDs from the database
+COLOR_CATEGORY_IDS = {
+    "black": "10",
+    "white": "11",
+    "red": "12",
+    "blue": "13",
+    "green": "14",
+    "pink": "15",
+}
+
+# Normalized item_type -> words that map to it
+ITEM_TYPE_NORMALIZATION = {
+    "dress": ["gown", "frock", "sundress"],
+    "shirt": ["top", "tee", "t-shirt", "tshirt", "blouse", "button-up"],
+    "pants": ["trousers", "slacks", "chinos", "leggings"],
+    "jacket": ["blazer", "coat", "cardigan", "sweater", "hoodie", "outerwear"],
+    "skirt": ["miniskirt", "maxi skirt"],
+    "jeans": ["denim", "denim pants"],
+    "shorts": ["short pants"],
+    "shoes": ["sneakers", "boots", "heels", "sandals", "footwear"],
+}
@@ -0,0 +1,278 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Text, Tuple
+
+import requests
+
+
+class NoBackendAvailable(requests.ConnectionError):
+    """Every Ollama endpoint is down or has its circuit open."""
+
+
+class CallCancelled(Exception):
+    """Raised inside an attempt that lost a hedge race; the pool ignores it."""
+
+
+class OllamaError(requests.RequestException):
+    """Ollama answered with an error instead of output (e.g. an `{"error": ...}`
+    line mid-stream); counts against the endpoint like a 5xx."""
+
+
+class BadRequest(ValueError):
+    """Ollama rejected the request itself (a 4xx); every endpoint would, so it
+    neither counts against the endpoint nor fails over."""
+
+
+# 4xx statuses that are about the endpoint rather than the request: the model
+# isn't pulled on that replica, or it is overloaded
+_ENDPOINT_CLIENT_ERRORS = frozenset((404, 408, 429))
+
+
+class OllamaEndpoint:
+    """ One Ollama server and its circuit breaker state.
+
+    The circuit opens after `failure_threshold` failed calls in a row. While
+    open the endpoint gets no traffic; once `reset_timeout` has passed a single
+    trial call is let through, which closes the circuit again on success.
+    """
+
+    def __init__(self, url: Text):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.healthy = True
+        self.calls = 0
+        self.errors = 0
+
+    def state(self, now: float, reset_timeout: float) -> Text:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if now - self.opened_at >= reset_timeout else "open"
+
+
+class OllamaPool:
+    """ Routes OllamaNLU's LLM calls over one or more Ollama endpoints.
+
+    Each call goes to the available endpoint with the fewest outstanding
+    requests. Endpoints fail over on connection errors, timeouts, 5xx
+    responses and Ollama errors (OllamaError), trip a circuit breaker after
+    repeated failures and, with a `health_check_interval` and more than one
+    endpoint, are polled on /api/tags in the background. Endpoints failing
+    that check are skipped only while another one passes it. A 4xx about the
+    request itself is raised as BadRequest without failing over.
+
+    With `hedge_after` set, a call that hasn't finished after that many
+    seconds is also sent to a second endpoint and the first answer wins. With a
+    `fallback_model`, calls go to that (smaller) model when the chosen
+    endpoint already has `overload_threshold` requests outstanding.
+
+    `call(fn)` runs `fn(url, model, cancelled)`, where `cancelled` is a
+    threading.Event set once another attempt has won; `fn` should raise
+    CallCancelled when it notices. It returns `(result, model)`, with the
+    model that answered, so callers can tell fallback answers apart.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[Text],
+        model: Text,
+        fallback_model: Optional[Text] = None,
+        overload_threshold: Optional[int] = None,
+        hedge_after: Optional[float] = None,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        health_check_interval: Optional[float] = None,
+        session: Optional[requests.Session] = None,
+        max_workers: int = 8,
+    ):
+        if not urls:
+            raise ValueError("OllamaPool needs at least one endpoint url")
+        self.endpoints = [OllamaEndpoint(url) for url in urls]
+        self.model = model
+        self.fallback_model = fallback_model
+        self.overload_threshold = overload_threshold
+        self.hedge_after = hedge_after if len(self.endpoints) > 1 else None
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if self.hedge_after else None
+
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallback_model_calls = 0
+
+        self._stop = threading.Event()
+        # with a single endpoint there is nothing to route around
+        if health_check_interval and len(self.endpoints) > 1:
+            threading.Thread(
+                target=self._health_loop, args=(health_check_interval,), name="ollama-health", daemon=True
+            ).start()
+
+    def call(self, fn: Callable[[Text, Text, threading.Event], Any]) -> Tuple[Any, Text]:
+        cancelled = threading.Event()
+        tried: List[OllamaEndpoint] = []
+        if self._executor is None:
+            # no hedging: try the endpoints one after another
+            last_error = None
+            while True:
+                acquired = self._acquire(tried)
+                if acquired is None:
+                    raise NoBackendAvailable(f"No Ollama endpoint could serve the request: {last_error}")
+                tried.append(acquired[0])
+                try:
+                    return self._attempt(acquired, fn, cancelled)
+                except requests.RequestException as e:
+                    last_error = e
+
+        attempts = {}
+
+        def launch() -> bool:
+            acquired = self._acquire(tried)
+            if acquired is None:
+                return False
+            tried.append(acquired[0])
+            attempts[self._executor.submit(self._attempt, acquired, fn, cancelled)] = len(tried)
+            return True
+
+        last_error = None
+        hedged = False
+        try:
+            launch()
+            while attempts:
+                done, _ = wait(attempts, timeout=None if hedged else self.hedge_after, return_when=FIRST_COMPLETED)
+                if not done:
+                    # the first attempt is slow, race it against another replica
+                    hedged = True
+                    if launch():
+                        with self._lock:
+                            self.hedges += 1
+                    continue
+                for future in done:
+                    attempt = attempts.pop(future)
+                    try:
+                        result = future.result()
+                    except requests.RequestException as e:
+                        last_error = e
+                        if not attempts:
+                            launch()
+                        continue
+                    if attempt > 1 and hedged:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return result
+        finally:
+            cancelled.set()
+        raise NoBackendAvailable(f"No Ollama endpoint could serve the request: {last_error}")
+
+    def stats(self) -> Dict[Text, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "endpoints": [
+                    {
+                        "url": endpoint.url,
+                        "state": endpoint.state(now, self.reset_timeout),
+                        "healthy": endpoint.healthy,
+                        "outstanding": endpoint.outstanding,
+                        "calls": endpoint.calls,
+                        "errors": endpoint.errors,
+                    }
+                    for endpoint in self.endpoints
+                ],
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "fallback_model_calls": self.fallback_model_calls,
+            }
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _acquire(self, exclude: Sequence[OllamaEndpoint]) -> Optional[Tuple[OllamaEndpoint, Text, bool]]:
+        """Pick the least busy endpoint that may take traffic and reserve a slot
+        on it. Returns the endpoint, the model to use and whether the call is
+        the trial of a half-open circuit."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint in exclude:
+                    continue
+                state = endpoint.state(now, self.reset_timeout)
+                if state == "open" or (state == "half_open" and endpoint.trial_in_flight):
+                    continue
+                candidates.append(endpoint)
+            # a failed health check only routes around an endpoint while another
+            # one is up; a busy replica can miss a check and still serve calls
+            candidates = [endpoint for endpoint in candidates if endpoint.healthy] or candidates
+            if not candidates:
+                return None
+
+            # ties go to the first endpoint in the configured order
+            endpoint = min(candidates, key=lambda e: e.outstanding)
+            model = self.model
+            if self.fallback_model and self.overload_threshold and endpoint.outstanding >= self.overload_threshold:
+                model = self.fallback_model
+                self.fallback_model_calls += 1
+            trial = endpoint.opened_at is not None
+            if trial:
+                endpoint.trial_in_flight = True
+            endpoint.outstanding += 1
+            endpoint.calls += 1
+            return endpoint, model, trial
+
+    def _attempt(self, acquired: Tuple[OllamaEndpoint, Text, bool], fn, cancelled: threading.Event) -> Tuple[Any, Text]:
+        endpoint, model, trial = acquired
+        try:
+            result = fn(endpoint.url, model, cancelled)
+        except CallCancelled:
+            self._release(endpoint, trial, None)
+            raise
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and 400 <= status < 500 and status not in _ENDPOINT_CLIENT_ERRORS:
+                self._release(endpoint, trial, None)
+                raise BadRequest(f"{endpoint.url} rejected the request: {e}") from e
+            self._release(endpoint, trial, False)
+            raise
+        except requests.RequestException:
+            self._release(endpoint, trial, False)
+            raise
+        except Exception:
+            # the endpoint answered, the output was the problem
+            self._release(endpoint, trial, True)
+            raise
+        self._release(endpoint, trial, True)
+        return result, model
+
+    def _release(self, endpoint: OllamaEndpoint, trial: bool, ok: Optional[bool]) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            if trial:
+                # only the trial itself; calls from before the circuit opened
+                # must not let another trial through
+                endpoint.trial_in_flight = False
+            if ok:
+                endpoint.failures = 0
+                endpoint.opened_at = None
+            elif ok is False:
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= self.failure_threshold:
+                    endpoint.opened_at = time.monotonic()
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            for endpoint in self.endpoints:
+                try:
+                    self.session.get(f"{endpoint.url}/api/tags", timeout=min(interval, 5)).raise_for_status()
+                    healthy = True
+                except requests.RequestException:
+                    healthy = False
+                with self._lock:
+                    endpoint.healthy = healthy
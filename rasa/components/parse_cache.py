@@ -0,0 +1,136 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Text, Tuple
+
+
+# bumped whenever normalize_text changes, so entries persisted under the
+# old normalization are never served
+_KEY_VERSION = "2"
+
+
+def normalize_text(text: Text) -> Text:
+    """Case-insensitive form of a message (ends stripped), used as cache key.
+
+    Whitespace inside the message is kept as it is: a cached parse carries
+    entity start/end offsets, which only fit messages with the same spacing.
+    """
+    return text.strip().lower()
+
+
+class ParseCache:
+    """ LRU/TTL cache of validated OllamaNLU parses, optionally backed by SQLite.
+
+    Keys combine the normalized message text, the model name and a hash of the
+    prompt, so changing either the model or the prompt never serves stale
+    parses. With a `path`, entries are also written to an SQLite file, which
+    keeps the `max_size` newest ones, so recent entries survive restarts.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float], path: Optional[Text] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Text, Tuple[Dict[Text, Any], float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite I/O has its own lock, so lookups served from memory never
+        # wait behind the disk
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, latency REAL NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS parse_cache_created ON parse_cache (created)")
+            self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(text: Text, model: Text, prompt: Text) -> Text:
+        prompt_hash = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha1(
+            f"{_KEY_VERSION}\0{model}\0{prompt_hash}\0{normalize_text(text)}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: Text) -> Optional[Dict[Text, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        from_db = False
+        if entry is None and self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, latency, created FROM parse_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                entry = (json.loads(row[0]), row[1], row[2])
+                from_db = True
+
+        if entry is not None and self.ttl and now - entry[2] > self.ttl:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            if self._db is not None:
+                with self._db_lock:
+                    self._db.execute("DELETE FROM parse_cache WHERE key = ?", (key,))
+                    self._db.commit()
+            return None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if from_db:
+                self._remember(key, entry)
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+    def put(self, key: Text, value: Dict[Text, Any], latency: float) -> None:
+        """Store a validated parse along with how long the LLM took to produce it."""
+        entry = (value, latency, time.time())
+        with self._lock:
+            self._remember(key, entry)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO parse_cache (key, value, latency, created) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), latency, entry[2]),
+                )
+                # the file keeps the max_size newest entries, like the LRU in
+                # memory keeps max_size, and drops expired ones
+                self._db.execute(
+                    "DELETE FROM parse_cache WHERE created < ("
+                    "SELECT created FROM parse_cache ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                    (self.max_size - 1,),
+                )
+                if self.ttl:
+                    self._db.execute("DELETE FROM parse_cache WHERE created < ?", (entry[2] - self.ttl,))
+                self._db.commit()
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def _remember(self, key: Text, entry: Tuple[Dict[Text, Any], float, float]) -> None:
+        # caller holds self._lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,237 @@
+# Latency histograms, counters and stats gauges for the actions and the
+# OllamaNLU component, rendered in the Prometheus text format.
+#
+# This module is shared by the action server (actions/) and the Rasa server
+# (components/), so it depends on neither: both import it as `metrics` from
+# the rasa directory, like they import their own packages.
+#
+# Each module declares its own metrics on the shared REGISTRY, e.g.
+#
+#   CATALOG_FETCH_SECONDS = REGISTRY.histogram("closet_catalog_fetch_seconds", "...")
+#   with CATALOG_FETCH_SECONDS.time():
+#       ...
+#
+# and existing stats() dicts are exported as gauges via REGISTRY.register_stats.
+# The action server serves REGISTRY on /metrics (see rasa_sdk_plugins); other
+# processes, like the Rasa server running OllamaNLU, can use
+# start_metrics_server(port).
+#
+# Values are per process: with several action server workers each one
+# reports its own.
+
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Text, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; covers in-memory filtering (~ms) up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[Text, ...]
+
+# Fraction of log_sampled() lines actually written (when their level is
+# enabled), e.g. LOG_SAMPLE_RATE=0.01 to keep per-message lines affordable
+# under load
+try:
+    LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+except ValueError:
+    LOG_SAMPLE_RATE = 1.0
+
+
+def _format_labels(names: Sequence[Text], values: Sequence[Any]) -> Text:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: Text, documentation: Text, labelnames: Sequence[Text] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[Text, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[Text]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[Text]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: Text, documentation: Text, labelnames: Sequence[Text] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[Text]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: Text, documentation: Text, labelnames: Sequence[Text] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts, sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe how long the block takes, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[Text]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (repr(float(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def _flatten(stats: Dict[Text, Any], prefix: Text) -> Iterator[Tuple[Text, float]]:
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, bool):
+            yield name, float(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[Text, _Metric] = {}
+        self._stats: Dict[Text, Callable[[], Dict[Text, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: Text, documentation: Text, labelnames: Sequence[Text] = (), **kwargs: Any) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def counter(self, name: Text, documentation: Text, labelnames: Sequence[Text] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def register_stats(self, prefix: Text, stats: Callable[[], Dict[Text, Any]]) -> None:
+        """Export the numeric values of a stats() dict as gauges named
+        <prefix>_<key> (nested dicts are joined with "_"). Registering the
+        same prefix again replaces the previous source."""
+        with self._lock:
+            self._stats[prefix] = stats
+
+    def render(self) -> Text:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            stats = list(self._stats.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, source in stats:
+            try:
+                values = list(_flatten(source(), prefix))
+            except Exception:
+                logger.exception("Stats source %s failed", prefix)
+                continue
+            for name, value in values:
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # modules reloaded by the action server's auto-reload
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+REGISTRY = Registry()
+
+
+def log_sampled(log: logging.Logger, level: int, msg: Text, *args: Any, rate: Optional[float] = None) -> None:
+    """Log only if `level` is enabled, and then only a `rate` fraction of the
+    calls (LOG_SAMPLE_RATE by default). The arguments are only
+    formatted for the lines that are written."""
+    if not log.isEnabledFor(level):
+        return
+    if random.random() >= (LOG_SAMPLE_RATE if rate is None else rate):
+        return
+    log.log(level, msg, *args)
+
+
+def start_metrics_server(port: int, registry: Registry = REGISTRY, host: Text = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve `registry` on http://host:port/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("metrics: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return server
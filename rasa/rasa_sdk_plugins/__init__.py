@@ -0,0 +1,24 @@
+# Action server plugin: rasa_sdk imports this package (when it is importable,
+# i.e. the action server is started from the rasa directory) and lets it
+# extend the Sanic app. We add GET /metrics with the action metrics in the
+# Prometheus text format.
+
+import sys
+
+import pluggy
+from sanic import Sanic, response
+
+from metrics import CONTENT_TYPE, REGISTRY
+
+hookimpl = pluggy.HookimplMarker("rasa_sdk")
+
+
+@hookimpl
+def attach_sanic_app_extensions(app: Sanic) -> None:
+    @app.get("/metrics")
+    async def metrics(request):
+        return response.text(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def init_hooks(manager: pluggy.PluginManager) -> None:
+    manager.register(sys.modules[__name__])
@@ -0,0 +1,12 @@
+# The tests import the action server (actions), the NLU components
+# (components) and the benchmark stubs the same way the benchmarks do, from
+# the rasa directory:
+#
+#   cd rasa
+#   python -m pytest tests
+
+import os
+import sys
+
+RASA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RASA_DIR, os.path.join(RASA_DIR, "benchmarks")]
@@ -0,0 +1,105 @@
+# Delta sync from /api/posts-changes must leave the catalog snapshot and the
+# search index exactly as a full reload would, and a change log pruned past
+# the cache's watermark (410) must fall back to a full refresh.
+
+import random
+
+import pytest
+from stub_backend import ADJECTIVES, BRANDS, ITEM_TYPES, StubBackend, make_catalog
+
+from actions import settings
+from actions.catalog import CatalogCache, fetch_changes_http, fetch_posts_http
+from actions.records import PostRecord
+from actions.search import COLOR_CATEGORY_IDS, ITEM_TYPE_SYNONYMS, SearchIndex
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    stub = StubBackend(catalog_size=300).start()
+    monkeypatch.setattr(settings, "API_BASE_URL", stub.url)
+    yield stub
+    stub.stop()
+
+
+def _cache(compact):
+    cache = CatalogCache(
+        fetch_posts_http, ttl=60, fetch_changes=fetch_changes_http, reconcile_interval=3600,
+        record=PostRecord.from_post if compact else None,
+    )
+    index = SearchIndex()
+    cache.add_listener(index.apply)
+    return cache, index
+
+
+def _edit(backend, rng, next_post_id):
+    for _ in range(rng.randint(1, 15)):
+        action = rng.random()
+        if action < 0.5:
+            post = dict(rng.choice(backend.posts))
+            post["title"] = f"{rng.choice(ADJECTIVES)} {rng.choice(BRANDS)} {rng.choice(ITEM_TYPES)}"
+            post["description"] = f"Barely worn {post['title'].lower()}"
+            post["categories"] = rng.sample(range(1, 16), rng.randint(0, 4))
+            post["images"] = [f"https://example.com/images/{post['post_id']}-{rng.randrange(100)}.jpg"]
+            backend.upsert_post(post)
+        elif action < 0.8:
+            post = make_catalog(1, seed=rng.randrange(10 ** 6))[0]
+            post["post_id"] = next_post_id
+            next_post_id += 1
+            backend.upsert_post(post)
+        else:
+            backend.remove_post(rng.choice(backend.posts)["post_id"])
+    return next_post_id
+
+
+def _assert_same_as_full_reload(cache, index, compact):
+    fresh, fresh_index = _cache(compact)
+    assert fresh.refresh()
+    assert list(cache.snapshot().items()) == list(fresh.snapshot().items())
+
+    post_ids = list(fresh.snapshot())
+    assert index.features(post_ids) == fresh_index.features(post_ids)
+    assert index.texts(post_ids) == fresh_index.texts(post_ids)
+    for synonyms in ITEM_TYPE_SYNONYMS.values():
+        for color_ids in (None, list(COLOR_CATEGORY_IDS.values())[:2]):
+            assert index.filter(synonyms, color_ids) == fresh_index.filter(synonyms, color_ids)
+    assert index.filter([], None) == post_ids
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_delta_sync_matches_full_reload(backend, compact):
+    rng = random.Random(21)
+    next_post_id = max(post["post_id"] for post in backend.posts) + 1
+    cache, index = _cache(compact)
+    assert cache.refresh()
+    # fills the memoized synonym postings, which deltas must keep current
+    _assert_same_as_full_reload(cache, index, compact)
+
+    for step in range(1, 11):
+        next_post_id = _edit(backend, rng, next_post_id)
+        assert cache.refresh()
+        assert cache.stats()["delta_refreshes"] == step
+        _assert_same_as_full_reload(cache, index, compact)
+    assert backend.calls["/api/posts-all"] == 1 + 11
+
+
+def test_pruned_change_log_falls_back_to_full_refresh(backend):
+    rng = random.Random(5)
+    next_post_id = max(post["post_id"] for post in backend.posts) + 1
+    cache, index = _cache(compact=True)
+    assert cache.refresh()
+
+    next_post_id = _edit(backend, rng, next_post_id)
+    backend.prune_changes()
+    next_post_id = _edit(backend, rng, next_post_id)
+    full_downloads = backend.calls["/api/posts-all"]
+
+    assert cache.refresh()
+    assert cache.stats()["delta_refreshes"] == 0
+    assert backend.calls["/api/posts-all"] == full_downloads + 1
+    _assert_same_as_full_reload(cache, index, compact=True)
+
+    # the full refresh moved the watermark on, so deltas work again
+    _edit(backend, rng, next_post_id)
+    assert cache.refresh()
+    assert cache.stats()["delta_refreshes"] == 1
+    _assert_same_as_full_reload(cache, index, compact=True)
@@ -0,0 +1,174 @@
+# Result cursors: paging through ranked results, the store's TTL/LRU expiry
+# and sender check, and ActionShowNextItem rebuilding a cursor this process
+# doesn't have (another worker's, or one lost in a restart) from the slots.
+
+import asyncio
+import time
+
+import pytest
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+from stub_backend import StubBackend
+
+from actions import settings
+from actions.actions import ActionFindItem, ActionShowNextItem
+from actions.backend import backend as backend_client
+from actions.cursor import ResultStore, result_store
+from actions.prefetch import prefetcher
+from actions.ranking import RankedResults
+
+POST_IDS = list(range(100, 125))
+
+
+def _ranked(post_ids):
+    # best first: higher scores for earlier ids
+    return RankedResults((len(post_ids) - i, i, post_id) for i, post_id in enumerate(post_ids))
+
+
+class _Fetcher:
+    def __init__(self, fail_once=False):
+        self.pages = []
+        self.fail_once = fail_once
+
+    async def __call__(self, post_ids):
+        self.pages.append(list(post_ids))
+        if self.fail_once:
+            self.fail_once = False
+            raise ConnectionError("backend down")
+        return [{"post_id": post_id} for post_id in post_ids]
+
+
+def _load_all(cursor, fetch, start=0, page_size=10):
+    async def load():
+        return [await cursor.load(index, fetch, page_size) for index in range(start, len(cursor) + 1)]
+    return asyncio.run(load())
+
+
+def test_cursor_loads_pages_in_rank_order():
+    remaining = _ranked(POST_IDS)
+    first_page = [{"post_id": post_id} for post_id in remaining.take(10)]
+    cursor = ResultStore(10, 60).create("alice", first_page, remaining)
+    fetch = _Fetcher()
+
+    loaded = _load_all(cursor, fetch)
+
+    assert [post["post_id"] for post in loaded[:-1]] == POST_IDS
+    assert loaded[-1] is None
+    assert fetch.pages == [POST_IDS[10:20], POST_IDS[20:]]
+    assert len(cursor) == len(POST_IDS)
+
+
+def test_rebuilt_cursor_starts_at_its_offset():
+    remaining = _ranked(POST_IDS)
+    remaining.take(7)
+    cursor = ResultStore(10, 60).create("alice", [], remaining, cursor_id="abc", offset=7)
+    fetch = _Fetcher()
+
+    assert cursor.cursor_id == "abc"
+    assert len(cursor) == len(POST_IDS)
+    assert asyncio.run(cursor.load(6, fetch, 10)) is None
+    loaded = _load_all(cursor, fetch, start=7)
+    assert [post["post_id"] for post in loaded[:-1]] == POST_IDS[7:]
+    assert fetch.pages == [POST_IDS[7:17], POST_IDS[17:]]
+
+
+def test_failed_page_is_loaded_again():
+    cursor = ResultStore(10, 60).create("alice", [], _ranked(POST_IDS))
+    fetch = _Fetcher(fail_once=True)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cursor.load(0, fetch, 10))
+    assert asyncio.run(cursor.load(0, fetch, 10)) == {"post_id": POST_IDS[0]}
+    assert fetch.pages == [POST_IDS[:10], POST_IDS[:10]]
+
+
+def test_store_only_returns_a_cursor_to_its_sender():
+    store = ResultStore(10, 60)
+    cursor = store.create("alice", [], _ranked(POST_IDS))
+
+    assert store.get(cursor.cursor_id, "alice") is cursor
+    assert store.get(cursor.cursor_id, "mallory") is None
+    assert store.get(None, "alice") is None
+
+
+def test_store_expires_and_evicts_least_recently_used():
+    store = ResultStore(2, 0.05)
+    first = store.create("alice", [])
+    second = store.create("bob", [])
+    assert store.get(first.cursor_id, "alice") is first
+    # second is now the least recently used one
+    third = store.create("carol", [])
+    assert store.get(second.cursor_id, "bob") is None
+    assert store.evictions == 1
+
+    time.sleep(0.1)
+    assert store.get(third.cursor_id, "carol") is None
+    assert store.stats()["cursors"] == 1
+
+
+@pytest.fixture(scope="module")
+def backend():
+    stub = StubBackend(catalog_size=2000).start()
+    base_url = settings.API_BASE_URL
+    settings.API_BASE_URL = backend_client.base_url = stub.url
+    yield stub
+    settings.API_BASE_URL = backend_client.base_url = base_url
+    stub.stop()
+
+
+async def _turn(action, sender, slots, entities=()):
+    tracker = Tracker(sender, dict(slots), {"text": "x", "entities": list(entities)}, [], False, None, {}, None)
+    for event in await action.run(CollectingDispatcher(), tracker, {}):
+        slots[event["name"]] = event["value"]
+    return slots.get("selected_post_id")
+
+
+async def _browse(sender, entities, lose_cursor):
+    """post_ids shown by a search and every "next" after it."""
+    slots = {}
+    shown = [await _turn(ActionFindItem(), sender, slots, entities)]
+    while slots.get("filtered_items"):
+        if lose_cursor:
+            # every "next" reaches a worker that doesn't have the cursor
+            result_store.discard(slots["filtered_items"])
+            prefetcher.cancel(sender)
+        shown.append(await _turn(ActionShowNextItem(), sender, slots))
+    prefetcher.cancel(sender)
+    return shown[:-1]
+
+
+@pytest.mark.parametrize("entities", [
+    [{"entity": "item_type", "value": "shoes"}, {"entity": "color", "value": ["red"]}],
+    [{"entity": "item_name", "value": "nike"}, {"entity": "item_type", "value": "dress"}],
+])
+def test_next_after_losing_the_cursor_shows_the_same_items(backend, entities):
+    kept = asyncio.run(_browse("kept", entities, lose_cursor=False))
+    rebuilt = asyncio.run(_browse("rebuilt", entities, lose_cursor=True))
+
+    # past the first page, so rebuilt cursors also load pages
+    assert len(kept) > settings.SEARCH_TOP_K + 1
+    assert rebuilt == kept
+
+
+def test_next_with_another_senders_cursor_uses_own_search(backend):
+    async def conversation():
+        alice = {}
+        await _turn(ActionFindItem(), "alice", alice, [{"entity": "item_type", "value": "shoes"}])
+        bob = {}
+        await _turn(ActionFindItem(), "bob", bob, [{"entity": "item_type", "value": "dress"}])
+        bobs_next = await _turn(ActionShowNextItem(), "bob", dict(bob))
+
+        # bob's slots, but alice's cursor id
+        mallory = {**bob, "filtered_items": alice["filtered_items"]}
+        shown = await _turn(ActionShowNextItem(), "mallory", mallory)
+        alices_next = await _turn(ActionShowNextItem(), "alice", dict(alice))
+        for sender in ("alice", "bob", "mallory"):
+            prefetcher.cancel(sender)
+        return shown, bobs_next, alices_next, alice
+
+    shown, bobs_next, alices_next, alice = asyncio.run(conversation())
+    assert shown == bobs_next
+    assert alices_next != shown
+    assert result_store.get(alice["filtered_items"], "mallory") is None
+    # mallory's rebuilt cursor got its own id instead of replacing alice's
+    assert result_store.get(alice["filtered_items"], "alice") is not None
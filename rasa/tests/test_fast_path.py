@@ -0,0 +1,48 @@
+# The fast path answers without the LLM, so its parses skip the checks an LLM
+# answer gets: entity offsets must point at the words in the original text and
+# colors must come out as category ids.
+
+import pytest
+
+from components.fast_path import FastPathClassifier
+
+classifier = FastPathClassifier()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("show me a red dress", [("color", ["12"], "red"), ("item_type", "dress", "dress")]),
+    ("Do you have any blue or green shoes?", [("color", ["13", "14"], "blue or green"), ("item_type", "shoes", "shoes")]),
+    ("  RED   Sneaker ", [("color", ["12"], "RED"), ("item_type", "shoes", "Sneaker")]),
+    ("t-shirt in black", [("color", ["10"], "black"), ("item_type", "shirt", "t-shirt")]),
+    ("I’m looking for pink heels", [("color", ["15"], "pink"), ("item_type", "shoes", "heels")]),
+    ("red red dress", [("color", ["12"], "red red"), ("item_type", "dress", "dress")]),
+    ("denim pants", [("item_type", "jeans", "denim pants")]),
+    ("white button-ups please", [("color", ["11"], "white"), ("item_type", "shirt", "button-ups")]),
+    ("blue", [("color", ["13"], "blue")]),
+])
+def test_search_entities(text, expected):
+    parse = classifier.parse(text)
+
+    assert parse["intent"] == "find_item"
+    assert [(e["entity"], e["value"], text[e["start"]:e["end"]]) for e in parse["entities"]] == expected
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Hello there!", "greet"),
+    ("  yes ", "affirm"),
+    ("Bye bye.", "goodbye"),
+    ("I don’t think so", "deny"),
+])
+def test_small_talk(text, intent):
+    assert classifier.parse(text) == {"intent": intent, "entities": []}
+
+
+@pytest.mark.parametrize("text", [
+    "nike shoes",  # brand
+    "purple dress",  # color outside the table
+    "red dress and blue shoes",  # two item types
+    "show me something please",  # nothing to search for
+    "do you have a red dress in a size that would fit me",  # too long
+])
+def test_escalates_to_the_llm(text):
+    assert classifier.parse(text) is None
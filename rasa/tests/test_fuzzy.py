@@ -0,0 +1,57 @@
+# The indexed item_name matcher must return exactly what the original
+# per-post thefuzz loop (reference mode) returns, scores included.
+
+import random
+
+import pytest
+from stub_backend import BRANDS, ITEM_TYPES, make_catalog
+
+from actions.fuzzy import FuzzyMatcher
+from actions.records import PostRecord
+from actions.search import SearchIndex
+
+
+def _index(compact: bool) -> SearchIndex:
+    posts = make_catalog(1000, seed=3)
+    if compact:
+        posts = [PostRecord.from_post(post) for post in posts]
+    index = SearchIndex()
+    index.apply([post["post_id"] for post in posts], posts, [])
+    return index
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    if len(word) < 2:
+        return word
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def _item_names(n: int, seed: int):
+    rng = random.Random(seed)
+    words = BRANDS + ITEM_TYPES + ["red", "ore", "uni", "vintage", "north face", "x", "zz"]
+    names = []
+    for _ in range(n):
+        word = rng.choice(words)
+        names.append(rng.choice([word, word.lower(), _typo(word.lower(), rng), word[: rng.randint(2, 5)]]))
+    return names
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_indexed_matches_reference(compact):
+    index = _index(compact)
+    reference = FuzzyMatcher(index, mode="reference")
+    indexed = FuzzyMatcher(index, mode="indexed")
+    post_ids = index.filter([], None)
+    for item_name in _item_names(60, seed=7):
+        assert indexed.match(item_name, post_ids) == reference.match(item_name, post_ids), item_name
+
+
+def test_indexed_matches_reference_on_filtered_candidates():
+    index = _index(compact=True)
+    reference = FuzzyMatcher(index, mode="reference")
+    indexed = FuzzyMatcher(index, mode="indexed")
+    post_ids = index.filter(["sneakers", "boots"], [12, 13])
+    assert post_ids
+    for item_name in ("nike", "nkie", "vans", "adidas"):
+        assert indexed.match(item_name, post_ids) == reference.match(item_name, post_ids), item_name
@@ -0,0 +1,301 @@
+# OllamaPool against stub Ollama servers: failover, the circuit breaker and
+# its half-open trial, hedging and the overload fallback model.
+
+import gc
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from stub_ollama import StubOllama
+
+from components.ollama_pool import BadRequest, CallCancelled, NoBackendAvailable, OllamaError, OllamaPool
+
+MODEL = "llama3"
+RESPONSES = {"hi": json.dumps({"intent": "greet", "entities": []})}
+
+
+@pytest.fixture
+def stubs():
+    started = []
+
+    def start(**kwargs) -> StubOllama:
+        stub = StubOllama(RESPONSES, **kwargs).start()
+        started.append(stub)
+        return stub
+
+    yield start
+    for stub in started:
+        stub.stop()
+
+
+def _dead_url() -> str:
+    # a port nothing listens on
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def _generate(url, model, cancelled):
+    r = requests.post(
+        f"{url}/api/generate", json={"model": model, "prompt": 'User message: "hi"', "stream": False}, timeout=5
+    )
+    r.raise_for_status()
+    if cancelled.is_set():
+        raise CallCancelled()
+    return r.json()
+
+
+def _states(pool: OllamaPool):
+    return [endpoint["state"] for endpoint in pool.stats()["endpoints"]]
+
+
+def test_fails_over_to_the_next_endpoint(stubs):
+    stub = stubs()
+    pool = OllamaPool([_dead_url(), stub.url], MODEL)
+
+    result, model = pool.call(_generate)
+
+    assert json.loads(result["response"])["intent"] == "greet"
+    assert model == MODEL
+    assert [endpoint["errors"] for endpoint in pool.stats()["endpoints"]] == [1, 0]
+    assert stub.calls["generate"] == 1
+
+
+def test_no_backend_available():
+    pool = OllamaPool([_dead_url(), _dead_url()], MODEL)
+
+    with pytest.raises(NoBackendAvailable):
+        pool.call(_generate)
+
+
+def test_circuit_opens_after_repeated_failures(stubs):
+    stub = stubs()
+    pool = OllamaPool([_dead_url(), stub.url], MODEL, failure_threshold=2, reset_timeout=60)
+
+    for _ in range(2):
+        pool.call(_generate)
+    assert _states(pool) == ["open", "closed"]
+
+    # an open endpoint gets no traffic, even though it is first in line
+    pool.call(_generate)
+    assert pool.stats()["endpoints"][0]["calls"] == 2
+    assert stub.calls["generate"] == 3
+
+
+def test_half_open_lets_one_trial_through_and_closes_on_success(stubs):
+    stub = stubs()
+    port = stub.port
+    pool = OllamaPool([stub.url], MODEL, failure_threshold=1, reset_timeout=0.2)
+
+    stub.stop()
+    with pytest.raises(NoBackendAvailable):
+        pool.call(_generate)
+    assert _states(pool) == ["open"]
+    with pytest.raises(NoBackendAvailable):
+        pool.call(_generate)
+    assert pool.stats()["endpoints"][0]["calls"] == 1
+
+    # back up, and slow enough that a second call arrives during the trial
+    stubs(port=port, latency_ms=300)
+    time.sleep(0.25)
+    assert _states(pool) == ["half_open"]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        trial = executor.submit(pool.call, _generate)
+        time.sleep(0.1)
+        with pytest.raises(NoBackendAvailable):
+            pool.call(_generate)
+        trial.result()
+    assert _states(pool) == ["closed"]
+    assert pool.stats()["endpoints"][0]["calls"] == 2
+
+
+def test_failed_trial_reopens_the_circuit(stubs):
+    stub = stubs()
+    pool = OllamaPool([stub.url], MODEL, failure_threshold=1, reset_timeout=0.2)
+
+    stub.stop()
+    with pytest.raises(NoBackendAvailable):
+        pool.call(_generate)
+    time.sleep(0.25)
+    assert _states(pool) == ["half_open"]
+    with pytest.raises(NoBackendAvailable):
+        pool.call(_generate)
+    assert _states(pool) == ["open"]
+
+
+def test_calls_from_before_the_circuit_opened_dont_end_the_trial(stubs):
+    stub = stubs()
+    pool = OllamaPool([stub.url], MODEL, failure_threshold=1, reset_timeout=0.1)
+    release_old, release_trial = threading.Event(), threading.Event()
+
+    def old_call(url, model, cancelled):
+        release_old.wait()
+        raise CallCancelled()
+
+    def failing_call(url, model, cancelled):
+        raise requests.ConnectionError("connection refused")
+
+    def trial_call(url, model, cancelled):
+        release_trial.wait()
+        return _generate(url, model, cancelled)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        old = executor.submit(pool.call, old_call)
+        time.sleep(0.05)
+        with pytest.raises(NoBackendAvailable):
+            pool.call(failing_call)
+        time.sleep(0.15)
+        trial = executor.submit(pool.call, trial_call)
+        time.sleep(0.05)
+
+        release_old.set()
+        with pytest.raises(CallCancelled):
+            old.result()
+        # the trial is still running, so the circuit lets nothing else through
+        with pytest.raises(NoBackendAvailable):
+            pool.call(_generate)
+
+        release_trial.set()
+        trial.result()
+    assert _states(pool) == ["closed"]
+    assert stub.calls["generate"] == 1
+
+
+def test_ollama_errors_count_against_the_endpoint(stubs):
+    stub = stubs()
+    pool = OllamaPool([stub.url, stubs().url], MODEL, failure_threshold=1)
+
+    def model_crashed(url, model, cancelled):
+        if url == stub.url:
+            raise OllamaError("Ollama error: model runner has unexpectedly stopped")
+        return _generate(url, model, cancelled)
+
+    pool.call(model_crashed)
+    assert [endpoint["errors"] for endpoint in pool.stats()["endpoints"]] == [1, 0]
+    assert _states(pool) == ["open", "closed"]
+
+
+def test_bad_requests_dont_count_or_fail_over(stubs):
+    pool = OllamaPool([stubs().url, stubs().url], MODEL, failure_threshold=1)
+
+    def bad_request(url, model, cancelled):
+        # 405: the stub only answers GET on /api/tags
+        requests.post(f"{url}/api/tags", timeout=5).raise_for_status()
+
+    with pytest.raises(BadRequest):
+        pool.call(bad_request)
+    assert [endpoint["calls"] for endpoint in pool.stats()["endpoints"]] == [1, 0]
+    assert [endpoint["errors"] for endpoint in pool.stats()["endpoints"]] == [0, 0]
+    assert _states(pool) == ["closed", "closed"]
+
+
+def test_hedges_slow_calls_to_a_second_endpoint(stubs):
+    slow, fast = stubs(latency_ms=1000), stubs()
+    pool = OllamaPool([slow.url, fast.url], MODEL, hedge_after=0.05)
+
+    started = time.monotonic()
+    result, model = pool.call(_generate)
+
+    assert time.monotonic() - started < 0.5
+    assert json.loads(result["response"])["intent"] == "greet"
+    assert pool.stats()["hedges"] == 1
+    assert pool.stats()["hedge_wins"] == 1
+    assert slow.calls["generate"] == fast.calls["generate"] == 1
+    pool.close()
+
+
+def test_no_hedge_when_the_first_endpoint_is_fast(stubs):
+    first, second = stubs(), stubs()
+    pool = OllamaPool([first.url, second.url], MODEL, hedge_after=0.5)
+
+    pool.call(_generate)
+
+    assert pool.stats()["hedges"] == 0
+    assert second.calls["generate"] == 0
+    pool.close()
+
+
+def test_overloaded_endpoint_gets_the_fallback_model(stubs):
+    stub = stubs(latency_ms=300)
+    pool = OllamaPool([stub.url], MODEL, fallback_model="small", overload_threshold=1)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.call(_generate))) for _ in range(2)]
+    for thread in threads:
+        # the second call arrives while the first is still outstanding
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    # the model that answered is reported and is the one the request named
+    assert sorted(model for _, model in results) == [MODEL, "small"]
+    assert all(result["model"] == model for result, model in results)
+    assert pool.stats()["fallback_model_calls"] == 1
+
+
+def test_single_endpoint_is_not_health_checked(stubs):
+    stub = stubs()
+    pool = OllamaPool([stub.url], MODEL, health_check_interval=0.01)
+
+    time.sleep(0.1)
+    assert stub.calls["tags"] == 0
+    assert not any(thread.name == "ollama-health" for thread in threading.enumerate())
+    pool.call(_generate)
+
+
+def test_failed_health_check_only_routes_around_when_another_endpoint_is_up(stubs):
+    first, second = stubs(), stubs()
+    pool = OllamaPool([first.url, second.url], MODEL)
+
+    pool.endpoints[0].healthy = False
+    pool.call(_generate)
+    assert (first.calls["generate"], second.calls["generate"]) == (0, 1)
+
+    # nothing passed its last check: still try them rather than fail every call
+    pool.endpoints[1].healthy = False
+    pool.call(_generate)
+    assert (first.calls["generate"], second.calls["generate"]) == (1, 1)
+
+
+def test_dropped_component_stops_its_pool(stubs):
+    from components.OllamaNLU import OllamaNLU
+
+    first, second = stubs(), stubs()
+    config = {"urls": [first.url, second.url], "health_check_interval": 0.01, "hedge_after": 0.5, "cache_size": 0}
+    old = OllamaNLU(config)
+    pool = old.pool
+    # a model reload: a new component replaces the old one
+    new = OllamaNLU(config)
+    del old
+    gc.collect()
+
+    assert pool._stop.is_set()
+    assert pool._executor._shutdown
+    new.close()
+    assert new.pool._stop.is_set()
+
+
+def test_stream_is_cut_off_after_the_timeout(stubs):
+    from components.OllamaNLU import OllamaNLU
+
+    # every token arrives well within the read timeout, the whole stream doesn't
+    stub = stubs(token_ms=100)
+    nlu = OllamaNLU({"urls": [stub.url], "timeout": 0.3, "cache_size": 0})
+    body = {"model": MODEL, "prompt": 'User message: "hi"'}
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        nlu._generate_at(stub.url, body, json.loads, threading.Event())
+    assert time.monotonic() - started < 1
+
+    deadline = time.monotonic() + 2
+    while not stub.calls["stopped_early"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stub.calls["stopped_early"] == 1
+    nlu.close()
@@ -0,0 +1,49 @@
+# ParseCache keys and its SQLite persistence.
+
+import sqlite3
+import time
+
+from components.parse_cache import ParseCache
+
+PARSE = {"intent": "greet", "entities": []}
+
+
+def _key(text: str) -> str:
+    return ParseCache.key(text, "llama3", "prompt")
+
+
+def _rows(path) -> int:
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+
+
+def test_keys_ignore_case_and_outer_whitespace_only():
+    assert _key("  Hi There ") == _key("hi there")
+    # entity offsets depend on the spacing inside the message
+    assert _key("hi  there") != _key("hi there")
+
+
+def test_file_keeps_the_newest_max_size_entries(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = ParseCache(max_size=10, ttl=None, path=str(path))
+    for i in range(50):
+        cache.put(_key(f"message {i}"), PARSE, 0.5)
+
+    assert _rows(path) == 10
+
+    # a restarted process still finds the recent entries
+    restarted = ParseCache(max_size=10, ttl=None, path=str(path))
+    assert restarted.get(_key("message 49")) == PARSE
+    assert restarted.get(_key("message 39")) is None
+
+
+def test_expired_entries_are_dropped_from_the_file(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = ParseCache(max_size=10, ttl=0.05, path=str(path))
+    cache.put(_key("old"), PARSE, 0.5)
+    time.sleep(0.1)
+
+    assert ParseCache(max_size=10, ttl=0.05, path=str(path)).get(_key("old")) is None
+    assert _rows(path) == 0
+    cache.put(_key("new"), PARSE, 0.5)
+    assert _rows(path) == 1
@@ -0,0 +1,102 @@
+# SearchIndex.filter must return exactly what the original per-post loop in
+# ActionFindItem returned, in catalog order, also after incremental updates.
+
+import random
+
+import pytest
+from stub_backend import ADJECTIVES, BRANDS, ITEM_TYPES, make_catalog
+
+from actions.records import PostRecord
+from actions.search import COLOR_CATEGORY_IDS, ITEM_TYPE_SYNONYMS, SearchIndex, search_terms_for
+
+COLOR_IDS = list(COLOR_CATEGORY_IDS.values())
+QUERY_TYPES = [None, "x", "hat", "button up", "t-shirt"] + list(ITEM_TYPE_SYNONYMS) + ITEM_TYPES
+
+
+def _reference_filter(posts, search_terms, color_ids):
+    # the loop ActionFindItem ran over /api/posts-all before the index
+    matches = []
+    for post in posts:
+        title = (post.get("title") or "").lower()
+        categories = post.get("categories") or []
+        type_match = not search_terms or any(term in title for term in search_terms)
+        color_match = not color_ids or any(color_id in categories for color_id in color_ids)
+        if type_match and color_match:
+            matches.append(post["post_id"])
+    return matches
+
+
+def _queries(n, seed):
+    rng = random.Random(seed)
+    queries = [(search_terms_for(item_type), None) for item_type in QUERY_TYPES]
+    queries += [([], [color_id]) for color_id in COLOR_IDS] + [([], None)]
+    for _ in range(n):
+        colors = rng.sample(COLOR_IDS, rng.randint(1, 3)) if rng.random() < 0.7 else None
+        queries.append((search_terms_for(rng.choice(QUERY_TYPES)), colors))
+    return queries
+
+
+def _as_stored(post, compact):
+    return PostRecord.from_post(post) if compact else post
+
+
+def _assert_same_matches(index, posts, queries):
+    for search_terms, color_ids in queries:
+        assert index.filter(search_terms, color_ids) == _reference_filter(posts, search_terms, color_ids), (
+            search_terms, color_ids
+        )
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_filter_matches_reference_loop(compact):
+    posts = [_as_stored(post, compact) for post in make_catalog(2000, seed=5)]
+    index = SearchIndex()
+    index.apply([post["post_id"] for post in posts], posts, [])
+
+    _assert_same_matches(index, posts, _queries(100, seed=11))
+
+
+def _edited(post, rng):
+    post = dict(post)
+    if rng.random() < 0.6:
+        post["title"] = f"{rng.choice(ADJECTIVES)} {rng.choice(BRANDS)} {rng.choice(ITEM_TYPES)}"
+    if rng.random() < 0.6:
+        post["categories"] = rng.sample(range(1, 16), rng.randint(0, 4))
+    return post
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_incremental_updates_match_reference_and_rebuild(compact):
+    rng = random.Random(13)
+    posts = make_catalog(1000, seed=9)
+    next_post_id = max(post["post_id"] for post in posts) + 1
+    index = SearchIndex()
+    index.apply([post["post_id"] for post in posts], [_as_stored(post, compact) for post in posts], [])
+    queries = _queries(30, seed=17)
+    # fills the memoized synonym postings, which updates must keep current
+    _assert_same_matches(index, posts, queries)
+
+    for _ in range(30):
+        upserted, removed = [], []
+        for _ in range(rng.randint(1, 20)):
+            action = rng.random()
+            if action < 0.5:
+                i = rng.randrange(len(posts))
+                posts[i] = _edited(posts[i], rng)
+                upserted.append(posts[i])
+            elif action < 0.8:
+                post = _edited(make_catalog(1, seed=rng.randrange(10 ** 6))[0], rng)
+                post["post_id"] = next_post_id
+                next_post_id += 1
+                posts.append(post)
+                upserted.append(post)
+            else:
+                removed.append(posts.pop(rng.randrange(len(posts)))["post_id"])
+        upserted = [post for post in upserted if post["post_id"] not in removed]
+        index.apply(None, [_as_stored(post, compact) for post in upserted], removed)
+
+        _assert_same_matches(index, posts, queries)
+        rebuilt = SearchIndex()
+        rebuilt.apply([post["post_id"] for post in posts], [_as_stored(post, compact) for post in posts], [])
+        for search_terms, color_ids in queries:
+            assert index.filter(search_terms, color_ids) == rebuilt.filter(search_terms, color_ids)
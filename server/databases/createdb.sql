@@ -144,6 +144,22 @@ CREATE TABLE Post_Category (
 	FOREIGN KEY (category_id) REFERENCES Category(category_id) ON DELETE CASCADE
 );
 
+-- every change to a post, its images or its categories, so the chatbot can
+-- sync its copy of the catalog by change_id instead of re-reading every post.
+-- The server prunes rows older than POST_CHANGE_RETENTION_SECONDS; a client
+-- that is further behind gets a 410 and downloads the whole catalog instead
+CREATE TABLE Post_Change (
+	change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+	post_id INTEGER NOT NULL,
+	changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- CREATE INDEX Statements
+
+-- the chatbot's catalog queries filter posts by category and load their images
+CREATE INDEX Post_Category_By_Category ON Post_Category(category_id, post_id);
+CREATE INDEX Post_Image_By_Post ON Post_Image(post_id);
+
 -- CREATE TRIGGER Statements
 
 CREATE TRIGGER Empty_Cart_New_User
@@ -166,6 +182,63 @@ BEGIN
 	VALUES (NEW.email, 'pending');
 END;
 
+CREATE TRIGGER Post_Change_Insert_Post
+AFTER INSERT ON Post
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (NEW.post_id);
+END;
+
+CREATE TRIGGER Post_Change_Update_Post
+AFTER UPDATE ON Post
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (NEW.post_id);
+END;
+
+CREATE TRIGGER Post_Change_Delete_Post
+AFTER DELETE ON Post
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (OLD.post_id);
+END;
+
+CREATE TRIGGER Post_Change_Insert_Image
+AFTER INSERT ON Post_Image
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (NEW.post_id);
+END;
+
+CREATE TRIGGER Post_Change_Delete_Image
+AFTER DELETE ON Post_Image
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (OLD.post_id);
+END;
+
+-- an image may also be moved to another post, so both posts are logged
+CREATE TRIGGER Post_Change_Update_Image
+AFTER UPDATE ON Post_Image
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (OLD.post_id);
+	INSERT INTO Post_Change (post_id) SELECT NEW.post_id WHERE NEW.post_id IS NOT OLD.post_id;
+END;
+
+CREATE TRIGGER Post_Change_Insert_Category
+AFTER INSERT ON Post_Category
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (NEW.post_id);
+END;
+
+CREATE TRIGGER Post_Change_Delete_Category
+AFTER DELETE ON Post_Category
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (OLD.post_id);
+END;
+
+CREATE TRIGGER Post_Change_Update_Category
+AFTER UPDATE ON Post_Category
+BEGIN
+	INSERT INTO Post_Change (post_id) VALUES (OLD.post_id);
+	INSERT INTO Post_Change (post_id) SELECT NEW.post_id WHERE NEW.post_id IS NOT OLD.post_id;
+END;
+
 -- INSERT Statements
 
 INSERT INTO User(email, first_name, last_name, join_date, bio) VALUES
@@ -191,6 +191,103 @@ app.get('/api/posts-all', (req, res) => {
         });
 });
 
+// Post_Change rows older than this are pruned. It only needs to cover the
+// chatbot's reconcile interval (CATALOG_RECONCILE_SECONDS, 600 by default):
+// a client that fell further behind gets a 410 and downloads every post.
+const postChangeRetentionSeconds = Number(process.env.POST_CHANGE_RETENTION_SECONDS) || 3600;
+
+const prunePostChanges = () => {
+    db.run(`DELETE FROM Post_Change WHERE changed_at < datetime('now', ?)`,
+        [`-${postChangeRetentionSeconds} seconds`], (err) => {
+            if (err) console.error(err.message);
+        });
+};
+prunePostChanges();
+setInterval(prunePostChanges, 60 * 1000).unref();
+
+// Route to get the posts changed since a Post_Change id, so the chatbot can
+// keep its copy of the catalog in sync without downloading every post.
+// Without ?since it only returns the latest change id. If changes after
+// `since` were already pruned (or `since` is from a database that was
+// reset), it answers 410 and the client has to download the whole catalog.
+app.get('/api/posts-changes', (req, res) => {
+    // sqlite_sequence keeps the latest change id even when every row has
+    // been pruned
+    const queryLatest = `SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'Post_Change'), 0) AS latest,
+                                (SELECT MIN(change_id) FROM Post_Change) AS oldest`;
+    const queryChanged = `SELECT DISTINCT post_id FROM Post_Change WHERE change_id > ? AND change_id <= ?`;
+
+    const all = (sql, params) => new Promise((resolve, reject) => {
+        db.all(sql, params, (err, rows) => (err ? reject(err) : resolve(rows)));
+    });
+
+    db.get(queryLatest, [], (err, row) => {
+        if (err) {
+            console.error(err.message);
+            res.status(500).json({ error: err.message });
+            return;
+        }
+
+        const latest = row.latest;
+        const since = Number(req.query.since);
+        if (req.query.since === undefined || Number.isNaN(since)) {
+            res.json({ latest: latest, posts: [], removed: [] });
+            return;
+        }
+
+        const oldest = row.oldest !== null ? row.oldest : latest + 1;
+        if (since < oldest - 1 || since > latest) {
+            res.status(410).json({ error: 'changes since this change id are no longer available', latest: latest });
+            return;
+        }
+
+        all(queryChanged, [since, latest]).then((changed) => {
+            const ids = changed.map((change) => change.post_id);
+            // the ids go in as one JSON array, so there is no limit on how
+            // many posts changed
+            const changedIds = `(SELECT value FROM json_each(?))`;
+            const params = [JSON.stringify(ids)];
+
+            // one query per table for all changed posts, not one per post
+            return Promise.all([
+                all(`SELECT Post.*, User.first_name, User.last_name FROM Post
+                     LEFT JOIN User ON User.email = Post.owner_id
+                     WHERE Post.post_id IN ${changedIds} ORDER BY Post.post_id`, params),
+                all(`SELECT post_id, image_url FROM Post_Image WHERE post_id IN ${changedIds} ORDER BY image_id`, params),
+                all(`SELECT post_id, category_id FROM Post_Category WHERE post_id IN ${changedIds} ORDER BY category_id`, params),
+            ]).then(([posts, images, categories]) => {
+                const byId = new Map();
+                posts.forEach((post) => {
+                    const { first_name, last_name, ...fields } = post;
+                    fields.images = [];
+                    fields.categories = [];
+                    fields.lister = first_name !== null ? {
+                        display: `${first_name} ${last_name.charAt(0)}.`,
+                        username: post.owner_id,
+                        avatarUrl: null,
+                    } : {
+                        display: 'Unknown',
+                        username: 'unknown-user',
+                        avatarUrl: null,
+                    };
+                    byId.set(post.post_id, fields);
+                });
+                images.forEach((img) => byId.get(img.post_id).images.push(img.image_url));
+                categories.forEach((cat) => byId.get(cat.post_id).categories.push(cat.category_id));
+
+                res.json({
+                    latest: latest,
+                    posts: Array.from(byId.values()),
+                    removed: ids.filter((id) => !byId.has(id)),
+                });
+            });
+        }).catch((error) => {
+            console.error(error.message);
+            res.status(500).json({ error: error.message });
+        });
+    });
+});
+
 // get seller transaction history
     app.get("/api/all-unavailable", (req, res) => {
         const queryTransaction = `SELECT transaction_id, purchased_date FROM Transactions WHERE status = 'purchased'`;
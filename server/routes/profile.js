@@ -265,15 +265,26 @@ module.exports = (db) => {
 
     router.put("/cart/addItem", (req, res) => {
         const { transactionId, postId } = req.body;
-        const addItemQuery = `INSERT INTO Transaction_Listing (transaction_id, post_id) VALUES (?, ?)`;
-
-        db.run(addItemQuery, [transactionId, postId], function (err) {
+        // only into a pending cart: a transaction id read before a checkout
+        // (e.g. one the chatbot prefetched) must not add to a purchased order
+        const addItemQuery = `
+            INSERT INTO Transaction_Listing (transaction_id, post_id)
+            SELECT ?, ? WHERE EXISTS (
+                SELECT 1 FROM Transactions WHERE transaction_id = ? AND status = 'pending'
+            )`;
+
+        db.run(addItemQuery, [transactionId, postId, transactionId], function (err) {
             if (err) {
                 console.error(err.message);
                 res.status(500).json({ error: "Failed to add item to cart" });
                 return;
             }
 
+            if (this.changes === 0) {
+                res.status(409).json({ error: "Transaction is not a pending cart" });
+                return;
+            }
+
             res.json({ success: true, message: "Item added to cart" });
         })
     })